@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import io
+import random
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+
+@dataclass
+class OpenAIProfile:
+    """Latency and failure distribution of the fake /images/edits endpoint."""
+
+    median_latency_s: float = 20.0
+    latency_sigma: float = 0.35
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_s: float = 1.0
+    moderation_rate: float = 0.0
+    time_scale: float = 1.0
+
+    def latency(self) -> float:
+        # Log-normal around the median: long right tail like real image generation
+        return random.lognormvariate(0.0, self.latency_sigma) * self.median_latency_s * self.time_scale
+
+
+def _result_image_b64() -> str:
+    img = Image.effect_noise((1024, 1536), 64).convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=85)
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+_USAGE = {
+    'total_tokens': 6400,
+    'input_tokens': 1200,
+    'output_tokens': 5200,
+    'input_tokens_details': {'text_tokens': 100, 'image_tokens': 1100},
+    'output_tokens_details': {'image_tokens': 5200},
+}
+
+
+def create_app(profile: OpenAIProfile) -> FastAPI:
+    app = FastAPI(title='Fake OpenAI')
+    image_b64 = _result_image_b64()
+    app.state.requests = 0
+
+    @app.head('/v1/models')
+    async def models() -> Response:
+        return Response(status_code=200)
+
+    @app.post('/v1/images/edits')
+    async def images_edits(request: Request) -> Response:
+        await request.body()
+        app.state.requests += 1
+
+        roll = random.random()
+        if roll < profile.rate_limit_rate:
+            return JSONResponse(
+                {'error': {'message': 'Rate limit reached', 'code': 'rate_limit_exceeded'}},
+                status_code=429,
+                headers={'retry-after': str(profile.retry_after_s), 'x-ratelimit-remaining-requests': '0'},
+            )
+        roll -= profile.rate_limit_rate
+
+        await asyncio.sleep(profile.latency())
+
+        if roll < profile.error_rate:
+            return JSONResponse({'error': {'message': 'Internal error', 'code': 'server_error'}}, status_code=500)
+        roll -= profile.error_rate
+        if roll < profile.moderation_rate:
+            return JSONResponse(
+                {'error': {'message': 'Blocked', 'code': 'moderation_blocked'}},
+                status_code=400,
+            )
+
+        return JSONResponse({'data': [{'b64_json': image_b64}], 'usage': _USAGE})
+
+    return app
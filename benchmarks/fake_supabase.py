@@ -0,0 +1,140 @@
+import asyncio
+import io
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+TERMINAL_STATUSES = ('completed', 'failed')
+INPUT_BUCKET = 'bench-inputs'
+
+
+@dataclass
+class SessionRecord:
+    row: dict[str, Any]
+    enqueued_at: float
+    finished_at: float | None = None
+
+
+@dataclass
+class SupabaseState:
+    """In-memory session tables and object store behind the fake PostgREST/storage API."""
+
+    latency_s: float = 0.0
+    sessions: dict[str, dict[str, SessionRecord]] = field(default_factory=dict)
+    objects: dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.sessions.clear()
+            self.objects.clear()
+
+    def seed(self, table: str, row: dict[str, Any]) -> None:
+        with self.lock:
+            self.sessions.setdefault(table, {})[row['id']] = SessionRecord(dict(row), time.time())
+
+    def records(self) -> list[SessionRecord]:
+        with self.lock:
+            return [record for table in self.sessions.values() for record in table.values()]
+
+    def finished(self) -> int:
+        return sum(1 for record in self.records() if record.finished_at is not None)
+
+    def update(self, table: str, filters: dict[str, str], values: dict[str, Any]) -> list[dict[str, Any]]:
+        with self.lock:
+            updated = []
+            for record in self.sessions.get(table, {}).values():
+                if _matches(record.row, filters):
+                    record.row.update(values)
+                    if record.row.get('status') in TERMINAL_STATUSES and record.finished_at is None:
+                        record.finished_at = time.time()
+                    updated.append(dict(record.row))
+            return updated
+
+
+def _matches(row: dict[str, Any], filters: dict[str, str]) -> bool:
+    """Evaluate the PostgREST operators the worker uses (eq, in, lt, gt)."""
+    for column, expr in filters.items():
+        op, _, value = expr.partition('.')
+        current = row.get(column)
+        if op == 'eq' and str(current) != value:
+            return False
+        if op == 'in' and str(current) not in value.strip('()').split(','):
+            return False
+        if op == 'lt' and not (current is not None and str(current) < value):
+            return False
+        if op == 'gt' and not (current is not None and str(current) > value):
+            return False
+    return True
+
+
+def input_image(size: tuple[int, int]) -> bytes:
+    buf = io.BytesIO()
+    Image.effect_noise(size, 48).convert('RGB').save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def create_app(state: SupabaseState) -> FastAPI:
+    app = FastAPI(title='Fake Supabase')
+    inputs = {
+        'model': input_image((1536, 2048)),
+        'garment': input_image((1024, 1024)),
+    }
+    reserved = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns'}
+
+    async def simulate_latency() -> None:
+        if state.latency_s:
+            await asyncio.sleep(state.latency_s)
+
+    @app.patch('/rest/v1/{table}')
+    async def update_rows(table: str, request: Request) -> Response:
+        await simulate_latency()
+        filters = {k: v for k, v in request.query_params.items() if k not in reserved}
+        values = await request.json()
+        return JSONResponse(state.update(table, filters, values))
+
+    @app.post('/rest/v1/rpc/{fn}')
+    async def rpc(fn: str, request: Request) -> Response:
+        await simulate_latency()
+        params = await request.json()
+        if fn == 'finalize_generation_session':
+            table = 'store_generation_sessions' if params['p_channel'] == 'b2b' else 'generation_sessions'
+            filters = {'id': f"eq.{params['p_session_id']}", 'status': 'eq.processing'}
+            updated = state.update(table, filters, {'status': params['p_status'], **params['p_fields']})
+            return JSONResponse(bool(updated))
+        return Response(status_code=204)
+
+    @app.post('/storage/v1/object/copy')
+    async def copy_object(request: Request) -> Response:
+        await simulate_latency()
+        body = await request.json()
+        source = f"{body['bucketId']}/{body['sourceKey']}"
+        if source not in state.objects:
+            return JSONResponse({'statusCode': '404', 'error': 'not_found', 'message': 'Object not found'}, 404)
+        state.objects[f"{body['bucketId']}/{body['destinationKey']}"] = state.objects[source]
+        return JSONResponse({'Key': f"{body['bucketId']}/{body['destinationKey']}"})
+
+    @app.post('/storage/v1/object/sign/{bucket}/{path:path}')
+    async def sign_object(bucket: str, path: str) -> Response:
+        await simulate_latency()
+        return JSONResponse({'signedURL': f'/object/sign/{bucket}/{path}?token=bench'})
+
+    @app.get('/storage/v1/object/sign/{bucket}/{path:path}')
+    async def download_object(bucket: str, path: str) -> Response:
+        await simulate_latency()
+        kind = 'model' if path.startswith('model') else 'garment'
+        # Bytes after EOI are ignored by decoders but give every URL a distinct content hash
+        return Response(inputs[kind] + path.encode(), media_type='image/jpeg')
+
+    @app.post('/storage/v1/object/{bucket}/{path:path}')
+    async def upload_object(bucket: str, path: str, request: Request) -> Response:
+        await simulate_latency()
+        state.objects[f'{bucket}/{path}'] = len(await request.body())
+        return JSONResponse({'Key': f'{bucket}/{path}', 'Id': path})
+
+    return app
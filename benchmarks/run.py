@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+
+import uvicorn
+
+from benchmarks import fake_openai, fake_supabase
+
+DESCRIPTION = """End-to-end generation pipeline benchmark.
+
+Runs the real run_consumer -> Celery -> process_generation path against a fake
+OpenAI server, a fake Supabase REST/storage server and a local Redis, and
+reports throughput, end-to-end latency percentiles and per-stage timings for
+each worker pool / concurrency setting. The consumer's global in-flight cap
+follows each scenario's concurrency, as an unset SCHEDULER_MAX_INFLIGHT does
+in production.
+
+    python -m benchmarks.run --tasks 100 --concurrency 5,20 --pools prefork,asyncio
+"""
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STAGES = ('queue_wait', 'download', 'resize', 'openai', 'upload', 'renditions', 'signed_url', 'finalize')
+
+
+@dataclass
+class ScenarioResult:
+    pool: str
+    concurrency: int
+    tasks: int
+    finished: int
+    completed: int
+    wall_s: float
+    tasks_per_s: float
+    latency_s: dict[str, float]
+    stages_s: dict[str, dict[str, float]] = field(default_factory=dict)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _start_redis() -> tuple[str, subprocess.Popen | None]:  # type: ignore[type-arg]
+    if shutil.which('redis-server') is None:
+        sys.exit('No --redis-url given and redis-server is not on PATH')
+    port = _free_port()
+    proc = subprocess.Popen(
+        ['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    return f'redis://127.0.0.1:{port}/0', proc
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _histogram_quantile(buckets: list[tuple[float, float]], count: float, q: float) -> float:
+    """Linear interpolation inside cumulative Prometheus buckets, like histogram_quantile()."""
+    rank = q * count
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, cumulative in buckets:
+        if cumulative >= rank:
+            if upper_bound == float('inf'):
+                return lower_bound
+            span = cumulative - lower_count
+            fraction = (rank - lower_count) / span if span else 0.0
+            return lower_bound + (upper_bound - lower_bound) * fraction
+        lower_bound, lower_count = upper_bound, cumulative
+    return lower_bound
+
+
+def _stage_breakdown(metrics_dir: str) -> dict[str, dict[str, float]]:
+    from prometheus_client import CollectorRegistry, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=metrics_dir)
+    buckets: dict[str, list[tuple[float, float]]] = {}
+    totals: dict[str, dict[str, float]] = {}
+    for metric in registry.collect():
+        if metric.name != 'wearon_generation_stage_seconds':
+            continue
+        for sample in metric.samples:
+            stage = sample.labels['stage']
+            if sample.name.endswith('_bucket'):
+                buckets.setdefault(stage, []).append((float(sample.labels['le']), sample.value))
+            elif sample.name.endswith('_count'):
+                totals.setdefault(stage, {})['count'] = sample.value
+            elif sample.name.endswith('_sum'):
+                totals.setdefault(stage, {})['sum'] = sample.value
+
+    breakdown = {}
+    for stage in STAGES:
+        count = totals.get(stage, {}).get('count', 0.0)
+        if not count:
+            continue
+        stage_buckets = sorted(buckets[stage])
+        breakdown[stage] = {
+            'count': count,
+            'mean': totals[stage]['sum'] / count,
+            'p50': _histogram_quantile(stage_buckets, count, 0.50),
+            'p95': _histogram_quantile(stage_buckets, count, 0.95),
+        }
+    return breakdown
+
+
+def _worker_env(pool: str, concurrency: int, metrics_dir: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'WORKER_POOL': pool,
+        'WORKER_CONCURRENCY': str(concurrency),
+        'WORKER_MAX_INFLIGHT': str(concurrency),
+        'PROMETHEUS_MULTIPROC_DIR': metrics_dir,
+    })
+    return env
+
+
+def _enqueue(redis_client, state: fake_supabase.SupabaseState, run_id: str, count: int) -> None:
+    from worker.consumer import QUEUE_KEY
+
+    base_url = os.environ['SUPABASE_URL']
+    payloads = []
+    for i in range(count):
+        session_id = f'{run_id}-{i}'
+        created_at = datetime.now(UTC).isoformat()
+        state.seed('generation_sessions', {
+            'id': session_id, 'user_id': f'user-{i}', 'status': 'queued', 'created_at': created_at,
+        })
+        sign = f'{base_url}/storage/v1/object/sign/{fake_supabase.INPUT_BUCKET}'
+        payloads.append(json.dumps({
+            'task_id': session_id,
+            'channel': 'b2c',
+            'user_id': f'user-{i}',
+            'session_id': session_id,
+            'image_urls': [f'{sign}/model-{session_id}.jpg?token=t', f'{sign}/garment-{session_id}.jpg?token=t'],
+            'prompt': '',
+            'request_id': f'req_{session_id}',
+            'version': 1,
+            'created_at': created_at,
+        }))
+    redis_client.lpush(QUEUE_KEY, *payloads)
+
+
+def _wait_for_workers(celery_proc: subprocess.Popen, timeout: float) -> None:  # type: ignore[type-arg]
+    from worker.celery_app import celery_app
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if celery_proc.poll() is not None:
+            sys.exit('Celery worker exited during startup')
+        if celery_app.control.ping(timeout=1.0):
+            return
+    sys.exit('Celery worker did not become ready')
+
+
+def run_scenario(
+    args: argparse.Namespace,
+    state: fake_supabase.SupabaseState,
+    redis_client,
+    pool: str,
+    concurrency: int,
+) -> ScenarioResult:
+    state.reset()
+    redis_client.flushdb()
+    metrics_dir = tempfile.mkdtemp(prefix='wearon-bench-metrics-')
+    cmd = [sys.executable, '-m', 'celery', '-A', 'worker.celery_app', 'worker', '--loglevel=warning']
+    cmd += ['--pool=threads' if pool == 'asyncio' else '--pool=prefork', f'--concurrency={concurrency}']
+    celery_proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=_worker_env(pool, concurrency, metrics_dir))
+    try:
+        _wait_for_workers(celery_proc, timeout=60)
+        run_id = f'{pool}-{concurrency}-{int(time.time())}'
+        start = time.time()
+        _enqueue(redis_client, state, run_id, args.tasks)
+
+        deadline = time.monotonic() + args.timeout
+        while state.finished() < args.tasks and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+        records = state.records()
+        done = [r for r in records if r.finished_at is not None]
+        latencies = [r.finished_at - r.enqueued_at for r in done]
+        wall = (max(r.finished_at for r in done) - start) if done else 0.0
+        return ScenarioResult(
+            pool=pool,
+            concurrency=concurrency,
+            tasks=args.tasks,
+            finished=len(done),
+            completed=sum(1 for r in done if r.row.get('status') == 'completed'),
+            wall_s=wall,
+            tasks_per_s=len(done) / wall if wall else 0.0,
+            latency_s={q: _percentile(latencies, p) for q, p in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+            stages_s=_stage_breakdown(metrics_dir),
+        )
+    finally:
+        celery_proc.terminate()
+        try:
+            celery_proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            celery_proc.kill()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def _print_result(result: ScenarioResult, baseline: ScenarioResult | None) -> None:
+    def delta(current: float, previous: float | None) -> str:
+        if not previous:
+            return ''
+        return f' ({(current - previous) / previous:+.0%})'
+
+    print(f'\n== pool={result.pool} concurrency={result.concurrency} ==')
+    print(f'finished {result.finished}/{result.tasks} (completed {result.completed}) in {result.wall_s:.1f}s')
+    print(f'throughput  {result.tasks_per_s:.2f} tasks/s{delta(result.tasks_per_s, baseline and baseline.tasks_per_s)}')
+    for q, value in result.latency_s.items():
+        previous = baseline.latency_s.get(q) if baseline else None
+        print(f'e2e {q:<7} {value:.2f}s{delta(value, previous)}')
+    print(f'{"stage":<12}{"count":>7}{"mean":>9}{"p50":>9}{"p95":>9}')
+    for stage, stats in result.stages_s.items():
+        print(f'{stage:<12}{stats["count"]:>7.0f}{stats["mean"]:>8.3f}s{stats["p50"]:>8.3f}s{stats["p95"]:>8.3f}s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=50, help='tasks per scenario')
+    parser.add_argument('--concurrency', default='5', help='comma-separated worker concurrency values')
+    parser.add_argument('--pools', default='prefork', help='comma-separated pools: prefork, asyncio')
+    parser.add_argument('--redis-url', help='Redis to use (flushed per scenario); default starts a redis-server')
+    parser.add_argument('--openai-latency', type=float, default=2.0, help='median fake OpenAI latency (s)')
+    parser.add_argument('--openai-latency-sigma', type=float, default=0.35)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0)
+    parser.add_argument('--openai-429-rate', type=float, default=0.0)
+    parser.add_argument('--openai-moderation-rate', type=float, default=0.0)
+    parser.add_argument('--supabase-latency-ms', type=float, default=20.0)
+    parser.add_argument('--timeout', type=float, default=600.0, help='max seconds to wait per scenario')
+    parser.add_argument('--output', help='write results as JSON (use as a later --baseline)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    redis_proc = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        redis_url, redis_proc = _start_redis()
+
+    openai_port, supabase_port = _free_port(), _free_port()
+    concurrencies = [int(c) for c in args.concurrency.split(',')]
+    # Environment for the in-process consumer and the Celery subprocesses; set before importing worker code
+    os.environ.update({
+        'REDIS_URL': redis_url,
+        'SUPABASE_URL': f'http://127.0.0.1:{supabase_port}',
+        'SUPABASE_SERVICE_ROLE_KEY': 'bench-service-role-key',
+        'OPENAI_API_KEY': 'sk-bench',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{openai_port}/v1',
+        'OPENAI_RATE_LIMIT_RPM': '1000000',
+        'OPENAI_RATE_LIMIT_BURST': '1000000',
+        'RESULT_DEDUP_ENABLED': 'false',
+        'IMAGE_CACHE_ENABLED': 'false',
+        'PROMETHEUS_MULTIPROC_DIR': tempfile.mkdtemp(prefix='wearon-bench-consumer-'),
+    })
+
+    import redis
+
+    from worker import consumer
+    from worker.scheduler import create_scheduler
+
+    # The consumer's environment never sees a scenario's concurrency (only the Celery
+    # child does), so its global cap is set per scenario to what production derives
+    scheduler = create_scheduler()
+    consumer.create_scheduler = lambda: scheduler
+
+    profile = fake_openai.OpenAIProfile(
+        median_latency_s=args.openai_latency,
+        latency_sigma=args.openai_latency_sigma,
+        error_rate=args.openai_error_rate,
+        rate_limit_rate=args.openai_429_rate,
+        moderation_rate=args.openai_moderation_rate,
+    )
+    state = fake_supabase.SupabaseState(latency_s=args.supabase_latency_ms / 1000)
+    _serve(fake_openai.create_app(profile), openai_port)
+    _serve(fake_supabase.create_app(state), supabase_port)
+    threading.Thread(target=consumer.run_consumer, daemon=True).start()
+
+    baseline: dict[tuple[str, int], ScenarioResult] = {}
+    if args.baseline:
+        for item in json.loads(Path(args.baseline).read_text()):
+            result = ScenarioResult(**item)
+            baseline[(result.pool, result.concurrency)] = result
+
+    redis_client = redis.from_url(redis_url)
+    results = []
+    try:
+        for pool in args.pools.split(','):
+            for concurrency in concurrencies:
+                scheduler.max_inflight = concurrency
+                result = run_scenario(args, state, redis_client, pool, concurrency)
+                _print_result(result, baseline.get((pool, concurrency)))
+                results.append(result)
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps([asdict(r) for r in results], indent=2))
+
+
+if __name__ == '__main__':
+    main()
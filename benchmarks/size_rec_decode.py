@@ -0,0 +1,119 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from size_rec.image_processing import DEFAULT_MAX_DIMENSION_PX, prepare_image
+
+DESCRIPTION = """Size-rec image preparation benchmark.
+
+Compares the previous prepare path (full decode, RGB convert, LANCZOS thumbnail)
+with the current one (draft-mode reduced decode, bilinear thumbnail) on latency,
+pixel drift and, when MediaPipe and its model are available, landmark drift.
+
+    python -m benchmarks.size_rec_decode --runs 20
+    python -m benchmarks.size_rec_decode --images photos/*.jpg --output decode.json
+"""
+
+
+def legacy_prepare_image(content: bytes, max_dimension_px: int = DEFAULT_MAX_DIMENSION_PX) -> np.ndarray:
+    image = Image.open(BytesIO(content)).convert('RGB')
+    image.thumbnail((max_dimension_px, max_dimension_px), Image.Resampling.LANCZOS)
+    return np.asarray(image)
+
+
+def synthetic_photo(size: tuple[int, int] = (3024, 4032)) -> bytes:
+    """A 12MP portrait JPEG with smooth gradients and sensor-like noise."""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 6)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)))
+    buf = BytesIO()
+    image.save(buf, format='JPEG', quality=92)
+    return buf.getvalue()
+
+
+def time_path(fn, content: bytes, runs: int) -> dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(content)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+    }
+
+
+def landmark_extractor():
+    try:
+        from size_rec.mediapipe_service import MediaPipeService
+
+        service = MediaPipeService()
+    except Exception:
+        return None
+    return service if service.is_loaded else None
+
+
+def compare(name: str, content: bytes, runs: int, extractor) -> dict:
+    legacy = legacy_prepare_image(content)
+    current = prepare_image(content)
+    report: dict = {
+        'image': name,
+        'source_bytes': len(content),
+        'legacy': time_path(legacy_prepare_image, content, runs),
+        'current': time_path(prepare_image, content, runs),
+        'shape': {'legacy': list(legacy.shape), 'current': list(current.shape)},
+    }
+    report['speedup'] = round(report['legacy']['p50_ms'] / max(report['current']['p50_ms'], 1e-6), 2)
+    if legacy.shape == current.shape:
+        diff = np.abs(legacy.astype(np.int16) - current.astype(np.int16))
+        report['pixel_drift'] = {'mean': round(float(diff.mean()), 3), 'max': int(diff.max())}
+
+    if extractor is None:
+        report['landmark_drift'] = 'skipped (MediaPipe or its model is not available)'
+    else:
+        try:
+            a = extractor.extract_landmarks(np.ascontiguousarray(legacy))
+            b = extractor.extract_landmarks(np.ascontiguousarray(current))
+        except Exception as exc:
+            report['landmark_drift'] = f'skipped ({exc})'
+        else:
+            distance = np.linalg.norm(a[:, :3].astype(np.float64) - b[:, :3], axis=1)
+            report['landmark_drift'] = {
+                'mean': round(float(distance.mean()), 5),
+                'max': round(float(distance.max()), 5),
+            }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', nargs='*', type=Path, default=[], help='Photos to use (default: a synthetic 12MP JPEG)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', type=Path, help='Write the report as JSON')
+    args = parser.parse_args()
+
+    inputs = [(path.name, path.read_bytes()) for path in args.images] or [('synthetic-12mp.jpg', synthetic_photo())]
+    extractor = landmark_extractor()
+    reports = [compare(name, content, args.runs, extractor) for name, content in inputs]
+
+    for report in reports:
+        print(
+            f"{report['image']}: legacy p50 {report['legacy']['p50_ms']}ms, "
+            f"current p50 {report['current']['p50_ms']}ms ({report['speedup']}x), "
+            f"pixel drift {report.get('pixel_drift')}, landmark drift {report['landmark_drift']}",
+            file=sys.stderr,
+        )
+    if args.output:
+        args.output.write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
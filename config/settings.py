@@ -17,6 +17,11 @@ _REQUIRED_VARS = {
 class Settings(BaseSettings):
     # Redis
     redis_url: str = 'redis://localhost:6379/0'
+    # Shared pools (services/redis_client.py): connections per pool per process,
+    # seconds to wait for a free one, and idle-connection PING interval
+    redis_max_connections: int = 20
+    redis_pool_timeout_seconds: float = 5.0
+    redis_health_check_interval_seconds: int = 30
 
     # Supabase
     supabase_url: str
@@ -24,10 +29,94 @@ class Settings(BaseSettings):
 
     # OpenAI
     openai_api_key: str
+    openai_base_url: str = 'https://api.openai.com/v1'
     openai_max_retries: int = 3
+    openai_http2: bool = False
+    openai_pool_max_connections: int = 20
+    openai_pool_max_keepalive: int = 10
+    openai_pool_keepalive_expiry: float = 60.0
+    openai_pool_timeout: float = 30.0
+    # Cluster-wide adaptive rate limit shared through Redis
+    openai_rate_limit_rpm: int = 300
+    openai_rate_limit_min_rpm: int = 30
+    openai_rate_limit_burst: int = 10
+    openai_rate_limit_decrease_factor: float = 0.5
+    openai_rate_limit_recovery_step: float = 1.0
+    openai_rate_limit_max_wait: float = 60.0
+    # Cluster-wide circuit breaker: opens when too many recent calls failed or ran slow
+    openai_breaker_enabled: bool = True
+    openai_breaker_window_seconds: float = 60.0
+    openai_breaker_min_calls: int = 10
+    openai_breaker_failure_ratio: float = 0.5
+    openai_breaker_slow_call_seconds: float = 90.0
+    # Cooldown before a half-open probe is let through
+    openai_breaker_open_seconds: float = 30.0
+    # Tasks are deferred while it is open until they are this old (from created_at), then failed and refunded
+    openai_breaker_max_defer_seconds: float = 600.0
+
+    # Preprocessed input image cache
+    image_cache_enabled: bool = True
+    image_cache_dir: str = '/tmp/wearon-image-cache'
+    image_cache_max_disk_mb: int = 512
+    image_cache_max_memory_mb: int = 64
+    # URL refs are revalidated by ETag on every reuse; this only bounds how long they are kept
+    image_cache_ref_ttl_seconds: float = 86400.0
+
+    # CPU executor for image decode/resize/encode ('thread' or 'process')
+    image_executor_kind: str = 'thread'
+    image_executor_workers: int = 2
+    image_executor_queue_size: int = 8
+    # Extra result renditions as comma-separated format:size (jpeg is progressive, size = longest side
+    # in px or "full"), e.g. 'webp:full,jpeg:full,webp:512,webp:256'; empty uploads only the original
+    result_renditions: str = ''
+
+    # Generation result deduplication
+    result_dedup_enabled: bool = True
+    result_dedup_ttl_seconds: int = 86400
+    # Refreshed by the leader while it works, so this only bounds how long a dead leader blocks others
+    result_dedup_lock_seconds: int = 300
+    result_dedup_wait_seconds: float = 180.0
+    result_dedup_poll_seconds: float = 1.0
+
+    # Size recommendation pose pool (0 workers = one per CPU)
+    pose_pool_workers: int = 0
+    pose_pool_queue_size: int = 8
+    pose_pool_queue_timeout: float = 2.0
+    # Landmarks per image content hash; the Redis tier shares them across API instances
+    size_rec_cache_enabled: bool = True
+    size_rec_cache_max_entries: int = 2048
+    size_rec_cache_ttl_seconds: float = 3600.0
+    size_rec_cache_redis_enabled: bool = False
+    # POST /estimate-body/batch: item cap and image downloads in flight per batch
+    size_rec_batch_max_items: int = 500
+    size_rec_batch_download_concurrency: int = 16
+    # DNS for image downloads: resolved addresses are cached and connections pinned to them
+    dns_cache_ttl_seconds: float = 60.0
+    dns_resolve_timeout_seconds: float = 2.0
+    # Background health probes; /health and /readyz serve their latest results
+    health_probe_interval_seconds: float = 10.0
+    health_monitoring_probe_interval_seconds: float = 30.0
+    health_probe_timeout_seconds: float = 3.0
 
     # Worker
+    # 'prefork': one generation per process; 'asyncio': one process, many generations on a shared loop
+    worker_pool: str = 'prefork'
     worker_concurrency: int = 5
+    worker_max_inflight: int = 50
+    consumer_batch_size: int = 20
+    # Fair scheduling: channels share dispatch slots by weight, tenants round-robin within a channel
+    scheduler_b2c_weight: int = 3
+    scheduler_b2b_weight: int = 1
+    scheduler_b2c_tenant_max_inflight: int = 2
+    scheduler_b2b_tenant_max_inflight: int = 3
+    # Dispatched-but-unfinished cap across all tenants and instances; 0 = this worker's concurrency.
+    # Tenant caps are clamped below it.
+    scheduler_max_inflight: int = 0
+    scheduler_max_buffered: int = 10000
+    # Restarted on every retry or deferral, so it must cover the longest countdown plus a 300s run
+    scheduler_lease_seconds: float = 900.0
+    scheduler_poll_interval_seconds: float = 0.2
+    startup_cleanup_page_size: int = 200
 
     model_config = {'env_file': '.env', 'env_file_encoding': 'utf-8', 'extra': 'ignore'}
 
@@ -1,33 +1,54 @@
+import os
+import shutil
 import subprocess
 import sys
 import threading
+from datetime import UTC, datetime
 
 import structlog
 import uvicorn
 
 from config.logging_config import setup_logging
 from config.settings import settings
-from worker.consumer import run_consumer
-from worker.startup import cleanup_stuck_sessions
 
 setup_logging()
 logger = structlog.get_logger()
 
+METRICS_DIR = '/tmp/wearon-metrics'
+
+
+def prepare_metrics_dir() -> None:
+    """Point prometheus_client at a fresh shared directory for multiprocess metrics.
+
+    Must run before anything imports prometheus_client, so the worker modules
+    below are imported lazily. The Celery subprocess inherits the variable and
+    the FastAPI /metrics endpoint aggregates every process's samples.
+    """
+    path = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', METRICS_DIR)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
 
 def start_celery_worker() -> subprocess.Popen:  # type: ignore[type-arg]
     """Start Celery worker as a subprocess."""
+    if settings.worker_pool == 'asyncio':
+        pool_args = ['--pool=threads', f'--concurrency={settings.worker_max_inflight}']
+    else:
+        pool_args = [f'--concurrency={settings.worker_concurrency}']
     cmd = [
         sys.executable, '-m', 'celery',
         '-A', 'worker.celery_app',
         'worker',
         '--loglevel=info',
-        f'--concurrency={settings.worker_concurrency}',
+        *pool_args,
     ]
     return subprocess.Popen(cmd)
 
 
 def start_consumer_thread() -> threading.Thread:
     """Start the Redis BRPOP consumer in a daemon thread."""
+    from worker.consumer import run_consumer
+
     t = threading.Thread(target=run_consumer, daemon=True)
     t.start()
     return t
@@ -45,9 +66,16 @@ def start_fastapi() -> None:
 
 def main() -> None:
     logger.info('worker_starting')
-
-    # 1. Cleanup stuck sessions from previous runs
-    cleanup_stuck_sessions()
+    prepare_metrics_dir()
+    from services.session_store import STARTUP_CUTOFF_ENV
+    from worker.startup import start_cleanup_thread
+
+    # 1. Cleanup stuck sessions from previous runs in the background. Sessions
+    #    created before this instant belong to the cleanup; Celery processes
+    #    inherit the cutoff and never claim them
+    started_at = datetime.now(UTC)
+    os.environ[STARTUP_CUTOFF_ENV] = started_at.isoformat()
+    start_cleanup_thread(started_at)
 
     # 2. Start Celery worker subprocess
     celery_proc = start_celery_worker()
@@ -36,6 +36,23 @@ class EstimateBodyResponse(BaseModel):
     size_range: SizeRange
 
 
+class EstimateBodyBatchRequest(BaseModel):
+    model_config = ConfigDict(strict=True, extra='forbid')
+
+    items: list[EstimateBodyRequest] = Field(min_length=1)
+
+
+class EstimateBodyBatchItem(BaseModel):
+    """One NDJSON line of a batch response; exactly one of result/error is set."""
+
+    model_config = ConfigDict(strict=True, extra='forbid')
+
+    index: int = Field(ge=0)
+    status: int
+    result: EstimateBodyResponse | None = None
+    error: str | None = None
+
+
 class HealthResponse(BaseModel):
     model_config = ConfigDict(strict=True, extra='forbid')
 
@@ -1,3 +1,4 @@
+from datetime import UTC, datetime
 from typing import Literal
 
 from pydantic import BaseModel, model_validator
@@ -29,3 +30,11 @@ class GenerationTask(BaseModel):
         if not self.image_urls:
             raise ValueError('image_urls must not be empty')
         return self
+
+    def created_datetime(self) -> datetime | None:
+        """created_at as an aware datetime (naive values are taken as UTC), or None if unparseable."""
+        try:
+            created = datetime.fromisoformat(self.created_at)
+        except ValueError:
+            return None
+        return created if created.tzinfo else created.replace(tzinfo=UTC)
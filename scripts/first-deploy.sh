@@ -114,7 +114,7 @@ echo ""
 echo "=== Deployment Complete ==="
 echo ""
 echo "Service URLs:"
-echo "  Health:  https://${DOMAIN}/health"
+echo "  Health:  https://${DOMAIN}/readyz"
 echo "  Grafana: https://${DOMAIN}/grafana/"
 echo ""
 echo "Useful commands:"
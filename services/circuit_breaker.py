@@ -0,0 +1,250 @@
+import uuid
+from dataclasses import dataclass
+
+import redis.asyncio as aioredis
+import structlog
+
+from config.settings import settings
+from services.metrics import OPENAI_CIRCUIT_STATE, OPENAI_CIRCUIT_TRANSITIONS
+from services.redis_client import get_async_redis
+
+logger = structlog.get_logger()
+
+CIRCUIT_KEY = 'wearon:breaker:openai'
+# The rolling window is kept as this many time slots in the breaker hash
+WINDOW_BUCKETS = 10
+
+STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+# Admission, shared by every worker and timed by the Redis server clock. An
+# open breaker past its cooldown turns half-open and admits one probe, which
+# holds the token passed in; further callers wait until the probe reports back,
+# is released or its lease runs out.
+# KEYS[1] = breaker hash; ARGV = probe_ms, probe_token
+# Returns {state, wait_ms}; wait_ms 0 means the call may proceed
+_ADMIT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then
+  return {state, 0}
+end
+if state == 'open' then
+  local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until') or '0')
+  if now < open_until then
+    return {state, open_until - now}
+  end
+else
+  local probe_until = tonumber(redis.call('HGET', KEYS[1], 'probe_until') or '0')
+  if now < probe_until then
+    return {state, probe_until - now}
+  end
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[1]), 'probe', ARGV[2])
+return {'half_open', 0}
+"""
+
+# How long admit would make a caller wait right now, without taking a probe.
+# KEYS[1] = breaker hash
+# Returns wait_ms
+_BLOCKED_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local field = 'probe_until'
+if state == 'closed' then
+  return 0
+elseif state == 'open' then
+  field = 'open_until'
+end
+return math.max(0, tonumber(redis.call('HGET', KEYS[1], field) or '0') - now)
+"""
+
+# A probe that ends without a verdict frees the half-open slot for the next caller.
+# KEYS[1] = breaker hash; ARGV = probe_token
+_RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'probe') == ARGV[1] then
+  redis.call('HDEL', KEYS[1], 'probe', 'probe_until')
+  return 1
+end
+return 0
+"""
+
+# Outcome feedback. Closed: count the call in the rolling window and open once
+# enough calls failed. Half-open: only the probe holding the token closes or
+# reopens it. Open, or half-open without the token: late results from calls
+# admitted earlier are ignored.
+# KEYS[1] = breaker hash; ARGV = failed (1/0), window_ms, buckets, min_calls, failure_ratio, open_ms, probe_token
+# Returns {previous_state, state}
+_RECORD_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local failed = ARGV[1] == '1'
+local open_ms = tonumber(ARGV[6])
+if state == 'open' then
+  return {state, state}
+end
+if state == 'half_open' then
+  if ARGV[7] == '' or redis.call('HGET', KEYS[1], 'probe') ~= ARGV[7] then
+    return {state, state}
+  end
+  redis.call('DEL', KEYS[1])
+  if failed then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_ms)
+    redis.call('PEXPIRE', KEYS[1], 3600000)
+    return {state, 'open'}
+  end
+  return {state, 'closed'}
+end
+local buckets = tonumber(ARGV[3])
+local width = math.max(1, math.floor(tonumber(ARGV[2]) / buckets))
+local epoch = math.floor(now / width)
+local slot = epoch % buckets
+if tonumber(redis.call('HGET', KEYS[1], 'e' .. slot) or '-1') ~= epoch then
+  redis.call('HSET', KEYS[1], 'e' .. slot, epoch, 'n' .. slot, 0, 'f' .. slot, 0)
+end
+redis.call('HINCRBY', KEYS[1], 'n' .. slot, 1)
+if failed then
+  redis.call('HINCRBY', KEYS[1], 'f' .. slot, 1)
+end
+local calls, failures = 0, 0
+for i = 0, buckets - 1 do
+  if tonumber(redis.call('HGET', KEYS[1], 'e' .. i) or '-1') > epoch - buckets then
+    calls = calls + tonumber(redis.call('HGET', KEYS[1], 'n' .. i) or '0')
+    failures = failures + tonumber(redis.call('HGET', KEYS[1], 'f' .. i) or '0')
+  end
+end
+if calls >= tonumber(ARGV[4]) and failures >= calls * tonumber(ARGV[5]) then
+  redis.call('DEL', KEYS[1])
+  redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_ms)
+  redis.call('PEXPIRE', KEYS[1], 3600000)
+  return {state, 'open'}
+end
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return {state, state}
+"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the OpenAI circuit breaker is not admitting calls."""
+
+    def __init__(self, message: str, retry_in: float = 0.0):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+@dataclass(frozen=True)
+class Admission:
+    # Seconds until the breaker may admit a call; 0 means go ahead
+    wait_seconds: float = 0.0
+    # Set when this call is the half-open probe; passed back with its outcome
+    probe: str | None = None
+
+    @property
+    def allowed(self) -> bool:
+        return self.wait_seconds <= 0
+
+
+class OpenAICircuitBreaker:
+    """Cluster-wide circuit breaker for OpenAI calls.
+
+    Server errors, network errors and timeouts count as failures, and so do
+    successful calls slower than openai_breaker_slow_call_seconds. Throttling
+    (429) is left to the rate limiter and moderation blocks are not a backend
+    fault, so neither is recorded. Fails open: without Redis every call is
+    admitted and nothing is recorded.
+    """
+
+    def __init__(self, redis_url: str, key: str = CIRCUIT_KEY) -> None:
+        self.redis_url = redis_url
+        self.key = key
+
+    def _redis(self) -> aioredis.Redis:
+        return get_async_redis(self.redis_url)
+
+    async def admit(self) -> Admission:
+        """Ask to make a call now; take this immediately before it goes out."""
+        token = uuid.uuid4().hex
+        try:
+            state, wait_ms = await self._redis().eval(
+                _ADMIT_SCRIPT, 1, self.key, int(settings.openai_breaker_slow_call_seconds * 1000), token,
+            )
+        except Exception as exc:
+            logger.warn('circuit_breaker_unavailable', error=str(exc))
+            return Admission()
+
+        OPENAI_CIRCUIT_STATE.set(STATE_VALUES.get(state, 0))
+        if int(wait_ms) > 0:
+            return Admission(wait_seconds=int(wait_ms) / 1000)
+        if state == 'half_open':
+            logger.info('openai_circuit_probe')
+            return Admission(probe=token)
+        return Admission()
+
+    async def blocked_for(self) -> float:
+        """Seconds admit would currently make a caller wait, without taking the probe."""
+        try:
+            wait_ms = await self._redis().eval(_BLOCKED_SCRIPT, 1, self.key)
+        except Exception as exc:
+            logger.warn('circuit_breaker_unavailable', error=str(exc))
+            return 0.0
+        return max(0, int(wait_ms)) / 1000
+
+    async def release_probe(self, probe: str) -> None:
+        """Give up a probe that ended without a verdict; a no-op once its outcome was recorded."""
+        try:
+            await self._redis().eval(_RELEASE_SCRIPT, 1, self.key, probe)
+        except Exception as exc:
+            logger.warn('circuit_breaker_unavailable', error=str(exc))
+
+    async def is_open(self) -> bool:
+        """Whether the breaker is open right now; checked before retrying a failed call."""
+        try:
+            state = await self._redis().hget(self.key, 'state')
+        except Exception as exc:
+            logger.warn('circuit_breaker_unavailable', error=str(exc))
+            return False
+        return state == 'open'
+
+    async def record_success(self, latency_seconds: float, probe: str | None = None) -> None:
+        await self._record(latency_seconds > settings.openai_breaker_slow_call_seconds, probe)
+
+    async def record_failure(self, probe: str | None = None) -> None:
+        await self._record(True, probe)
+
+    async def _record(self, failed: bool, probe: str | None) -> None:
+        try:
+            previous, state = await self._redis().eval(
+                _RECORD_SCRIPT,
+                1,
+                self.key,
+                int(failed),
+                int(settings.openai_breaker_window_seconds * 1000),
+                WINDOW_BUCKETS,
+                settings.openai_breaker_min_calls,
+                settings.openai_breaker_failure_ratio,
+                int(settings.openai_breaker_open_seconds * 1000),
+                probe or '',
+            )
+        except Exception as exc:
+            logger.warn('circuit_breaker_unavailable', error=str(exc))
+            return
+
+        OPENAI_CIRCUIT_STATE.set(STATE_VALUES.get(state, 0))
+        if state != previous:
+            OPENAI_CIRCUIT_TRANSITIONS.labels(state=state).inc()
+            log = logger.warn if state == 'open' else logger.info
+            log('openai_circuit_state_changed', previous=previous, state=state)
+
+
+_circuit_breaker: OpenAICircuitBreaker | None = None
+
+
+def get_circuit_breaker() -> OpenAICircuitBreaker | None:
+    global _circuit_breaker
+    if not settings.openai_breaker_enabled:
+        return None
+    if _circuit_breaker is None:
+        _circuit_breaker = OpenAICircuitBreaker(settings.redis_url)
+    return _circuit_breaker
@@ -0,0 +1,190 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+import httpcore
+import httpx
+
+from config.settings import settings
+
+MAX_CACHED_HOSTS = 1024
+# httpx's own client defaults
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+
+
+class HostResolutionError(ValueError):
+    """Raised when a hostname cannot be resolved."""
+
+
+class InternalAddressError(ValueError):
+    """Raised when a hostname resolves to a private, loopback or otherwise internal address."""
+
+
+def is_internal(addr: IPAddress) -> bool:
+    if isinstance(addr, ipaddress.IPv6Address) and addr.ipv4_mapped is not None:
+        addr = addr.ipv4_mapped
+    return (
+        addr.is_private
+        or addr.is_loopback
+        or addr.is_link_local
+        or addr.is_reserved
+        or addr.is_multicast
+        or addr.is_unspecified
+    )
+
+
+class CachingResolver:
+    """Async hostname resolution with a TTL cache and one lookup in flight per host.
+
+    getaddrinfo runs on the loop's default executor, so a slow resolver delays
+    only the requests for that host instead of stalling the event loop.
+    """
+
+    def __init__(self, ttl_seconds: float, timeout_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self._entries: OrderedDict[str, tuple[float, list[IPAddress]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future[list[IPAddress]]] = {}
+
+    async def _lookup(self, host: str) -> list[IPAddress]:
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, type=socket.SOCK_STREAM),
+                timeout=self.timeout_seconds,
+            )
+        except (OSError, TimeoutError) as exc:
+            raise HostResolutionError(f'Cannot resolve hostname: {host}') from exc
+        addresses = list(dict.fromkeys(ipaddress.ip_address(info[4][0].split('%')[0]) for info in infos))
+        if not addresses:
+            raise HostResolutionError(f'Cannot resolve hostname: {host}')
+        return addresses
+
+    async def resolve(self, host: str) -> list[IPAddress]:
+        """All addresses for host, in the system resolver's preference order."""
+        host = host.lower()
+        entry = self._entries.get(host)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(host)
+            return entry[1]
+
+        inflight = self._inflight.get(host)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller doing the lookup went away; take over
+                return await self.resolve(host)
+
+        future: asyncio.Future[list[IPAddress]] = asyncio.get_running_loop().create_future()
+        self._inflight[host] = future
+        try:
+            addresses = await self._lookup(host)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            # Failures are shared with waiters but not cached
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[host]
+
+        self._entries[host] = (time.monotonic() + self.ttl_seconds, addresses)
+        self._entries.move_to_end(host)
+        while len(self._entries) > MAX_CACHED_HOSTS:
+            self._entries.popitem(last=False)
+        future.set_result(addresses)
+        return addresses
+
+
+async def resolve_checked(host: str, allow_internal: bool = False) -> list[IPAddress]:
+    """Addresses for host, rejecting it if any of them is internal (unless allowed)."""
+    try:
+        addresses: list[IPAddress] = [ipaddress.ip_address(host.strip('[]'))]
+    except ValueError:
+        addresses = await get_resolver().resolve(host)
+    # Every answer is checked, so a public first record cannot hide an internal one
+    if not allow_internal and any(is_internal(addr) for addr in addresses):
+        raise InternalAddressError('URL resolves to a non-routable address')
+    return addresses
+
+
+class _PinnedNetworkBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self, allow_internal: bool) -> None:
+        self.allow_internal = allow_internal
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Iterable[Any] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        addresses = await resolve_checked(host, self.allow_internal)
+        # Try each validated address in resolver order, the last one's error surfaces
+        for address in addresses[:-1]:
+            try:
+                return await self._backend.connect_tcp(
+                    str(address), port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                continue
+        return await self._backend.connect_tcp(
+            str(addresses[-1]), port, timeout=timeout, local_address=local_address, socket_options=socket_options
+        )
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Iterable[Any] | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        raise httpcore.ConnectError('Unix sockets are not allowed for image downloads')
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class PinnedTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that connects only to addresses resolved and checked here.
+
+    URLs keep their hostname, so SNI, certificate checks and connection pooling
+    stay per host; only the TCP connect target comes from the cached, validated
+    resolution, and httpx never resolves the name a second time.
+    """
+
+    def __init__(self, allow_internal: bool = False, limits: httpx.Limits = DEFAULT_LIMITS) -> None:
+        super().__init__()
+        # Same pool httpx builds, with the network backend swapped for the pinned one
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_PinnedNetworkBackend(allow_internal),
+        )
+
+
+_resolver: CachingResolver | None = None
+
+
+def get_resolver() -> CachingResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = CachingResolver(
+            ttl_seconds=settings.dns_cache_ttl_seconds,
+            timeout_seconds=settings.dns_resolve_timeout_seconds,
+        )
+    return _resolver
@@ -0,0 +1,252 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import structlog
+
+from config.settings import settings
+from services.metrics import IMAGE_CACHE_BYTES
+
+logger = structlog.get_logger()
+
+# Query parameters that only carry a URL signature/expiry and never identify the object
+_SIGNING_PARAMS = {'token', 'signature', 'sig', 'expires', 'se', 'sp', 'sv', 'st', 'spr', 'sr', 'skoid'}
+_SIGNING_PREFIXES = ('x-amz-', 'x-goog-')
+
+_MAX_MEMORY_REFS = 10_000
+
+
+def identity_key(url: str) -> str:
+    """Stable cache key for a storage object, ignoring signed-URL query parameters."""
+    parts = urlsplit(url)
+    query = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in _SIGNING_PARAMS and not name.lower().startswith(_SIGNING_PREFIXES)
+    ]
+    identity = f'{parts.scheme}://{parts.netloc.lower()}{parts.path}?{urlencode(sorted(query))}'
+    return 'url-' + hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+def content_key(data: bytes) -> str:
+    return 'sha-' + hashlib.sha256(data).hexdigest()
+
+
+class ImageCache:
+    """Two-tier LRU cache of preprocessed (resized JPEG) input images.
+
+    Objects are stored once by content hash. URL identities are small refs
+    pointing at a content key plus the object's ETag; callers revalidate that
+    ETag with the origin before reusing a ref, so an object overwritten in
+    storage is re-downloaded while its resized output can still be reused by
+    content hash. Refs are dropped after ref_ttl. The disk tier is shared by
+    all worker processes and evicted by least-recent access (file mtime).
+
+    Only resolve_memory and get_memory are safe to call on an event loop; every
+    other method may touch the disk.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_disk_bytes: int,
+        max_memory_bytes: int,
+        ref_ttl_seconds: float,
+    ) -> None:
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.refs_dir = os.path.join(directory, 'refs')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.ref_ttl_seconds = ref_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._refs: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        self._disk_bytes = self._scan_disk_bytes()
+
+    def resolve(self, ref: str) -> tuple[str, str] | None:
+        """Return the (content key, ETag) a URL identity points at, if still fresh."""
+        entry = self.resolve_memory(ref)
+        if entry is not None:
+            return entry
+
+        path = os.path.join(self.refs_dir, ref)
+        try:
+            created = os.path.getmtime(path)
+            if time.time() - created >= self.ref_ttl_seconds:
+                return None
+            with open(path, encoding='utf-8') as fh:
+                key, _, etag = fh.read().partition('\n')
+        except OSError:
+            return None
+        if not etag:
+            return None
+
+        with self._lock:
+            self._refs[ref] = (key, etag, created)
+        return key, etag
+
+    def resolve_memory(self, ref: str) -> tuple[str, str] | None:
+        """Like resolve, from the in-memory refs only."""
+        with self._lock:
+            entry = self._refs.get(ref)
+        if entry is None or time.time() - entry[2] >= self.ref_ttl_seconds:
+            return None
+        return entry[0], entry[1]
+
+    def link(self, ref: str, key: str, etag: str) -> None:
+        with self._lock:
+            self._refs[ref] = (key, etag, time.time())
+            self._refs.move_to_end(ref)
+            while len(self._refs) > _MAX_MEMORY_REFS:
+                self._refs.popitem(last=False)
+        self._atomic_write(os.path.join(self.refs_dir, ref), f'{key}\n{etag}'.encode('utf-8'))
+
+    def get_memory(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def get(self, key: str) -> bytes | None:
+        data = self.get_memory(key)
+        if data is not None:
+            return data
+
+        path = os.path.join(self.objects_dir, key)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            os.utime(path)
+        except OSError:
+            return None
+
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        path = os.path.join(self.objects_dir, key)
+        if os.path.exists(path):
+            return
+        self._atomic_write(path, data)
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+            IMAGE_CACHE_BYTES.labels(tier='memory').set(self._memory_bytes)
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warn('image_cache_write_failed', path=path)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        with os.scandir(self.objects_dir) as entries:
+            for entry in entries:
+                try:
+                    total += entry.stat().st_size
+                except OSError:
+                    continue
+        IMAGE_CACHE_BYTES.labels(tier='disk').set(total)
+        return total
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used objects until the disk tier is at 90% of its cap.
+
+        Sizes are rescanned first because other worker processes share the
+        directory. Expired URL refs are pruned at the same time.
+        """
+        files: list[tuple[float, int, str]] = []
+        with os.scandir(self.objects_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        evicted = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+        IMAGE_CACHE_BYTES.labels(tier='disk').set(total)
+
+        expired_before = time.time() - self.ref_ttl_seconds
+        with os.scandir(self.refs_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < expired_before:
+                        os.unlink(entry.path)
+                except OSError:
+                    continue
+
+        logger.info('image_cache_evicted', files=evicted, disk_bytes=total)
+
+
+_image_cache: ImageCache | None = None
+_image_cache_unavailable = False
+
+
+def get_image_cache() -> ImageCache | None:
+    """Process-wide cache instance, or None when caching is disabled or unusable."""
+    global _image_cache, _image_cache_unavailable
+    if not settings.image_cache_enabled or _image_cache_unavailable:
+        return None
+    if _image_cache is None:
+        try:
+            _image_cache = ImageCache(
+                directory=settings.image_cache_dir,
+                max_disk_bytes=settings.image_cache_max_disk_mb * 1024 * 1024,
+                max_memory_bytes=settings.image_cache_max_memory_mb * 1024 * 1024,
+                ref_ttl_seconds=settings.image_cache_ref_ttl_seconds,
+            )
+        except OSError as exc:
+            logger.warn('image_cache_unavailable', error=str(exc))
+            _image_cache_unavailable = True
+            return None
+    return _image_cache
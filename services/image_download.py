@@ -0,0 +1,58 @@
+import httpx
+
+# Leading bytes of the image formats Pillow is expected to decode
+_IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'GIF87a',
+    b'GIF89a',
+    b'BM',  # BMP
+    b'II*\x00',  # TIFF little-endian
+    b'MM\x00*',  # TIFF big-endian
+)
+_FTYP_BRANDS = (b'heic', b'heix', b'hevc', b'mif1', b'msf1', b'avif', b'avis')
+SNIFF_BYTES = 12
+
+
+class DownloadRejectedError(ValueError):
+    """Raised when a response is rejected before or while its body is streamed."""
+
+
+def looks_like_image(head: bytes) -> bool:
+    """Check magic bytes for the supported image formats."""
+    if head.startswith(_IMAGE_SIGNATURES):
+        return True
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return head[4:8] == b'ftyp' and head[8:12] in _FTYP_BRANDS
+
+
+async def read_image_body(response: httpx.Response, max_bytes: int) -> bytes:
+    """Stream an image response body into a bounded buffer.
+
+    Rejects on content type and Content-Length before reading anything, on
+    magic bytes as soon as the first bytes arrive, and as soon as the byte
+    budget is exceeded, so hostile or huge bodies are never fully buffered.
+    """
+    content_type = response.headers.get('content-type', '').lower()
+    if not content_type.startswith('image/'):
+        raise DownloadRejectedError(f'URL returned non-image content-type: {content_type}')
+
+    declared = response.headers.get('content-length')
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise DownloadRejectedError(f'Image size ({declared} bytes) exceeds {max_bytes} byte limit')
+
+    buf = bytearray()
+    sniffed = False
+    async for chunk in response.aiter_bytes():
+        if len(buf) + len(chunk) > max_bytes:
+            raise DownloadRejectedError(f'Image exceeds {max_bytes} byte limit')
+        buf += chunk
+        if not sniffed and len(buf) >= SNIFF_BYTES:
+            if not looks_like_image(bytes(buf[:SNIFF_BYTES])):
+                raise DownloadRejectedError('URL did not return image data')
+            sniffed = True
+
+    if not sniffed and not looks_like_image(bytes(buf)):
+        raise DownloadRejectedError('URL did not return image data')
+    return bytes(buf)
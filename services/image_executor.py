@@ -0,0 +1,87 @@
+import asyncio
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+import structlog
+
+from config.settings import settings
+from services.metrics import IMAGE_EXECUTOR_PENDING
+
+logger = structlog.get_logger()
+
+T = TypeVar('T')
+
+
+class BoundedExecutor:
+    """CPU executor for image work with a bounded submission queue.
+
+    At most max_pending jobs (running + queued) are accepted; further callers
+    wait on the event loop instead of piling work into the pool. Threads are
+    the default because Pillow releases the GIL while decoding, resampling and
+    encoding; a spawn-based process pool can be selected for pure-Python work.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int) -> None:
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._executor: Executor | None = None
+        self._semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-cpu')
+        return self._executor
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_pending)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        async with self._semaphore():
+            self._pending += 1
+            IMAGE_EXECUTOR_PENDING.set(self._pending)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+            finally:
+                self._pending -= 1
+                IMAGE_EXECUTOR_PENDING.set(self._pending)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphores.clear()
+
+
+_image_executor: BoundedExecutor | None = None
+
+
+def get_image_executor() -> BoundedExecutor:
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = BoundedExecutor(
+            kind=settings.image_executor_kind,
+            workers=settings.image_executor_workers,
+            max_pending=settings.image_executor_workers + settings.image_executor_queue_size,
+        )
+    return _image_executor
+
+
+async def shutdown_image_executor() -> None:
+    if _image_executor is not None:
+        _image_executor.shutdown()
@@ -1,9 +1,17 @@
+import asyncio
 import io
+import time
 
 import httpx
 import structlog
 from PIL import Image
 
+from services.dns_resolver import PinnedTransport
+from services.image_cache import content_key, get_image_cache, identity_key
+from services.image_download import DownloadRejectedError, read_image_body
+from services.image_executor import get_image_executor
+from services.metrics import IMAGE_CACHE_REQUESTS, IMAGE_CPU_SECONDS, IMAGE_PASSTHROUGH, track_stage
+
 logger = structlog.get_logger()
 
 MAX_IMAGE_DIMENSION = 1024
@@ -13,42 +21,104 @@ JPEG_QUALITY = 75
 MAX_DOWNLOAD_SIZE_MB = 10
 
 
+class ImagePreparationError(Exception):
+    """Raised when one or more task input images could not be downloaded or resized."""
+
+    def __init__(self, failures: list[tuple[str, str]]):
+        names = ', '.join(name for name, _ in failures)
+        super().__init__(f'Failed to prepare input image(s): {names}')
+        self.failures = failures
+
+
+class ImageNotModified(Exception):
+    """Raised when a conditional download finds the cached copy still current."""
+
+
+def image_name(index: int) -> str:
+    """Name used for the index-th input: the first image is always the model photo."""
+    return 'model' if index == 0 else f'image_{index}'
+
+
 async def download_image(url: str) -> bytes:
-    """Download image from a signed URL."""
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=False) as client:
-        response = await client.get(url)
-        response.raise_for_status()
+    """Download image from a signed URL, streaming into a bounded buffer."""
+    raw, _ = await download_image_with_etag(url)
+    return raw
 
-        content_type = response.headers.get('content-type', '').lower()
-        if not content_type.startswith('image/'):
-            raise ValueError(f'URL returned non-image content-type: {content_type}')
 
-        max_bytes = MAX_DOWNLOAD_SIZE_MB * 1024 * 1024
-        if len(response.content) > max_bytes:
-            raise ValueError(f'Image exceeds {MAX_DOWNLOAD_SIZE_MB}MB limit')
+async def download_image_with_etag(url: str, if_none_match: str | None = None) -> tuple[bytes, str | None]:
+    """Download an image and its ETag, conditionally on if_none_match.
 
-        return response.content
+    Raises ImageNotModified when the origin answers 304, i.e. the copy cached
+    under that ETag is still current.
+    """
+    with track_stage('download'):
+        return await _download_image(url, if_none_match)
+
+
+async def _download_image(url: str, if_none_match: str | None) -> tuple[bytes, str | None]:
+    # Signed URLs come from our own backend (and point at localhost in dev), so
+    # internal addresses are allowed; the transport just reuses cached resolutions
+    transport = PinnedTransport(allow_internal=True)
+    headers = {'If-None-Match': if_none_match} if if_none_match else None
+    async with httpx.AsyncClient(timeout=30.0, follow_redirects=False, transport=transport) as client:
+        async with client.stream('GET', url, headers=headers) as response:
+            if if_none_match and response.status_code == 304:
+                raise ImageNotModified(url)
+            response.raise_for_status()
+            try:
+                raw = await read_image_body(response, MAX_DOWNLOAD_SIZE_MB * 1024 * 1024)
+            except DownloadRejectedError as exc:
+                raise ValueError(str(exc)) from exc
+            return raw, response.headers.get('etag')
+
+
+def _is_compliant_jpeg(img: Image.Image) -> bool:
+    """True if the input can be sent to OpenAI as-is: an RGB JPEG within size and without EXIF."""
+    return (
+        img.format == 'JPEG'
+        and img.mode == 'RGB'
+        and max(img.size) <= MAX_IMAGE_DIMENSION
+        and 'exif' not in img.info
+    )
 
 
-def resize_image(image_bytes: bytes, name: str) -> bytes:
+def resize_with_timings(image_bytes: bytes, name: str) -> tuple[bytes, dict[str, float]]:
     """Resize image to max 1024px on longest side, convert to JPEG.
 
     Matches the cost optimization logic from the TypeScript openai-image.ts service.
+    Inputs that already meet the constraints are returned untouched. Oversized
+    JPEGs are decoded in draft mode, letting libjpeg downscale by a power of two
+    during decode before the final LANCZOS pass.
+
+    Returns the JPEG bytes and per-stage CPU seconds (decode/resize/encode).
     """
+    timings: dict[str, float] = {}
+    started = time.thread_time()
     img = Image.open(io.BytesIO(image_bytes))
+    if _is_compliant_jpeg(img):
+        timings['decode'] = time.thread_time() - started
+        logger.info('image_passthrough', name=name, size_kb=round(len(image_bytes) / 1024, 1))
+        return image_bytes, timings
+
     width, height = img.size
     longest = max(width, height)
-
+    target: tuple[int, int] | None = None
     if longest > MAX_IMAGE_DIMENSION:
         scale = MAX_IMAGE_DIMENSION / longest
-        new_width = round(width * scale)
-        new_height = round(height * scale)
-        img = img.resize((new_width, new_height), Image.LANCZOS)
+        target = (round(width * scale), round(height * scale))
+        if img.format == 'JPEG':
+            img.draft(None, target)
+    img.load()
+    timings['decode'] = time.thread_time() - started
+
+    started = time.thread_time()
+    if target is not None:
+        img = img.resize(target, Image.LANCZOS)
         logger.info(
             'image_resized',
             name=name,
             original=f'{width}x{height}',
-            resized=f'{new_width}x{new_height}',
+            resized=f'{target[0]}x{target[1]}',
         )
 
     # Convert to RGB (handles RGBA/palette) and save as JPEG
@@ -60,21 +130,122 @@ def resize_image(image_bytes: bytes, name: str) -> bytes:
         img = background
     elif img.mode != 'RGB':
         img = img.convert('RGB')
+    timings['resize'] = time.thread_time() - started
 
     # Strip EXIF metadata and optimize encoding to reduce file size
+    started = time.thread_time()
     img.info.pop('exif', None)
     buf = io.BytesIO()
     img.save(buf, format='JPEG', quality=JPEG_QUALITY, optimize=True)
     compressed = buf.getvalue()
+    timings['encode'] = time.thread_time() - started
     logger.info(
         'image_compressed',
         name=name,
         size_kb=round(len(compressed) / 1024, 1),
     )
+    return compressed, timings
+
+
+def _record_timings(timings: dict[str, float]) -> None:
+    if 'resize' not in timings:
+        IMAGE_PASSTHROUGH.inc()
+    for stage, seconds in timings.items():
+        IMAGE_CPU_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def resize_image(image_bytes: bytes, name: str) -> bytes:
+    """Synchronous resize for callers outside the event loop."""
+    compressed, timings = resize_with_timings(image_bytes, name)
+    _record_timings(timings)
+    return compressed
+
+
+async def resize_image_async(image_bytes: bytes, name: str) -> bytes:
+    """Resize on the bounded image CPU executor so the event loop stays free for I/O."""
+    with track_stage('resize'):
+        compressed, timings = await get_image_executor().run(resize_with_timings, image_bytes, name)
+    _record_timings(timings)
     return compressed
 
 
 async def download_and_resize(url: str, name: str) -> bytes:
-    """Download and resize an image for cost-optimal OpenAI input."""
-    raw = await download_image(url)
-    return resize_image(raw, name)
+    """Download and resize an image for cost-optimal OpenAI input.
+
+    Resized outputs are cached by storage-object identity (signed-URL query
+    stripped) and by content hash. A repeated model photo or garment whose
+    ETag still matches skips both the download and the resize. The same bytes
+    under another path skip the resize. Disk-tier reads, writes and eviction
+    run in a thread so they never block the loop.
+    """
+    cache = get_image_cache()
+    if cache is None:
+        raw = await download_image(url)
+        return await resize_image_async(raw, name)
+
+    ref = identity_key(url)
+    entry = cache.resolve_memory(ref)
+    if entry is None:
+        entry = await asyncio.to_thread(cache.resolve, ref)
+
+    if entry is None:
+        raw, etag = await download_image_with_etag(url)
+    else:
+        # Revalidate first: an unchanged object costs a round trip, not a download and resize
+        cached_key, cached_etag = entry
+        try:
+            raw, etag = await download_image_with_etag(url, if_none_match=cached_etag)
+        except ImageNotModified:
+            cached = cache.get_memory(cached_key)
+            if cached is None:
+                cached = await asyncio.to_thread(cache.get, cached_key)
+            if cached is not None:
+                IMAGE_CACHE_REQUESTS.labels(result='hit').inc()
+                logger.info('image_cache_hit', name=name)
+                return cached
+            # The object was evicted since its ref was written
+            raw, etag = await download_image_with_etag(url)
+
+    key = content_key(raw)
+    resized = cache.get_memory(key)
+    if resized is None:
+        resized = await asyncio.to_thread(cache.get, key)
+    if resized is not None:
+        IMAGE_CACHE_REQUESTS.labels(result='content_hit').inc()
+        logger.info('image_cache_content_hit', name=name)
+    else:
+        IMAGE_CACHE_REQUESTS.labels(result='miss').inc()
+        resized = await resize_image_async(raw, name)
+        await asyncio.to_thread(cache.put, key, resized)
+    # Without an ETag the object cannot be revalidated, so only the content hash is reused
+    if etag:
+        await asyncio.to_thread(cache.link, ref, key, etag)
+    return resized
+
+
+async def download_and_resize_all(urls: list[str]) -> list[tuple[str, bytes]]:
+    """Download and resize all task inputs concurrently.
+
+    Returns (filename, jpeg_bytes) tuples in input order. Every failing image is
+    logged individually and reported together in a single ImagePreparationError.
+    """
+    names = [image_name(i) for i in range(len(urls))]
+    results = await asyncio.gather(
+        *(download_and_resize(url, name) for url, name in zip(urls, names)),
+        return_exceptions=True,
+    )
+
+    buffers: list[tuple[str, bytes]] = []
+    failures: list[tuple[str, str]] = []
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logger.warn('image_prepare_failed', name=name, error=str(result))
+            failures.append((name, str(result)))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            buffers.append((f'{name}.jpg', result))
+
+    if failures:
+        raise ImagePreparationError(failures)
+    return buffers
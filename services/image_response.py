@@ -0,0 +1,144 @@
+import binascii
+import io
+import json
+import re
+from typing import Any
+
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+_COLON = ord(':')
+_WHITESPACE = frozenset(b' \t\r\n')
+# Escapes a JSON encoder may put inside a base64 string
+_VALUE_ESCAPES = re.compile(rb'\\(.)', re.DOTALL)
+_UNESCAPED = {b'/': b'/', b'n': b'', b'r': b''}
+
+
+class ImageResponseError(ValueError):
+    """Raised when an images API response is truncated or its base64 payload is invalid."""
+
+
+def _unescape(match: re.Match[bytes]) -> bytes:
+    try:
+        return _UNESCAPED[match.group(1)]
+    except KeyError:
+        raise ImageResponseError('Unexpected escape in base64 image data') from None
+
+
+class ImageResponseParser:
+    """Incremental parser for an images API JSON body carrying a b64_json image.
+
+    Chunks are fed as they arrive. The value of the first "b64_json" key is
+    base64-decoded a few kilobytes at a time straight into `image`, so the
+    encoded string is never held whole; every other byte is kept and parsed by
+    close(), with b64_json left as an empty string. `peak_bytes` is the most
+    response data held at any point.
+    """
+
+    FIELD = b'b64_json'
+
+    def __init__(self) -> None:
+        self.image = io.BytesIO()
+        self.found = False
+        self.decoded_bytes = 0
+        self.peak_bytes = 0
+        self._skeleton = bytearray()
+        self._in_value = False
+        self._in_string = False
+        self._escaped = False
+        self._token = bytearray()
+        self._key_closed = False
+        self._awaiting_value = False
+        self._pending = b''
+        self._pending_escape = False
+
+    def feed(self, chunk: bytes) -> None:
+        index = 0
+        while index < len(chunk):
+            if self._in_value:
+                index = self._feed_value(chunk, index)
+            else:
+                index = self._feed_skeleton(chunk, index)
+        held = len(self._skeleton) + self.image.tell() + len(self._pending) + len(chunk)
+        self.peak_bytes = max(self.peak_bytes, held)
+
+    def _feed_skeleton(self, chunk: bytes, index: int) -> int:
+        # Byte by byte, but only over the small non-image part of the body
+        while index < len(chunk):
+            byte = chunk[index]
+            self._skeleton.append(byte)
+            index += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif byte == _BACKSLASH:
+                    self._escaped = True
+                    # An escaped string is never the plain field name
+                    self._token.extend(b'\\')
+                elif byte == _QUOTE:
+                    self._in_string = False
+                    self._key_closed = not self.found and self._token == self.FIELD
+                elif len(self._token) <= len(self.FIELD):
+                    self._token.append(byte)
+            elif byte in _WHITESPACE:
+                continue
+            elif byte == _QUOTE:
+                if self._awaiting_value:
+                    self._awaiting_value = False
+                    self._in_value = True
+                    return index
+                self._in_string = True
+                self._token.clear()
+                self._key_closed = False
+            elif byte == _COLON and self._key_closed:
+                self._key_closed = False
+                self._awaiting_value = True
+            else:
+                self._key_closed = False
+                self._awaiting_value = False
+        return index
+
+    def _feed_value(self, chunk: bytes, index: int) -> int:
+        end = chunk.find(b'"', index)
+        segment = chunk[index:] if end < 0 else chunk[index:end]
+        if self._pending_escape:
+            segment = b'\\' + segment
+            self._pending_escape = False
+        if b'\\' in segment:
+            trailing = len(segment) - len(segment.rstrip(b'\\'))
+            if trailing % 2:
+                # The escaped character is in the next chunk (or is the closing quote)
+                segment = segment[:-1]
+                self._pending_escape = True
+            segment = _VALUE_ESCAPES.sub(_unescape, segment)
+        self._decode(segment)
+        if end < 0:
+            return len(chunk)
+
+        if self._pending_escape or self._pending:
+            raise ImageResponseError('Invalid base64 image data')
+        self._in_value = False
+        self.found = True
+        self._skeleton.extend(b'"')
+        return end + 1
+
+    def _decode(self, segment: bytes) -> None:
+        data = self._pending + segment if self._pending else segment
+        usable = len(data) - len(data) % 4
+        if usable:
+            try:
+                self.decoded_bytes += self.image.write(binascii.a2b_base64(data[:usable], strict_mode=True))
+            except binascii.Error as exc:
+                raise ImageResponseError(f'Invalid base64 image data: {exc}') from exc
+        self._pending = data[usable:]
+
+    def close(self) -> dict[str, Any]:
+        """The rest of the body as JSON; `image` is rewound to its start."""
+        if self._in_value or self._in_string:
+            raise ImageResponseError('Truncated image response')
+        try:
+            body = json.loads(self._skeleton)
+        except ValueError as exc:
+            raise ImageResponseError(f'Invalid image response: {exc}') from exc
+        self._skeleton = bytearray()
+        self.image.seek(0)
+        return body
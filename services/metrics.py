@@ -0,0 +1,230 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Worker metrics are written from the main process and every Celery child. With
+# PROMETHEUS_MULTIPROC_DIR set (see main.py) they are aggregated on /metrics, and
+# each Gauge declares how its per-process values combine.
+
+OPENAI_HTTP_REQUESTS = Counter(
+    'wearon_openai_http_requests_total',
+    'HTTP requests sent through the pooled OpenAI client',
+    ['host'],
+)
+OPENAI_HTTP_CONNECTIONS_OPENED = Counter(
+    'wearon_openai_http_connections_opened_total',
+    'New TCP connections opened by the pooled OpenAI client (requests minus this is connection reuse)',
+    ['host'],
+)
+
+OPENAI_RATE_LIMIT_RPM = Gauge(
+    'wearon_openai_rate_limit_rpm',
+    'Current cluster-wide OpenAI request rate allowed by the adaptive limiter (requests/minute)',
+    multiprocess_mode='mostrecent',
+)
+OPENAI_RATE_LIMIT_THROTTLES = Counter(
+    'wearon_openai_rate_limit_throttles_total',
+    '429 responses fed back into the adaptive OpenAI rate limiter',
+)
+OPENAI_RATE_LIMIT_WAIT = Histogram(
+    'wearon_openai_rate_limit_wait_seconds',
+    'Time spent waiting for a request slot from the shared OpenAI rate limiter',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60),
+)
+OPENAI_CIRCUIT_STATE = Gauge(
+    'wearon_openai_circuit_state',
+    'Cluster-wide OpenAI circuit breaker state last seen by this process (0 closed, 1 half-open, 2 open)',
+    multiprocess_mode='mostrecent',
+)
+OPENAI_CIRCUIT_TRANSITIONS = Counter(
+    'wearon_openai_circuit_transitions_total',
+    'OpenAI circuit breaker state changes observed by this process, by new state',
+    ['state'],
+)
+
+CONSUMER_BATCH_SIZE = Histogram(
+    'wearon_consumer_batch_size',
+    'Payloads drained from the generation queue per Redis round trip',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+CONSUMER_TASKS = Counter(
+    'wearon_consumer_tasks_total',
+    'Queue payloads handled by the consumer (rate of outcome="dispatched" is the drain rate)',
+    ['outcome'],
+)
+CONSUMER_DISPATCH_SECONDS = Histogram(
+    'wearon_consumer_dispatch_seconds',
+    'Time to publish one drained batch to Celery',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    'wearon_scheduler_queue_depth',
+    'Tasks held in the consumer\'s per-tenant sub-queues (tenant is the store id; b2c shoppers share "all")',
+    ['channel', 'tenant'],
+    multiprocess_mode='livemax',
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    'wearon_scheduler_wait_seconds',
+    'Time a task waited in its tenant sub-queue before the fair scheduler dispatched it',
+    ['channel', 'tenant'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+IMAGE_CACHE_REQUESTS = Counter(
+    'wearon_image_cache_requests_total',
+    'Preprocessed input image lookups by result (hit = by URL identity, content_hit = by content hash)',
+    ['result'],
+)
+IMAGE_CACHE_BYTES = Gauge(
+    'wearon_image_cache_bytes',
+    'Bytes held by the preprocessed input image cache',
+    ['tier'],
+    multiprocess_mode='livemax',
+)
+
+GENERATION_DEDUP = Counter(
+    'wearon_generation_dedup_total',
+    'Generation result lookups: hit = reused a completed result, coalesced = waited on an identical in-flight task',
+    ['result'],
+)
+
+IMAGE_CPU_SECONDS = Histogram(
+    'wearon_image_cpu_seconds',
+    'CPU time per image stage (decode, resize, encode for inputs; rendition per result rendition)',
+    ['stage'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RENDITION_BYTES = Histogram(
+    'wearon_rendition_bytes',
+    'Encoded size of each result rendition (compare with the full JPEG upload)',
+    ['rendition'],
+    buckets=(8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6),
+)
+IMAGE_PASSTHROUGH = Counter(
+    'wearon_image_passthrough_total',
+    'Input images that already met the size/format constraints and were not re-encoded',
+)
+IMAGE_EXECUTOR_PENDING = Gauge(
+    'wearon_image_executor_pending',
+    'Image jobs running or queued on the CPU executor',
+    multiprocess_mode='livesum',
+)
+
+SUPABASE_CALL_SECONDS = Histogram(
+    'wearon_supabase_call_seconds',
+    'Latency of Supabase calls made by the generation pipeline',
+    ['op'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+CLEANUP_SESSIONS = Counter(
+    'wearon_startup_cleanup_sessions_total',
+    'Stuck sessions marked failed by the startup cleanup',
+    ['table'],
+)
+CLEANUP_CREDITS_REFUNDED = Counter(
+    'wearon_startup_cleanup_credits_refunded_total',
+    'Credits refunded by the startup cleanup',
+    ['table'],
+)
+CLEANUP_IN_PROGRESS = Gauge(
+    'wearon_startup_cleanup_in_progress',
+    '1 while the startup stuck-session cleanup is running',
+    multiprocess_mode='livemax',
+)
+
+QUEUE_DEPTH = Gauge(
+    'wearon_queue_depth',
+    'Payloads waiting in the Redis generation queue after the last consumer pop',
+    multiprocess_mode='livemax',
+)
+GENERATION_IN_FLIGHT = Gauge(
+    'wearon_generation_in_flight',
+    'process_generation tasks currently executing',
+    multiprocess_mode='livesum',
+)
+GENERATION_STAGE_SECONDS = Histogram(
+    'wearon_generation_stage_seconds',
+    'Wall time per generation stage (download and resize are per image)',
+    ['stage'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180, 300, 600),
+)
+GENERATION_OUTCOMES = Counter(
+    'wearon_generation_outcomes_total',
+    'Finished generation attempts by outcome (completed, moderation, failed, rate_limit_retry, deferred)',
+    ['outcome'],
+)
+GENERATION_PEAK_BUFFER_BYTES = Histogram(
+    'wearon_generation_peak_buffer_bytes',
+    'Most image data one generation held at once: prepared inputs plus the OpenAI response buffers',
+    buckets=(256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6, 64e6),
+)
+GENERATION_REFUNDS = Counter(
+    'wearon_generation_refunds_total',
+    'Credits refunded for failed generations',
+)
+OPENAI_TOKENS = Counter(
+    'wearon_openai_tokens_total',
+    'OpenAI image API tokens by kind (text_input, image_input, text_output, image_output)',
+    ['kind'],
+)
+OPENAI_COST_USD = Counter(
+    'wearon_openai_cost_usd_total',
+    'Estimated OpenAI spend in USD',
+)
+
+POSE_QUEUE_WAIT_SECONDS = Histogram(
+    'wearon_pose_queue_wait_seconds',
+    'Time a size-rec frame waited for a free pose worker',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+POSE_INFERENCE_SECONDS = Histogram(
+    'wearon_pose_inference_seconds',
+    'Pose landmark inference time inside a pool worker',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+POSE_POOL_PENDING = Gauge(
+    'wearon_pose_pool_pending',
+    'Size-rec frames queued or running in the pose pool',
+    multiprocess_mode='livesum',
+)
+POSE_POOL_REJECTED = Counter(
+    'wearon_pose_pool_rejected_total',
+    'Size-rec requests rejected because every pose slot stayed busy',
+)
+
+SIZE_REC_CACHE_REQUESTS = Counter(
+    'wearon_size_rec_cache_requests_total',
+    'Landmark cache lookups by result (hit, shared_hit = Redis tier, miss, coalesced = joined an in-flight inference)',
+    ['result'],
+)
+
+REDIS_POOL_IN_USE = Gauge(
+    'wearon_redis_pool_in_use',
+    'Connections checked out of the shared Redis pools',
+    ['pool'],
+    multiprocess_mode='livesum',
+)
+REDIS_CONNECTIONS_OPENED = Counter(
+    'wearon_redis_connections_opened_total',
+    'New connections (TCP + TLS handshake) opened by the shared Redis pools',
+    ['pool'],
+)
+REDIS_POOL_WAIT_SECONDS = Histogram(
+    'wearon_redis_pool_wait_seconds',
+    'Time to check a connection out of a shared Redis pool (waits when the pool is at its limit)',
+    ['pool'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Observe the wall time of one generation stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        GENERATION_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
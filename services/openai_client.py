@@ -1,16 +1,26 @@
 import asyncio
-import base64
-from dataclasses import dataclass
+import importlib.util
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any
 
 import httpx
 import structlog
 
 from config.settings import settings
+from services.circuit_breaker import CircuitOpenError, OpenAICircuitBreaker, get_circuit_breaker
+from services.image_response import ImageResponseParser
+from services.metrics import (
+    OPENAI_COST_USD,
+    OPENAI_HTTP_CONNECTIONS_OPENED,
+    OPENAI_HTTP_REQUESTS,
+    OPENAI_TOKENS,
+)
+from services.rate_limiter import RateLimitTimeout, get_rate_limiter
 
 logger = structlog.get_logger()
 
-OPENAI_API_BASE_URL = 'https://api.openai.com/v1'
-
 MODERATION_ERROR_MESSAGE = (
     'Your image was flagged by the safety filter. '
     'Please use different images that comply with content guidelines.'
@@ -23,6 +33,9 @@ DEFAULT_TRYON_PROMPT = (
     'The clothing should fit naturally and look realistic.'
 )
 
+DEFAULT_QUALITY = 'medium'
+DEFAULT_SIZE = '1024x1536'
+
 # GPT Image 1.5 pricing per 1M tokens (USD)
 _TEXT_INPUT_PRICE = 5.00
 _TEXT_OUTPUT_PRICE = 10.00
@@ -30,6 +43,12 @@ _IMAGE_INPUT_PRICE = 8.00
 _IMAGE_OUTPUT_PRICE = 32.00
 
 
+def resolve_prompt(prompt: str) -> str:
+    """Prompt actually sent to the API: the stripped user prompt or the default try-on prompt."""
+    prompt = prompt.strip() if prompt else ''
+    return prompt or DEFAULT_TRYON_PROMPT
+
+
 def _estimate_cost(usage: dict) -> float | None:
     """Calculate estimated cost from API usage data."""
     input_details = usage.get('input_tokens_details', {})
@@ -50,12 +69,99 @@ def _estimate_cost(usage: dict) -> float | None:
     return round(cost, 6)
 
 
+def _record_usage(input_details: dict, output_details: dict, cost: float | None) -> None:
+    for direction, details in (('input', input_details), ('output', output_details)):
+        for modality in ('text', 'image'):
+            tokens = details.get(f'{modality}_tokens') or 0
+            if tokens:
+                OPENAI_TOKENS.labels(kind=f'{modality}_{direction}').inc(tokens)
+    if cost:
+        OPENAI_COST_USD.inc(cost)
+
+
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def _on_request(request: httpx.Request) -> None:
+    host = request.url.host
+    OPENAI_HTTP_REQUESTS.labels(host=host).inc()
+
+    async def trace(event_name: str, _info: dict[str, Any]) -> None:
+        if event_name == 'connection.connect_tcp.complete':
+            OPENAI_HTTP_CONNECTIONS_OPENED.labels(host=host).inc()
+
+    request.extensions['trace'] = trace
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    http2 = settings.openai_http2
+    if http2 and importlib.util.find_spec('h2') is None:
+        logger.warn('openai_http2_unavailable', hint='install the h2 package to enable HTTP/2')
+        http2 = False
+
+    max_connections = settings.openai_pool_max_connections
+    if settings.worker_pool == 'asyncio':
+        # Each in-flight generation holds an HTTP/1.1 connection for the whole call
+        max_connections = max(max_connections, settings.worker_max_inflight)
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(180.0, pool=settings.openai_pool_timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=settings.openai_pool_max_keepalive,
+            keepalive_expiry=settings.openai_pool_keepalive_expiry,
+        ),
+        event_hooks={'request': [_on_request]},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client used for all OpenAI traffic.
+
+    The pool is bound to the running event loop; a new one is created if the
+    loop changes (e.g. after a fork).
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = _create_http_client()
+        _http_client_loop = loop
+    return _http_client
+
+
+async def warm_up_http_client() -> None:
+    """Open a keep-alive connection to the API before the first task arrives."""
+    try:
+        await get_http_client().head(f'{settings.openai_base_url}/models', timeout=10.0)
+        logger.info('openai_connection_warmed')
+    except httpx.HTTPError as exc:
+        logger.warn('openai_warm_up_failed', error=str(exc))
+
+
+async def close_http_client() -> None:
+    global _http_client, _http_client_loop
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
+
 @dataclass
 class GenerationResult:
-    image_bytes: bytes
+    # The decoded image, positioned at its start; hand it to the upload as is
+    image: io.BytesIO = field(default_factory=io.BytesIO)
     input_tokens: int | None = None
     output_tokens: int | None = None
     estimated_cost_usd: float | None = None
+    # Most response data held at once while reading the image
+    peak_buffer_bytes: int = 0
+
+    @property
+    def image_bytes(self) -> bytes:
+        """A copy of the image; prefer `image` on hot paths."""
+        return self.image.getvalue()
 
 
 class OpenAIImageError(Exception):
@@ -74,8 +180,8 @@ async def generate_tryon(
     image_buffers: list[tuple[str, bytes]],
     prompt: str = '',
     request_id: str = '',
-    quality: str = 'medium',
-    size: str = '1024x1536',
+    quality: str = DEFAULT_QUALITY,
+    size: str = DEFAULT_SIZE,
 ) -> GenerationResult:
     """Call OpenAI GPT Image 1.5 /images/edits with multiple images.
 
@@ -91,18 +197,54 @@ async def generate_tryon(
 
     Raises:
         OpenAIImageError: On API errors including moderation blocks.
+        CircuitOpenError: If the circuit breaker is open, or opened while retrying.
     """
-    prompt = prompt.strip() if prompt else ''
-    if not prompt:
-        prompt = DEFAULT_TRYON_PROMPT
+    breaker = get_circuit_breaker()
+    if breaker is None:
+        return await _request_tryon(image_buffers, prompt, request_id, quality, size, None, None)
+
+    # Admitted only now, so a half-open probe is always an actual OpenAI call
+    admission = await breaker.admit()
+    if not admission.allowed:
+        raise CircuitOpenError('OpenAI circuit breaker is open', admission.wait_seconds)
+    try:
+        return await _request_tryon(image_buffers, prompt, request_id, quality, size, breaker, admission.probe)
+    finally:
+        if admission.probe is not None:
+            # Frees the half-open slot if the probe ended without a verdict (429, moderation, bad body)
+            await breaker.release_probe(admission.probe)
+
+
+async def _request_tryon(
+    image_buffers: list[tuple[str, bytes]],
+    prompt: str,
+    request_id: str,
+    quality: str,
+    size: str,
+    breaker: OpenAICircuitBreaker | None,
+    probe: str | None,
+) -> GenerationResult:
+    prompt = resolve_prompt(prompt)
 
     log = logger.bind(request_id=request_id)
     max_retries = settings.openai_max_retries
+    limiter = get_rate_limiter()
 
     for attempt in range(1, max_retries + 1):
         try:
+            # Retries stop once the breaker opens, e.g. because this call's first attempt failed as the probe
+            if attempt > 1 and breaker is not None and await breaker.is_open():
+                log.warn('openai_retry_circuit_open', attempt=attempt)
+                raise CircuitOpenError('OpenAI circuit breaker is open', settings.openai_breaker_open_seconds)
+
             log.info('openai_attempt', attempt=attempt, max_retries=max_retries)
 
+            try:
+                await limiter.acquire()
+            except RateLimitTimeout as exc:
+                log.warn('openai_rate_limit_wait_exceeded', error=str(exc))
+                raise OpenAIImageError('Rate limit exceeded', 429)
+
             files = []
             for filename, buf in image_buffers:
                 files.append(('image[]', (filename, buf, 'image/jpeg')))
@@ -115,30 +257,41 @@ async def generate_tryon(
                 'n': '1',
             }
 
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                response = await client.post(
-                    f'{OPENAI_API_BASE_URL}/images/edits',
-                    headers={'Authorization': f'Bearer {settings.openai_api_key}'},
-                    data=data,
-                    files=files,
-                )
-
-            if response.status_code == 429:
-                raise OpenAIImageError('Rate limit exceeded', 429)
-
-            if response.status_code == 400:
-                try:
-                    body = response.json()
-                    error_code = body.get('error', {}).get('code', '')
-                except (ValueError, KeyError):
-                    error_code = ''
-                if error_code == 'moderation_blocked':
-                    log.warn('openai_moderation_blocked')
-                    raise OpenAIImageError(MODERATION_ERROR_MESSAGE, 400, is_moderation_error=True)
-
-            response.raise_for_status()
-
-            body = response.json()
+            client = get_http_client()
+            parser = ImageResponseParser()
+            started = time.monotonic()
+            async with client.stream(
+                'POST',
+                f'{settings.openai_base_url}/images/edits',
+                headers={'Authorization': f'Bearer {settings.openai_api_key}'},
+                data=data,
+                files=files,
+            ) as response:
+                if response.status_code == 429:
+                    await limiter.record_throttle(response.headers)
+                    raise OpenAIImageError('Rate limit exceeded', 429)
+
+                if response.status_code == 400:
+                    await response.aread()
+                    try:
+                        body = response.json()
+                        error_code = body.get('error', {}).get('code', '')
+                    except (ValueError, KeyError):
+                        error_code = ''
+                    if error_code == 'moderation_blocked':
+                        log.warn('openai_moderation_blocked')
+                        raise OpenAIImageError(MODERATION_ERROR_MESSAGE, 400, is_moderation_error=True)
+
+                response.raise_for_status()
+                await limiter.record_success(response.headers)
+
+                # Decode the base64 image as it streams in rather than holding the body,
+                # the JSON string and the decoded bytes at once
+                async for chunk in response.aiter_bytes():
+                    parser.feed(chunk)
+            body = parser.close()
+            if breaker is not None:
+                await breaker.record_success(time.monotonic() - started, probe)
 
             # Log token usage and estimated cost
             usage = body.get('usage', {})
@@ -146,6 +299,7 @@ async def generate_tryon(
                 input_details = usage.get('input_tokens_details', {})
                 output_details = usage.get('output_tokens_details', {})
                 cost = _estimate_cost(usage)
+                _record_usage(input_details, output_details, cost)
                 log.info(
                     'openai_usage',
                     total_tokens=usage.get('total_tokens'),
@@ -159,33 +313,35 @@ async def generate_tryon(
                 )
 
             usage_result = GenerationResult(
-                image_bytes=b'',
                 input_tokens=usage.get('input_tokens'),
                 output_tokens=usage.get('output_tokens'),
                 estimated_cost_usd=cost if usage else None,
+                peak_buffer_bytes=parser.peak_bytes,
             )
 
-            b64_data = body['data'][0].get('b64_json')
-            if b64_data:
+            if parser.decoded_bytes:
                 log.info('openai_success', format='base64')
-                usage_result.image_bytes = base64.b64decode(b64_data)
+                usage_result.image = parser.image
                 return usage_result
 
             image_url = body['data'][0].get('url')
             if image_url:
                 log.info('openai_success', format='url')
-                async with httpx.AsyncClient(timeout=30.0) as dl:
-                    dl_resp = await dl.get(image_url)
-                    dl_resp.raise_for_status()
-                    usage_result.image_bytes = dl_resp.content
-                    return usage_result
+                dl_resp = await client.get(image_url, timeout=30.0)
+                dl_resp.raise_for_status()
+                # BytesIO shares the response's bytes rather than copying them
+                usage_result.image = io.BytesIO(dl_resp.content)
+                usage_result.peak_buffer_bytes = max(parser.peak_bytes, len(dl_resp.content))
+                return usage_result
 
             raise OpenAIImageError('No image data in response')
 
-        except OpenAIImageError:
+        except (OpenAIImageError, CircuitOpenError):
             raise
         except httpx.HTTPStatusError as exc:
             status = exc.response.status_code
+            if status >= 500 and breaker is not None:
+                await breaker.record_failure(probe)
             if status >= 500 and attempt < max_retries:
                 delay = 2 ** attempt
                 log.warn('openai_server_error', status=status, retry_delay=delay)
@@ -193,6 +349,8 @@ async def generate_tryon(
                 continue
             raise OpenAIImageError(f'API error: {exc}', status)
         except (httpx.TransportError, httpx.TimeoutException, ConnectionError, OSError) as exc:
+            if breaker is not None:
+                await breaker.record_failure(probe)
             if attempt < max_retries:
                 delay = 2 ** attempt
                 log.warn('openai_network_error', error=str(exc), retry_delay=delay)
@@ -0,0 +1,195 @@
+import asyncio
+import re
+import time
+from collections.abc import Mapping
+
+import redis.asyncio as aioredis
+import structlog
+
+from config.settings import settings
+from services.metrics import OPENAI_RATE_LIMIT_RPM, OPENAI_RATE_LIMIT_THROTTLES, OPENAI_RATE_LIMIT_WAIT
+from services.redis_client import get_async_redis
+
+logger = structlog.get_logger()
+
+RATE_LIMIT_KEY = 'wearon:ratelimit:openai'
+
+# Token bucket shared by every worker. Uses the Redis server clock so that
+# skew between worker hosts does not distort the refill rate.
+# KEYS[1] = bucket hash; ARGV = default_rpm, burst
+# Returns {wait_ms, current_rpm}
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[1])
+local burst = tonumber(ARGV[2])
+local blocked_until = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if blocked_until > now then
+  return {blocked_until - now, tostring(rate)}
+end
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or burst)
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 60000)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = math.ceil((1 - tokens) * 60000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now, 'rate', tostring(rate))
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return {wait, tostring(rate)}
+"""
+
+# AIMD feedback: multiplicative decrease on throttling, additive increase on
+# success, plus an optional cluster-wide pause taken from response headers.
+# KEYS[1] = bucket hash; ARGV = op, pause_ms, min_rpm, max_rpm, decrease_factor, increase_step
+# Returns current_rpm
+_FEEDBACK_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[4])
+local min_rate = tonumber(ARGV[3])
+local max_rate = tonumber(ARGV[4])
+if ARGV[1] == 'throttle' then
+  rate = math.max(min_rate, rate * tonumber(ARGV[5]))
+  redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', now)
+elseif ARGV[1] == 'success' then
+  rate = math.min(max_rate, rate + tonumber(ARGV[6]))
+end
+local pause = tonumber(ARGV[2])
+if pause > 0 then
+  local blocked_until = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+  redis.call('HSET', KEYS[1], 'blocked_until', math.max(blocked_until, now + pause))
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+redis.call('PEXPIRE', KEYS[1], 3600000)
+return tostring(rate)
+"""
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no request slot became available within the allowed wait."""
+
+
+def parse_reset_duration(value: str) -> float | None:
+    """Parse OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def pause_from_headers(headers: Mapping[str, str]) -> float:
+    """Seconds all workers should hold off, derived from rate limit response headers."""
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+
+    remaining = headers.get('x-ratelimit-remaining-requests')
+    reset = headers.get('x-ratelimit-reset-requests')
+    if remaining is not None and reset:
+        try:
+            if int(remaining) <= 0:
+                return parse_reset_duration(reset) or 0.0
+        except ValueError:
+            pass
+
+    return 0.0
+
+
+class OpenAIRateLimiter:
+    """Cluster-wide adaptive token bucket for OpenAI requests.
+
+    Fails open: if Redis is unavailable the request proceeds and OpenAI's own
+    429s remain the backstop.
+    """
+
+    def __init__(self, redis_url: str, key: str = RATE_LIMIT_KEY) -> None:
+        self.redis_url = redis_url
+        self.key = key
+
+    def _redis(self) -> aioredis.Redis:
+        return get_async_redis(self.redis_url)
+
+    async def acquire(self, max_wait: float | None = None) -> None:
+        """Wait for a request slot, raising RateLimitTimeout after max_wait seconds."""
+        if max_wait is None:
+            max_wait = settings.openai_rate_limit_max_wait
+        started = time.monotonic()
+
+        while True:
+            try:
+                wait_ms, rate = await self._redis().eval(
+                    _ACQUIRE_SCRIPT,
+                    1,
+                    self.key,
+                    settings.openai_rate_limit_rpm,
+                    settings.openai_rate_limit_burst,
+                )
+            except Exception as exc:
+                logger.warn('rate_limiter_unavailable', error=str(exc))
+                return
+
+            OPENAI_RATE_LIMIT_RPM.set(float(rate))
+            waited = time.monotonic() - started
+            if int(wait_ms) <= 0:
+                OPENAI_RATE_LIMIT_WAIT.observe(waited)
+                return
+
+            delay = int(wait_ms) / 1000
+            if waited + delay > max_wait:
+                OPENAI_RATE_LIMIT_WAIT.observe(waited)
+                raise RateLimitTimeout(f'No OpenAI request slot within {max_wait:.0f}s')
+            await asyncio.sleep(delay)
+
+    async def record_success(self, headers: Mapping[str, str]) -> None:
+        await self._feedback('success', pause_from_headers(headers))
+
+    async def record_throttle(self, headers: Mapping[str, str]) -> None:
+        OPENAI_RATE_LIMIT_THROTTLES.inc()
+        await self._feedback('throttle', pause_from_headers(headers))
+
+    async def _feedback(self, op: str, pause_seconds: float) -> None:
+        try:
+            rate = await self._redis().eval(
+                _FEEDBACK_SCRIPT,
+                1,
+                self.key,
+                op,
+                int(pause_seconds * 1000),
+                settings.openai_rate_limit_min_rpm,
+                settings.openai_rate_limit_rpm,
+                settings.openai_rate_limit_decrease_factor,
+                settings.openai_rate_limit_recovery_step,
+            )
+        except Exception as exc:
+            logger.warn('rate_limiter_unavailable', error=str(exc))
+            return
+
+        OPENAI_RATE_LIMIT_RPM.set(float(rate))
+        if op == 'throttle':
+            logger.warn('openai_rate_reduced', current_rpm=float(rate), pause_seconds=pause_seconds)
+
+
+_rate_limiter: OpenAIRateLimiter | None = None
+
+
+def get_rate_limiter() -> OpenAIRateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = OpenAIRateLimiter(settings.redis_url)
+    return _rate_limiter
@@ -1,4 +1,106 @@
-import os
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any
+
+import redis
+import redis.asyncio as aioredis
+
+from config.settings import settings
+from services.metrics import REDIS_CONNECTIONS_OPENED, REDIS_POOL_IN_USE, REDIS_POOL_WAIT_SECONDS
+
+
+class _TrackedPool(redis.BlockingConnectionPool):
+    """Blocking pool that exports checkouts, wait time and new connections."""
+
+    metric_pool = 'sync'
+
+    def make_connection(self):
+        REDIS_CONNECTIONS_OPENED.labels(pool=self.metric_pool).inc()
+        return super().make_connection()
+
+    def get_connection(self, *args: Any, **kwargs: Any):
+        started = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        REDIS_POOL_WAIT_SECONDS.labels(pool=self.metric_pool).observe(time.perf_counter() - started)
+        REDIS_POOL_IN_USE.labels(pool=self.metric_pool).inc()
+        return connection
+
+    def release(self, connection) -> None:
+        REDIS_POOL_IN_USE.labels(pool=self.metric_pool).dec()
+        super().release(connection)
+
+
+class _TrackedAsyncPool(aioredis.BlockingConnectionPool):
+    metric_pool = 'async'
+
+    def make_connection(self):
+        REDIS_CONNECTIONS_OPENED.labels(pool=self.metric_pool).inc()
+        return super().make_connection()
+
+    async def get_connection(self, *args: Any, **kwargs: Any):
+        started = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        REDIS_POOL_WAIT_SECONDS.labels(pool=self.metric_pool).observe(time.perf_counter() - started)
+        REDIS_POOL_IN_USE.labels(pool=self.metric_pool).inc()
+        return connection
+
+    async def release(self, connection) -> None:
+        REDIS_POOL_IN_USE.labels(pool=self.metric_pool).dec()
+        await super().release(connection)
+
+
+def _pool_options(decode_responses: bool) -> dict[str, Any]:
+    # No socket_timeout: the consumer's BRPOP legitimately blocks for seconds
+    return {
+        'max_connections': settings.redis_max_connections,
+        'timeout': settings.redis_pool_timeout_seconds,
+        'socket_keepalive': True,
+        'socket_connect_timeout': 5.0,
+        'health_check_interval': settings.redis_health_check_interval_seconds,
+        'decode_responses': decode_responses,
+    }
+
+
+_lock = threading.Lock()
+_sync_clients: dict[tuple[str, bool], redis.Redis] = {}
+# Async connections belong to the event loop that opened them, so pools are per loop
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, bool], aioredis.Redis]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_sync_redis(url: str | None = None, decode_responses: bool = True) -> redis.Redis:
+    """Process-wide pooled client; connections (and their TLS sessions) are reused across calls."""
+    key = (url or settings.redis_url, decode_responses)
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            pool = _TrackedPool.from_url(key[0], **_pool_options(decode_responses))
+            client = _sync_clients[key] = redis.Redis(connection_pool=pool)
+        return client
+
+
+def get_async_redis(url: str | None = None, decode_responses: bool = True) -> aioredis.Redis:
+    """Pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (url or settings.redis_url, decode_responses)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            pool = _TrackedAsyncPool.from_url(key[0], **_pool_options(decode_responses))
+            client = clients[key] = aioredis.Redis(connection_pool=pool)
+        return client
+
+
+async def close_async_redis() -> None:
+    """Disconnect the pools opened on the running event loop."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.connection_pool.disconnect()
 
 
 class RedisHealthClient:
@@ -7,22 +109,13 @@ class RedisHealthClient:
 
     @classmethod
     def from_env(cls) -> 'RedisHealthClient':
-        return cls(os.getenv('REDIS_URL'))
+        return cls(settings.redis_url)
 
     async def ping(self) -> bool:
         if not self.url:
             return False
 
         try:
-            import redis.asyncio as redis
+            return bool(await get_async_redis(self.url).ping())
         except Exception:
             return False
-
-        try:
-            client = redis.from_url(self.url, decode_responses=True)
-            result = await client.ping()
-            await client.aclose()
-            return bool(result)
-        except Exception:
-            return False
-
@@ -0,0 +1,196 @@
+import asyncio
+import io
+import time
+from dataclasses import dataclass
+from functools import cache
+from typing import Any
+
+import structlog
+from PIL import Image, features
+
+from config.settings import settings
+from services.image_executor import get_image_executor
+from services.metrics import IMAGE_CPU_SECONDS, RENDITION_BYTES, track_stage
+from services.session_store import track_supabase_call
+
+logger = structlog.get_logger()
+
+# format -> (Pillow format, extension, content type, save options)
+FORMATS: dict[str, tuple[str, str, str, dict[str, Any]]] = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 55, 'speed': 8}),
+}
+
+
+@dataclass(frozen=True)
+class RenditionSpec:
+    format: str
+    # Longest side in pixels; None keeps the generated size
+    max_px: int | None = None
+
+    @property
+    def name(self) -> str:
+        return f'{self.format}_{self.max_px or "full"}'
+
+    @property
+    def content_type(self) -> str:
+        return FORMATS[self.format][2]
+
+    def path_for(self, storage_path: str) -> str:
+        """Sibling of the original object, e.g. generated/u/s.jpg -> generated/u/s.512.webp."""
+        stem = storage_path.rsplit('.', 1)[0]
+        return f'{stem}.{self.max_px or "full"}.{FORMATS[self.format][1]}'
+
+
+@dataclass(frozen=True)
+class Rendition:
+    spec: RenditionSpec
+    data: bytes
+    width: int
+    height: int
+
+
+def parse_renditions(value: str) -> list[RenditionSpec]:
+    """Parse 'format:size' entries such as 'webp:full,jpeg:full,webp:512'.
+
+    Unknown formats, bad sizes and formats this Pillow build cannot encode are
+    logged and skipped rather than failing every generation.
+    """
+    specs: list[RenditionSpec] = []
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        fmt, _, size = entry.lower().partition(':')
+        if fmt not in FORMATS:
+            logger.warn('rendition_spec_invalid', spec=entry, reason='unknown format')
+            continue
+        if fmt != 'jpeg' and not features.check(fmt):
+            logger.warn('rendition_spec_invalid', spec=entry, reason=f'Pillow was built without {fmt} support')
+            continue
+        if size in ('', 'full'):
+            max_px = None
+        elif size.isdigit() and int(size) > 0:
+            max_px = int(size)
+        else:
+            logger.warn('rendition_spec_invalid', spec=entry, reason='size must be a pixel count or "full"')
+            continue
+        spec = RenditionSpec(fmt, max_px)
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+@cache
+def configured_renditions() -> tuple[RenditionSpec, ...]:
+    return tuple(parse_renditions(settings.result_renditions))
+
+
+def encode_rendition(image_bytes: bytes, spec: RenditionSpec) -> tuple[Rendition, float]:
+    """Encode one rendition; returns it with the CPU seconds spent."""
+    started = time.thread_time()
+    img = Image.open(io.BytesIO(image_bytes))
+    if spec.max_px is not None and max(img.size) > spec.max_px:
+        scale = spec.max_px / max(img.size)
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        if img.format == 'JPEG':
+            # Let libjpeg drop most of the pixels during decode for small thumbnails
+            img.draft('RGB', target)
+        img = img.resize(target, Image.LANCZOS)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    pil_format, _ext, _content_type, options = FORMATS[spec.format]
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, **options)
+    return Rendition(spec, buf.getvalue(), img.width, img.height), time.thread_time() - started
+
+
+async def create_renditions(image_bytes: bytes, specs: tuple[RenditionSpec, ...]) -> list[Rendition]:
+    """Encode every rendition in parallel on the image CPU executor, in spec order."""
+    executor = get_image_executor()
+    results = await asyncio.gather(*(executor.run(encode_rendition, image_bytes, spec) for spec in specs))
+    renditions = []
+    for rendition, cpu_seconds in results:
+        IMAGE_CPU_SECONDS.labels(stage='rendition').observe(cpu_seconds)
+        RENDITION_BYTES.labels(rendition=rendition.spec.name).observe(len(rendition.data))
+        renditions.append(rendition)
+    return renditions
+
+
+def session_entry(spec: RenditionSpec, path: str, width: int | None = None, height: int | None = None) -> dict:
+    """What the session records per rendition under image_renditions."""
+    entry: dict[str, Any] = {'path': path, 'content_type': spec.content_type}
+    if width is not None:
+        entry.update(width=width, height=height)
+    return entry
+
+
+async def store_renditions(
+    bucket: Any, image_bytes: bytes, storage_path: str, log: structlog.stdlib.BoundLogger,
+) -> dict[str, dict]:
+    """Encode the configured renditions and upload them concurrently next to storage_path.
+
+    Renditions are an optimisation for clients, so an encode or upload failure
+    is logged and that rendition left out rather than failing the generation.
+    """
+    specs = configured_renditions()
+    if not specs:
+        return {}
+    with track_stage('renditions'):
+        return await _store(bucket, image_bytes, storage_path, specs, log)
+
+
+async def _store(
+    bucket: Any,
+    image_bytes: bytes,
+    storage_path: str,
+    specs: tuple[RenditionSpec, ...],
+    log: structlog.stdlib.BoundLogger,
+) -> dict[str, dict]:
+    try:
+        renditions = await create_renditions(image_bytes, specs)
+    except Exception as exc:
+        log.warn('renditions_encode_failed', error=str(exc))
+        return {}
+
+    async def upload(rendition: Rendition) -> dict:
+        path = rendition.spec.path_for(storage_path)
+        with track_supabase_call('upload_rendition'):
+            await asyncio.to_thread(bucket.upload, path, rendition.data, {'content-type': rendition.spec.content_type})
+        return session_entry(rendition.spec, path, rendition.width, rendition.height)
+
+    results = await asyncio.gather(*(upload(r) for r in renditions), return_exceptions=True)
+    return _collect(specs, results, log)
+
+
+async def copy_renditions(
+    bucket: Any, source_path: str, storage_path: str, log: structlog.stdlib.BoundLogger,
+) -> dict[str, dict]:
+    """Copy a reused result's renditions; ones the source never had are skipped."""
+    specs = configured_renditions()
+    if not specs:
+        return {}
+
+    async def copy(spec: RenditionSpec) -> dict:
+        path = spec.path_for(storage_path)
+        if source_path != storage_path:
+            with track_supabase_call('copy_rendition'):
+                await asyncio.to_thread(bucket.copy, spec.path_for(source_path), path)
+        return session_entry(spec, path)
+
+    with track_stage('renditions'):
+        results = await asyncio.gather(*(copy(spec) for spec in specs), return_exceptions=True)
+    return _collect(specs, results, log)
+
+
+def _collect(
+    specs: tuple[RenditionSpec, ...], results: list[dict | BaseException], log: structlog.stdlib.BoundLogger,
+) -> dict[str, dict]:
+    entries: dict[str, dict] = {}
+    for spec, result in zip(specs, results):
+        if isinstance(result, Exception):
+            log.warn('rendition_store_failed', rendition=spec.name, error=str(result))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            entries[spec.name] = result
+    return entries
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Literal
+
+import redis
+import redis.asyncio as aioredis
+import structlog
+
+from config.settings import settings
+from services.metrics import GENERATION_DEDUP
+from services.redis_client import get_async_redis, get_sync_redis
+
+logger = structlog.get_logger()
+
+RESULT_KEY_PREFIX = 'wearon:result:'
+LOCK_KEY_PREFIX = 'wearon:result:lock:'
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Extend the lock's expiry only if we still own it
+_REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+DedupOutcome = Literal['hit', 'coalesced', 'miss']
+
+
+def result_cache_key(
+    image_buffers: list[tuple[str, bytes]],
+    prompt: str,
+    quality: str,
+    size: str,
+) -> str:
+    """Identity of a generation: preprocessed input hashes (in order) plus the request parameters."""
+    digest = hashlib.sha256()
+    for filename, buf in image_buffers:
+        digest.update(filename.encode('utf-8'))
+        digest.update(hashlib.sha256(buf).digest())
+    for part in (prompt, quality, size):
+        digest.update(b'\0')
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+
+@dataclass
+class DedupClaim:
+    key: str
+    outcome: DedupOutcome
+    cached_path: str | None = None
+    lock_token: str | None = None
+    # Set by release() to stop the thread keeping the lock alive while the leader works
+    stop_refresh: threading.Event | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def owns_lock(self) -> bool:
+        return self.lock_token is not None
+
+
+class ResultCache:
+    """Redis index of completed generations plus a per-key in-flight lock.
+
+    The first task for a key takes the lock and calls OpenAI; identical tasks
+    arriving meanwhile poll until the leader publishes its storage path, or
+    take over if the leader fails and releases the lock. A thread refreshes the
+    leader's lock every third of RESULT_DEDUP_LOCK_SECONDS until it releases
+    it, including while the task blocks outside the event loop, so a slow
+    generation is never taken over; a leader that dies stops refreshing and
+    its lock lapses. A follower that has waited RESULT_DEDUP_WAIT_SECONDS
+    checks the result and the lock once more, then generates without the lock.
+    """
+
+    def __init__(self, redis_url: str) -> None:
+        self.redis_url = redis_url
+
+    def _redis(self) -> aioredis.Redis:
+        return get_async_redis(self.redis_url)
+
+    def _sync_redis(self) -> redis.Redis:
+        return get_sync_redis(self.redis_url)
+
+    async def _try_lock(self, key: str) -> str | None:
+        token = uuid.uuid4().hex
+        locked = await self._redis().set(
+            LOCK_KEY_PREFIX + key,
+            token,
+            nx=True,
+            ex=settings.result_dedup_lock_seconds,
+        )
+        return token if locked else None
+
+    def _lead(self, key: str, token: str) -> DedupClaim:
+        GENERATION_DEDUP.labels(result='miss').inc()
+        stop = threading.Event()
+        threading.Thread(
+            target=self._refresh, args=(key, token, stop), name='dedup-lock-refresh', daemon=True,
+        ).start()
+        return DedupClaim(key, 'miss', lock_token=token, stop_refresh=stop)
+
+    def _refresh(self, key: str, token: str, stop: threading.Event) -> None:
+        lock_ms = int(settings.result_dedup_lock_seconds * 1000)
+        while not stop.wait(settings.result_dedup_lock_seconds / 3):
+            try:
+                refreshed = self._sync_redis().eval(_REFRESH_SCRIPT, 1, LOCK_KEY_PREFIX + key, token, lock_ms)
+            except Exception as exc:
+                logger.warn('result_cache_unavailable', error=str(exc))
+                continue
+            if not refreshed:
+                logger.warn('generation_dedup_lock_lost', dedup_key=key[:16])
+                return
+
+    async def acquire(self, key: str) -> DedupClaim:
+        """Return a completed result for key, wait for an in-flight one, or claim the key."""
+        try:
+            cached = await self._redis().get(RESULT_KEY_PREFIX + key)
+            if cached:
+                GENERATION_DEDUP.labels(result='hit').inc()
+                return DedupClaim(key, 'hit', cached_path=cached)
+
+            token = await self._try_lock(key)
+            if token:
+                return self._lead(key, token)
+
+            logger.info('generation_coalescing', dedup_key=key[:16])
+            deadline = time.monotonic() + settings.result_dedup_wait_seconds
+            while True:
+                await asyncio.sleep(settings.result_dedup_poll_seconds)
+                cached = await self._redis().get(RESULT_KEY_PREFIX + key)
+                if cached:
+                    GENERATION_DEDUP.labels(result='coalesced').inc()
+                    return DedupClaim(key, 'coalesced', cached_path=cached)
+                token = await self._try_lock(key)
+                if token:
+                    return self._lead(key, token)
+                # The last poll after the deadline is the re-check before generating anyway
+                if time.monotonic() >= deadline:
+                    logger.warn('generation_dedup_wait_expired', dedup_key=key[:16])
+                    break
+        except Exception as exc:
+            logger.warn('result_cache_unavailable', error=str(exc))
+
+        GENERATION_DEDUP.labels(result='miss').inc()
+        return DedupClaim(key, 'miss')
+
+    async def store(self, key: str, storage_path: str) -> None:
+        try:
+            await self._redis().set(RESULT_KEY_PREFIX + key, storage_path, ex=settings.result_dedup_ttl_seconds)
+        except Exception as exc:
+            logger.warn('result_cache_unavailable', error=str(exc))
+
+    async def forget(self, key: str) -> None:
+        try:
+            await self._redis().delete(RESULT_KEY_PREFIX + key)
+        except Exception as exc:
+            logger.warn('result_cache_unavailable', error=str(exc))
+
+    async def release(self, claim: DedupClaim) -> None:
+        if not claim.owns_lock:
+            return
+        if claim.stop_refresh is not None:
+            claim.stop_refresh.set()
+        try:
+            await self._redis().eval(_RELEASE_SCRIPT, 1, LOCK_KEY_PREFIX + claim.key, claim.lock_token)
+        except Exception as exc:
+            logger.warn('result_cache_unavailable', error=str(exc))
+
+
+_result_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache | None:
+    global _result_cache
+    if not settings.result_dedup_enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(settings.redis_url)
+    return _result_cache
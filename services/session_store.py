@@ -0,0 +1,156 @@
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import structlog
+from postgrest.exceptions import APIError
+
+from models.generation import SessionStatus
+from models.task_payload import GenerationTask
+from services.metrics import GENERATION_REFUNDS, SUPABASE_CALL_SECONDS, track_stage
+from services.supabase_client import get_supabase
+
+logger = structlog.get_logger()
+
+FINALIZE_RPC = 'finalize_generation_session'
+
+# Statuses a task may claim from; a failed (cleaned up) or completed session is left alone
+CLAIMABLE_STATUSES = ['queued', 'processing']
+
+# ISO timestamp of this worker's start, set by main.py for every process it spawns
+STARTUP_CUTOFF_ENV = 'WEARON_STARTUP_CUTOFF'
+
+_finalize_rpc_available = True
+
+
+def get_session_table(channel: str) -> str:
+    return 'store_generation_sessions' if channel == 'b2b' else 'generation_sessions'
+
+
+def get_owner_id(task: GenerationTask) -> str | None:
+    return task.store_id if task.channel == 'b2b' else task.user_id
+
+
+@contextmanager
+def track_supabase_call(op: str) -> Iterator[None]:
+    """Record the latency of one Supabase round trip."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SUPABASE_CALL_SECONDS.labels(op=op).observe(time.perf_counter() - start)
+
+
+def claim_session(task: GenerationTask) -> bool:
+    """Move a session to 'processing' in one conditional update.
+
+    Returns False when the session is missing, already failed (e.g. by the
+    startup cleanup) or already completed, in which case the task must not run.
+    Sessions created before the startup cutoff are left to the cleanup, which
+    compares the same created_at column, so the two never work on one session.
+    """
+    supabase = get_supabase()
+    query = (
+        supabase.table(get_session_table(task.channel))
+        .update({'status': 'processing'})
+        .eq('id', task.session_id)
+        .in_('status', CLAIMABLE_STATUSES)
+    )
+    cutoff = os.environ.get(STARTUP_CUTOFF_ENV)
+    if cutoff:
+        query = query.gte('created_at', cutoff)
+    with track_supabase_call('claim'):
+        result = query.execute()
+    return bool(result.data)
+
+
+def refund_credit(task: GenerationTask, log: structlog.stdlib.BoundLogger) -> None:
+    """Refund 1 credit to the task owner."""
+    try:
+        supabase = get_supabase()
+        owner_id = get_owner_id(task)
+        if owner_id:
+            if task.channel == 'b2b':
+                rpc, params = 'refund_store_credits', {
+                    'p_store_id': owner_id, 'p_amount': 1, 'p_request_id': task.request_id,
+                }
+            else:
+                rpc, params = 'refund_credits', {'p_user_id': owner_id, 'p_amount': 1}
+            with track_supabase_call('refund'):
+                supabase.rpc(rpc, params).execute()
+            GENERATION_REFUNDS.inc()
+            log.info('credit_refunded', owner_id=owner_id)
+    except Exception:
+        log.exception('refund_error')
+
+
+def finalize_session(
+    task: GenerationTask,
+    status: SessionStatus,
+    fields: dict[str, Any],
+    refund: bool,
+    log: structlog.stdlib.BoundLogger,
+) -> bool:
+    """Write the terminal session state, plus the credit refund on failure, in one call.
+
+    Uses the finalize_generation_session RPC so the status write and refund are
+    atomic. Deployments that do not have the function yet fall back to a
+    conditional update followed by the refund. Returns False, without writing
+    or refunding anything, when the session is no longer 'processing'.
+    """
+    with track_stage('finalize'):
+        applied = _finalize(task, status, fields, refund, log)
+    if not applied:
+        log.warn('generation_finalize_skipped', status=status)
+    return applied
+
+
+def _finalize(
+    task: GenerationTask,
+    status: SessionStatus,
+    fields: dict[str, Any],
+    refund: bool,
+    log: structlog.stdlib.BoundLogger,
+) -> bool:
+    global _finalize_rpc_available
+    supabase = get_supabase()
+
+    if _finalize_rpc_available:
+        params = {
+            'p_channel': task.channel,
+            'p_session_id': task.session_id,
+            'p_status': status,
+            'p_fields': fields,
+            'p_refund_owner_id': get_owner_id(task) if refund else None,
+            'p_request_id': task.request_id,
+        }
+        try:
+            with track_supabase_call('finalize'):
+                applied = supabase.rpc(FINALIZE_RPC, params).execute().data is True
+            if applied and refund:
+                GENERATION_REFUNDS.inc()
+                log.info('credit_refunded', owner_id=get_owner_id(task))
+            return applied
+        except APIError as exc:
+            # PGRST202: function not found in the schema cache
+            if exc.code != 'PGRST202':
+                raise
+            _finalize_rpc_available = False
+            log.warn('finalize_rpc_unavailable_falling_back')
+
+    with track_supabase_call('finalize'):
+        updated = (
+            supabase.table(get_session_table(task.channel))
+            .update({'status': status, **fields})
+            .eq('id', task.session_id)
+            .eq('status', 'processing')
+            .execute()
+            .data
+        )
+    if not updated:
+        return False
+    if refund:
+        refund_credit(task, log)
+    return True
@@ -1,16 +1,37 @@
+import asyncio
 import hashlib
+import time
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from typing import Any
 from uuid import uuid4
 
 import httpx
 import structlog
 from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from prometheus_fastapi_instrumentator import Instrumentator
 
-from models.size_rec import EstimateBodyRequest, EstimateBodyResponse, HealthResponse
-from services.redis_client import RedisHealthClient
-from size_rec.image_processing import ImageDownloadError, download_and_prepare_image
-from size_rec.mediapipe_service import MediaPipeService, ModelNotLoadedError, PoseEstimationError
+from config.settings import settings
+from models.size_rec import (
+    EstimateBodyBatchItem,
+    EstimateBodyBatchRequest,
+    EstimateBodyRequest,
+    EstimateBodyResponse,
+    HealthResponse,
+)
+from services.image_cache import content_key
+from services.redis_client import RedisHealthClient, close_async_redis
+from size_rec.health import Check, HealthProber
+from size_rec.image_processing import (
+    ImageDownloadError,
+    create_download_client,
+    download_image_bytes,
+    prepare_image,
+)
+from size_rec.landmark_cache import get_landmark_cache
+from size_rec.mediapipe_service import Landmarks, ModelNotLoadedError, PoseEstimationError
+from size_rec.pose_pool import PosePool, PosePoolBusyError, create_pose_pool
 from size_rec.size_calculator import calculate_size_recommendation
 from worker.celery_app import celery_app
 
@@ -18,15 +39,27 @@ structlog.configure(processors=[structlog.processors.JSONRenderer()])
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    # Load once and keep warm in memory for low-latency /estimate-body requests.
-    get_mediapipe_service()
-    yield
+    # Load one landmarker per pool worker and keep them warm for low-latency /estimate-body requests.
+    global _pose_pool, _health_prober
+    _pose_pool = create_pose_pool()
+    await _pose_pool.start()
+    _health_prober = create_health_prober()
+    await _health_prober.start()
+    try:
+        yield
+    finally:
+        await _health_prober.stop()
+        _health_prober = None
+        _pose_pool.shutdown()
+        _pose_pool = None
+        await close_async_redis()
 
 
 app = FastAPI(title='WearOn Worker Size Recommendation API', lifespan=lifespan)
 Instrumentator().instrument(app).expose(app)
 
-_mediapipe_service: MediaPipeService | None = None
+_pose_pool: PosePool | None = None
+_health_prober: HealthProber | None = None
 _redis_client = RedisHealthClient.from_env()
 
 MONITORING_ENDPOINTS = {
@@ -45,11 +78,45 @@ async def _check_http(url: str) -> bool:
         return False
 
 
-def get_mediapipe_service() -> MediaPipeService:
-    global _mediapipe_service
-    if _mediapipe_service is None:
-        _mediapipe_service = MediaPipeService.get_instance()
-    return _mediapipe_service
+def _ping_celery() -> bool:
+    return len(celery_app.control.ping(timeout=2.0)) > 0
+
+
+def create_health_prober() -> HealthProber:
+    core_interval = settings.health_probe_interval_seconds
+    monitoring_interval = settings.health_monitoring_probe_interval_seconds
+    checks: dict[str, tuple[Check, float]] = {
+        'redis': (lambda: _redis_client.ping(), core_interval),
+        # control.ping blocks for its whole timeout, so keep it off the event loop
+        'celery': (lambda: asyncio.to_thread(_ping_celery), core_interval),
+    }
+    for name, url in MONITORING_ENDPOINTS.items():
+        checks[name] = (lambda url=url: _check_http(url), monitoring_interval)
+    return HealthProber(checks, timeout_seconds=settings.health_probe_timeout_seconds)
+
+
+def _probe_ok(name: str) -> bool:
+    return _health_prober is not None and _health_prober.is_ok(name)
+
+
+def get_pose_pool() -> PosePool:
+    if _pose_pool is None:
+        raise ModelNotLoadedError('Pose pool is not started')
+    return _pose_pool
+
+
+async def estimate_landmarks(content: bytes) -> Landmarks:
+    """Landmarks for an image, reusing cached results for identical image bytes."""
+
+    async def infer() -> Landmarks:
+        # Pillow releases the GIL while decoding, so this runs in parallel with the loop
+        frame = await asyncio.to_thread(prepare_image, content)
+        return await get_pose_pool().extract_landmarks(frame)
+
+    cache = get_landmark_cache()
+    if cache is None:
+        return await infer()
+    return await cache.get_or_compute(content_key(content), infer)
 
 
 @app.post('/estimate-body', response_model=EstimateBodyResponse)
@@ -64,8 +131,9 @@ async def estimate_body(
     log.info('size_rec_request_started', image_url_hash=image_hash, height_cm=payload.height_cm)
 
     try:
-        image_rgb = await download_and_prepare_image(str(payload.image_url), timeout_seconds=5.0)
-        landmarks = get_mediapipe_service().extract_landmarks(image_rgb)
+        content = await download_image_bytes(str(payload.image_url), timeout_seconds=5.0)
+        # Inference runs in a pool worker process, keeping this event loop free
+        landmarks = await estimate_landmarks(content)
         response = calculate_size_recommendation(landmarks, payload.height_cm)
         log.info(
             'size_rec_request_succeeded',
@@ -73,34 +141,104 @@ async def estimate_body(
             confidence=response.confidence,
         )
         return response
-    except ImageDownloadError as exc:
+    except Exception as exc:
+        status_code, detail = _classify_error(exc, log)
+        raise HTTPException(status_code=status_code, detail=detail) from exc
+
+
+def _classify_error(exc: Exception, log: Any) -> tuple[int, str]:
+    """Status code and client-facing detail for a failed estimate, logging the cause."""
+    if isinstance(exc, ImageDownloadError):
         log.warning('size_rec_image_download_failed', error=str(exc))
-        raise HTTPException(status_code=400, detail='Invalid or inaccessible image URL') from exc
-    except ModelNotLoadedError as exc:
+        return 400, 'Invalid or inaccessible image URL'
+    if isinstance(exc, PosePoolBusyError):
+        log.warning('size_rec_pose_pool_busy', error=str(exc))
+        return 503, 'Pose estimation is at capacity, please retry'
+    if isinstance(exc, ModelNotLoadedError):
         log.error('size_rec_model_not_loaded', error=str(exc))
-        raise HTTPException(status_code=503, detail='Pose estimation service is temporarily unavailable') from exc
-    except PoseEstimationError as exc:
+        return 503, 'Pose estimation service is temporarily unavailable'
+    if isinstance(exc, PoseEstimationError):
         log.warning('size_rec_pose_estimation_failed', error=str(exc))
-        raise HTTPException(status_code=422, detail='Could not detect full body pose from image') from exc
-    except Exception as exc:
-        log.error('size_rec_unexpected_error', error=str(exc))
-        raise HTTPException(status_code=500, detail='Failed to estimate body measurements') from exc
+        return 422, 'Could not detect full body pose from image'
+    log.error('size_rec_unexpected_error', error=str(exc))
+    return 500, 'Failed to estimate body measurements'
 
 
-@app.get('/health', response_model=HealthResponse)
-async def health() -> HealthResponse:
-    size_rec_model_loaded = get_mediapipe_service().is_loaded
-    redis_connected = await _redis_client.ping()
+@app.post('/estimate-body/batch')
+async def estimate_body_batch(
+    payload: EstimateBodyBatchRequest,
+    x_request_id: str | None = Header(default=None),
+) -> StreamingResponse:
+    """Estimate many items, streaming one NDJSON line per item in completion order."""
+    if len(payload.items) > settings.size_rec_batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f'Batch exceeds {settings.size_rec_batch_max_items} items',
+        )
+    request_id = x_request_id or f'req_{uuid4()}'
+    log = structlog.get_logger().bind(request_id=request_id)
+    log.info('size_rec_batch_started', items=len(payload.items))
+    return StreamingResponse(_stream_batch(payload.items, log), media_type='application/x-ndjson')
 
-    try:
-        ping_response = celery_app.control.ping(timeout=2.0)
-        celery_connected = len(ping_response) > 0
-    except Exception:
-        celery_connected = False
 
-    prometheus_connected = await _check_http(MONITORING_ENDPOINTS['prometheus'])
-    loki_connected = await _check_http(MONITORING_ENDPOINTS['loki'])
-    grafana_connected = await _check_http(MONITORING_ENDPOINTS['grafana'])
+async def _stream_batch(items: list[EstimateBodyRequest], log: Any) -> AsyncIterator[bytes]:
+    # Downloads overlap with inference. A batch holds at most one pose pool slot
+    # per worker, so the pool's queue slots stay free for single requests. An
+    # item keeps its buffer slot from download until inference is done, so no
+    # more bodies than downloads plus inference slots are held at once
+    download_slots = max(1, settings.size_rec_batch_download_concurrency)
+    inference_slots = _pose_pool.workers if _pose_pool is not None else 1
+    downloads = asyncio.Semaphore(download_slots)
+    inference = asyncio.Semaphore(inference_slots)
+    buffered = asyncio.Semaphore(download_slots + inference_slots)
+    started = time.monotonic()
+    failed = 0
+
+    async with create_download_client(timeout_seconds=5.0) as client:
+
+        async def run(index: int, item: EstimateBodyRequest) -> EstimateBodyBatchItem:
+            item_log = log.bind(item_index=index)
+            try:
+                async with buffered:
+                    async with downloads:
+                        content = await download_image_bytes(str(item.image_url), timeout_seconds=5.0, client=client)
+                    async with inference:
+                        landmarks = await estimate_landmarks(content)
+                result = calculate_size_recommendation(landmarks, item.height_cm)
+                return EstimateBodyBatchItem(index=index, status=200, result=result)
+            except Exception as exc:
+                status_code, detail = _classify_error(exc, item_log)
+                return EstimateBodyBatchItem(index=index, status=status_code, error=detail)
+
+        tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += line.status != 200
+                yield line.model_dump_json(exclude_none=True).encode() + b'\n'
+        finally:
+            # The client went away mid-stream: stop the remaining work
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    log.info(
+        'size_rec_batch_completed',
+        items=len(items),
+        failed=failed,
+        duration_s=round(time.monotonic() - started, 3),
+    )
+
+
+@app.get('/health', response_model=HealthResponse)
+async def health() -> HealthResponse:
+    """Latest background probe results; never waits on a dependency."""
+    size_rec_model_loaded = _pose_pool is not None and _pose_pool.is_loaded
+    redis_connected = _probe_ok('redis')
+    celery_connected = _probe_ok('celery')
+    prometheus_connected = _probe_ok('prometheus')
+    loki_connected = _probe_ok('loki')
+    grafana_connected = _probe_ok('grafana')
 
     core_healthy = size_rec_model_loaded and redis_connected and celery_connected
     all_healthy = core_healthy and prometheus_connected and loki_connected and grafana_connected
@@ -115,3 +253,20 @@ async def health() -> HealthResponse:
         loki_connected=loki_connected,
         grafana_connected=grafana_connected,
     )
+
+
+@app.get('/livez')
+async def livez() -> dict[str, str]:
+    """The process is up and its event loop is serving requests."""
+    return {'status': 'ok'}
+
+
+@app.get('/readyz')
+async def readyz() -> JSONResponse:
+    """200 when the pose pool, Redis and Celery are all up, 503 listing what is not."""
+    failing = [name for name in ('redis', 'celery') if not _probe_ok(name)]
+    if _pose_pool is None or not _pose_pool.is_loaded:
+        failing.insert(0, 'size_rec_model')
+    if failing:
+        return JSONResponse({'status': 'not_ready', 'failing': failing}, status_code=503)
+    return JSONResponse({'status': 'ready'})
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+import structlog
+
+logger = structlog.get_logger()
+
+Check = Callable[[], Awaitable[bool]]
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    ok: bool
+    checked_at: float
+
+
+class HealthProber:
+    """Runs each dependency check in the background on its own interval.
+
+    Health endpoints read the latest results instead of probing per request. A
+    result older than three intervals counts as failing, so a wedged probe
+    cannot keep reporting a stale success.
+    """
+
+    def __init__(self, checks: dict[str, tuple[Check, float]], timeout_seconds: float) -> None:
+        self._checks = checks
+        self.timeout_seconds = timeout_seconds
+        self._results: dict[str, ProbeResult] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+
+    async def _probe(self, name: str) -> None:
+        check, _interval = self._checks[name]
+        try:
+            ok = bool(await asyncio.wait_for(check(), timeout=self.timeout_seconds))
+        except Exception:
+            ok = False
+        previous = self._results.get(name)
+        if previous is not None and previous.ok != ok:
+            logger.warning('health_check_changed', check=name, ok=ok)
+        self._results[name] = ProbeResult(ok=ok, checked_at=time.monotonic())
+
+    async def refresh(self) -> None:
+        """Run every check once, concurrently."""
+        await asyncio.gather(*(self._probe(name) for name in self._checks))
+
+    async def _loop(self, name: str) -> None:
+        interval = self._checks[name][1]
+        while True:
+            await asyncio.sleep(interval)
+            await self._probe(name)
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._tasks = [asyncio.create_task(self._loop(name), name=f'health-{name}') for name in self._checks]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_ok(self, name: str) -> bool:
+        result = self._results.get(name)
+        if result is None:
+            return False
+        interval = self._checks[name][1]
+        return result.ok and time.monotonic() - result.checked_at <= 3 * interval + self.timeout_seconds
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+import structlog
+
+from config.settings import settings
+from services.metrics import SIZE_REC_CACHE_REQUESTS
+from services.redis_client import get_async_redis
+from size_rec.mediapipe_service import LANDMARK_COUNT, LANDMARK_FIELDS, Landmarks
+
+logger = structlog.get_logger()
+
+REDIS_KEY_PREFIX = 'wearon:sizerec:landmarks:'
+LANDMARK_SHAPE = (LANDMARK_COUNT, len(LANDMARK_FIELDS))
+
+
+class LandmarkCache:
+    """Pose landmarks per image content hash, so a repeat photo skips decode and inference.
+
+    An in-process LRU with TTL sits in front of an optional Redis tier shared by
+    all API instances. Concurrent misses for the same key share one computation.
+    Cached arrays are shared between requests, so they are made read-only.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, redis_url: str | None = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Landmarks]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future[Landmarks]] = {}
+        self.redis_url = redis_url
+
+    def _get_local(self, key: str) -> Landmarks | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, array = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return array
+
+    def _put_local(self, key: str, array: Landmarks) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, array)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _get_shared(self, key: str) -> Landmarks | None:
+        if self.redis_url is None:
+            return None
+        try:
+            raw = await get_async_redis(self.redis_url, decode_responses=False).get(REDIS_KEY_PREFIX + key)
+        except Exception as exc:
+            logger.warn('landmark_cache_redis_error', error=str(exc))
+            return None
+        if raw is None or len(raw) != LANDMARK_COUNT * len(LANDMARK_FIELDS) * 4:
+            return None
+        return np.frombuffer(raw, dtype=np.float32).reshape(LANDMARK_SHAPE)
+
+    async def _put_shared(self, key: str, array: Landmarks) -> None:
+        if self.redis_url is None:
+            return
+        try:
+            await get_async_redis(self.redis_url, decode_responses=False).set(REDIS_KEY_PREFIX + key, array.tobytes(), ex=int(self.ttl_seconds))
+        except Exception as exc:
+            logger.warn('landmark_cache_redis_error', error=str(exc))
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Landmarks]]) -> Landmarks:
+        array = self._get_local(key)
+        if array is not None:
+            SIZE_REC_CACHE_REQUESTS.labels(result='hit').inc()
+            return array
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            SIZE_REC_CACHE_REQUESTS.labels(result='coalesced').inc()
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The request computing it went away; take over
+                return await self.get_or_compute(key, compute)
+
+        future: asyncio.Future[Landmarks] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            array = await self._get_shared(key)
+            if array is not None:
+                SIZE_REC_CACHE_REQUESTS.labels(result='shared_hit').inc()
+            else:
+                SIZE_REC_CACHE_REQUESTS.labels(result='miss').inc()
+                array = np.asarray(await compute(), dtype=np.float32)
+                array.setflags(write=False)
+                await self._put_shared(key, array)
+            self._put_local(key, array)
+            future.set_result(array)
+            return array
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            # Waiters see the same failure; failures are never cached
+            future.set_exception(exc)
+            # Mark it retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+_landmark_cache: LandmarkCache | None = None
+
+
+def get_landmark_cache() -> LandmarkCache | None:
+    global _landmark_cache
+    if not settings.size_rec_cache_enabled:
+        return None
+    if _landmark_cache is None:
+        _landmark_cache = LandmarkCache(
+            max_entries=settings.size_rec_cache_max_entries,
+            ttl_seconds=settings.size_rec_cache_ttl_seconds,
+            redis_url=settings.redis_url if settings.size_rec_cache_redis_enabled else None,
+        )
+    return _landmark_cache
@@ -20,7 +20,12 @@ class ModelNotLoadedError(PoseEstimationError):
     pass
 
 
-Landmark = dict[str, float]
+LANDMARK_COUNT = 33
+LANDMARK_FIELDS = ('x', 'y', 'z', 'visibility')
+X, Y, Z, VISIBILITY = range(len(LANDMARK_FIELDS))
+
+# (LANDMARK_COUNT, 4) float32 array, columns in LANDMARK_FIELDS order
+Landmarks = np.ndarray
 
 
 class MediaPipeService:
@@ -60,7 +65,7 @@ class MediaPipeService:
     def is_loaded(self) -> bool:
         return self._model_loaded
 
-    def extract_landmarks(self, image_rgb: np.ndarray) -> list[Landmark]:
+    def extract_landmarks(self, image_rgb: np.ndarray) -> Landmarks:
         if not self._model_loaded or self._landmarker is None:
             raise ModelNotLoadedError('MediaPipe model is not loaded')
 
@@ -72,18 +77,11 @@ class MediaPipeService:
 
         source = result.pose_world_landmarks[0] if result.pose_world_landmarks else result.pose_landmarks[0]
 
-        landmarks: list[Landmark] = []
-        for lm in source:
-            landmarks.append(
-                {
-                    'x': float(lm.x),
-                    'y': float(lm.y),
-                    'z': float(getattr(lm, 'z', 0.0)),
-                    'visibility': float(getattr(lm, 'visibility', 1.0)),
-                }
-            )
-
-        if len(landmarks) != 33:
-            raise PoseEstimationError(f'Expected 33 landmarks, got {len(landmarks)}')
+        if len(source) != LANDMARK_COUNT:
+            raise PoseEstimationError(f'Expected {LANDMARK_COUNT} landmarks, got {len(source)}')
 
-        return landmarks
+        # MediaPipe landmarks are float32 already, so this is lossless
+        return np.array(
+            [(lm.x, lm.y, getattr(lm, 'z', 0.0), getattr(lm, 'visibility', 1.0)) for lm in source],
+            dtype=np.float32,
+        )
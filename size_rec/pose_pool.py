@@ -0,0 +1,259 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from multiprocessing.queues import Queue
+from typing import Protocol
+
+import numpy as np
+import structlog
+
+from config.settings import settings
+from services.metrics import (
+    POSE_INFERENCE_SECONDS,
+    POSE_POOL_PENDING,
+    POSE_POOL_REJECTED,
+    POSE_QUEUE_WAIT_SECONDS,
+)
+from size_rec.image_processing import DEFAULT_MAX_DIMENSION_PX
+from size_rec.mediapipe_service import Landmarks, MediaPipeService, ModelNotLoadedError
+
+logger = structlog.get_logger()
+
+# Largest frame prepare_image produces: RGB at the max thumbnail size
+SLOT_BYTES = DEFAULT_MAX_DIMENSION_PX * DEFAULT_MAX_DIMENSION_PX * 3
+# How long a new pool may take to spawn its workers and load a landmarker in each
+READY_TIMEOUT_SECONDS = 120.0
+
+
+class PosePoolBusyError(Exception):
+    """Raised when no inference slot frees up within the queue timeout."""
+
+
+class LandmarkExtractor(Protocol):
+    @property
+    def is_loaded(self) -> bool: ...
+
+    def extract_landmarks(self, image_rgb: np.ndarray) -> Landmarks: ...
+
+
+# State of each pool worker process
+_worker_extractor: LandmarkExtractor | None = None
+_worker_segments: dict[str, shared_memory.SharedMemory] = {}
+
+
+def _init_worker(factory: Callable[[], LandmarkExtractor], ready: Queue) -> None:
+    """Load this worker's landmarker and report (pid, loaded) to the parent."""
+    global _worker_extractor
+    try:
+        _worker_extractor = factory()
+    except BaseException:
+        ready.put((os.getpid(), False))
+        raise
+    ready.put((os.getpid(), _worker_extractor.is_loaded))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Map a parent-owned segment once per worker, without registering it for cleanup here."""
+    segment = _worker_segments.get(name)
+    if segment is None:
+        if sys.version_info >= (3, 13):
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            from multiprocessing import resource_tracker
+
+            register = resource_tracker.register
+            resource_tracker.register = lambda *_args, **_kwargs: None
+            try:
+                segment = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        _worker_segments[name] = segment
+    return segment
+
+
+def _probe() -> None:
+    """No-op task; the executor spawns a worker for each one submitted while none is idle."""
+
+
+def _infer(slot: str, shape: tuple[int, ...], dtype: str) -> tuple[Landmarks, float, float]:
+    """Run one inference on a frame read in place from shared memory.
+
+    Returns the landmarks, the wall-clock start time and the inference seconds.
+    """
+    started = time.time()
+    if _worker_extractor is None:
+        raise ModelNotLoadedError('Pose worker is not initialised')
+    frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attach(slot).buf)
+    landmarks = _worker_extractor.extract_landmarks(frame)
+    return landmarks, started, time.time() - started
+
+
+class PosePool:
+    """Pose landmarker instances in spawned worker processes, fed through shared memory.
+
+    A fixed set of shared-memory slots (workers + queue_size) bounds the work in
+    flight: a request copies its frame into a free slot and the worker builds an
+    ndarray view over the same pages, so frames are never pickled. When every
+    slot stays busy for queue_timeout seconds the request is rejected.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        queue_timeout: float,
+        factory: Callable[[], LandmarkExtractor] = MediaPipeService,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.queue_timeout = queue_timeout
+        self._factory = factory
+        self._slot_count = self.workers + max(0, queue_size)
+        self._executor: ProcessPoolExecutor | None = None
+        # Readiness reports from the current executor's workers
+        self._ready: Queue | None = None
+        self._slots: list[shared_memory.SharedMemory] = []
+        self._free: asyncio.Queue[shared_memory.SharedMemory] | None = None
+        self._pending = 0
+        self._replace_lock = asyncio.Lock()
+        self.is_loaded = False
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context('spawn')
+        self._ready = context.Queue()
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._factory, self._ready),
+        )
+
+    async def start(self) -> None:
+        """Allocate the slots, spawn the workers and load a landmarker in each."""
+        self._slots = [shared_memory.SharedMemory(create=True, size=SLOT_BYTES) for _ in range(self._slot_count)]
+        self._free = asyncio.Queue()
+        for slot in self._slots:
+            self._free.put_nowait(slot)
+        self._executor = self._create_executor()
+        self.is_loaded = await self._probe_workers(self._executor)
+        logger.info('pose_pool_started', workers=self.workers, slots=self._slot_count, loaded=self.is_loaded)
+
+    async def _probe_workers(self, executor: ProcessPoolExecutor) -> bool:
+        """Whether every worker of executor loaded its landmarker.
+
+        Workers are spawned on demand, so one no-op task per worker is submitted
+        to start them all; readiness is then counted per PID as each worker's
+        initializer reports in, since the tasks themselves may share a worker.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, _probe) for _ in range(self.workers)))
+        except Exception as exc:
+            logger.error('pose_pool_probe_failed', error=str(exc), exc_type=type(exc).__name__)
+            return False
+        loaded = await asyncio.to_thread(self._collect_ready)
+        if len(loaded) < self.workers:
+            logger.error('pose_pool_workers_not_ready', ready=len(loaded), workers=self.workers)
+            return False
+        return all(loaded.values())
+
+    def _collect_ready(self) -> dict[int, bool]:
+        """Readiness per worker PID, waiting up to READY_TIMEOUT_SECONDS for all of them."""
+        loaded: dict[int, bool] = {}
+        ready = self._ready
+        if ready is None:
+            return loaded
+        deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+        while len(loaded) < self.workers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pid, ok = ready.get(timeout=remaining)
+            except queue.Empty:
+                break
+            loaded[pid] = ok
+        return loaded
+
+    async def _replace_broken(self, broken: ProcessPoolExecutor, error: BaseException) -> None:
+        """Swap in a fresh pool once per crash, however many requests saw it break."""
+        async with self._replace_lock:
+            if self._executor is not broken:
+                # Another request already replaced it (or the pool was shut down)
+                return
+            logger.error('pose_pool_broken', error=str(error))
+            self.is_loaded = False
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            # Readiness reflects the replacement workers, not the pool that died
+            self.is_loaded = await self._probe_workers(self._executor)
+            logger.info('pose_pool_replaced', loaded=self.is_loaded)
+
+    async def extract_landmarks(self, image_rgb: np.ndarray) -> Landmarks:
+        if self._executor is None or self._free is None:
+            raise ModelNotLoadedError('Pose pool is not started')
+        frame = np.ascontiguousarray(image_rgb)
+        if frame.nbytes > SLOT_BYTES:
+            raise ValueError(f'Frame of {frame.nbytes} bytes exceeds the {SLOT_BYTES} byte slot')
+
+        submitted = time.time()
+        try:
+            slot = await asyncio.wait_for(self._free.get(), timeout=self.queue_timeout)
+        except TimeoutError as exc:
+            POSE_POOL_REJECTED.inc()
+            raise PosePoolBusyError('All pose inference slots are busy') from exc
+
+        self._pending += 1
+        POSE_POOL_PENDING.set(self._pending)
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            try:
+                np.ndarray(frame.shape, dtype=frame.dtype, buffer=slot.buf)[...] = frame
+                future = executor.submit(_infer, slot.name, frame.shape, frame.dtype.str)
+            except BaseException:
+                self._free.put_nowait(slot)
+                raise
+            # The slot is only reusable once the worker is done reading it, even if this request is cancelled
+            free = self._free
+            future.add_done_callback(lambda _f: loop.call_soon_threadsafe(free.put_nowait, slot))
+            landmarks, started, inference_s = await asyncio.wrap_future(future)
+        except BrokenProcessPool as exc:
+            # A worker died (e.g. OOM); replace the pool so later requests recover
+            await self._replace_broken(executor, exc)
+            raise ModelNotLoadedError('Pose worker crashed') from exc
+        finally:
+            self._pending -= 1
+            POSE_POOL_PENDING.set(self._pending)
+
+        POSE_QUEUE_WAIT_SECONDS.observe(max(0.0, started - submitted))
+        POSE_INFERENCE_SECONDS.observe(inference_s)
+        return landmarks
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._slots = []
+        self._free = None
+        if self._ready is not None:
+            self._ready.close()
+            self._ready = None
+        self.is_loaded = False
+
+
+def create_pose_pool() -> PosePool:
+    return PosePool(
+        workers=settings.pose_pool_workers or os.cpu_count() or 1,
+        queue_size=settings.pose_pool_queue_size,
+        queue_timeout=settings.pose_pool_queue_timeout,
+    )
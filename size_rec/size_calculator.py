@@ -1,6 +1,10 @@
-import math
+import sys
+from dataclasses import dataclass
+
+import numpy as np
 
 from models.size_rec import EstimateBodyResponse, Measurements, SizeRange
+from size_rec.mediapipe_service import VISIBILITY, Y, Landmarks
 
 SIZE_ORDER = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
 SIZE_THRESHOLDS = {
@@ -16,84 +20,118 @@ RIGHT_SHOULDER = 12
 LEFT_HIP = 23
 RIGHT_HIP = 24
 
+# builtin sum() of floats is Neumaier-compensated from Python 3.12
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+def _distance(points: np.ndarray, first: int, second: int) -> np.ndarray:
+    delta = points[:, first, :3] - points[:, second, :3]
+    dx, dy, dz = delta[:, 0], delta[:, 1], delta[:, 2]
+    return np.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+def _clamp(value: np.ndarray, min_value: float, max_value: float) -> np.ndarray:
+    return np.maximum(min_value, np.minimum(max_value, value))
+
 
-def _distance(landmarks: list[dict[str, float]], first: int, second: int) -> float:
-    a = landmarks[first]
-    b = landmarks[second]
-    dx = a['x'] - b['x']
-    dy = a['y'] - b['y']
-    dz = a['z'] - b['z']
-    return math.sqrt(dx * dx + dy * dy + dz * dz)
+def _sum_columns(values: np.ndarray) -> np.ndarray:
+    """Row sums accumulated column by column exactly as builtin sum() would over each row."""
+    total = np.zeros(values.shape[0])
+    compensation = np.zeros_like(total)
+    for column in values.T:
+        step = total + column
+        if _COMPENSATED_SUM:
+            compensation += np.where(np.abs(total) >= np.abs(column), (total - step) + column, (column - step) + total)
+        total = step
+    return np.where((compensation != 0) & np.isfinite(compensation), total + compensation, total)
 
 
-def _clamp(value: float, min_value: float, max_value: float) -> float:
-    return max(min_value, min(max_value, value))
+def _choose_size(chest_cm: np.ndarray, waist_cm: np.ndarray, hip_cm: np.ndarray) -> np.ndarray:
+    reference = np.maximum(np.maximum(chest_cm, waist_cm), hip_cm)
+    # Index of the first threshold >= reference; past the last one means XXL
+    return np.searchsorted(np.array(list(SIZE_THRESHOLDS.values())), reference, side='left')
 
 
-def _choose_size(chest_cm: float, waist_cm: float, hip_cm: float) -> str:
-    reference = max(chest_cm, waist_cm, hip_cm)
-    for size, threshold in SIZE_THRESHOLDS.items():
-        if reference <= threshold:
-            return size
-    return 'XXL'
+def _body_type(shoulder_cm: np.ndarray, hip_cm: np.ndarray) -> np.ndarray:
+    ratio = shoulder_cm / np.maximum(hip_cm, 1.0)
+    return np.select([ratio > 1.12, ratio > 1.03, ratio < 0.93], ['broad', 'athletic', 'slim'], 'average')
 
 
-def _body_type(shoulder_cm: float, hip_cm: float) -> str:
-    ratio = shoulder_cm / max(hip_cm, 1.0)
-    if ratio > 1.12:
-        return 'broad'
-    if ratio > 1.03:
-        return 'athletic'
-    if ratio < 0.93:
-        return 'slim'
-    return 'average'
+@dataclass(frozen=True)
+class SizeBatch:
+    """Unrounded per-row results of calculate_size_batch."""
 
+    chest_cm: np.ndarray
+    waist_cm: np.ndarray
+    hip_cm: np.ndarray
+    shoulder_cm: np.ndarray
+    confidence: np.ndarray
+    size_index: np.ndarray
+    body_type: np.ndarray
 
-def _size_range(size: str, confidence: float) -> SizeRange:
-    index = SIZE_ORDER.index(size)
-    if confidence >= 0.8:
-        return SizeRange(lower=size, upper=size)
+    def __len__(self) -> int:
+        return len(self.size_index)
 
-    lower = SIZE_ORDER[max(0, index - 1)]
-    upper = SIZE_ORDER[min(len(SIZE_ORDER) - 1, index + 1)]
-    return SizeRange(lower=lower, upper=upper)
+    def response(self, row: int) -> EstimateBodyResponse:
+        index = int(self.size_index[row])
+        confidence = float(self.confidence[row])
+        if confidence >= 0.8:
+            lower = upper = index
+        else:
+            lower, upper = max(0, index - 1), min(len(SIZE_ORDER) - 1, index + 1)
 
+        return EstimateBodyResponse(
+            recommended_size=SIZE_ORDER[index],
+            measurements=Measurements(
+                chest_cm=round(float(self.chest_cm[row]), 1),
+                waist_cm=round(float(self.waist_cm[row]), 1),
+                hip_cm=round(float(self.hip_cm[row]), 1),
+                shoulder_cm=round(float(self.shoulder_cm[row]), 1),
+            ),
+            confidence=round(confidence, 3),
+            body_type=str(self.body_type[row]),
+            size_range=SizeRange(lower=SIZE_ORDER[lower], upper=SIZE_ORDER[upper]),
+        )
 
-def calculate_size_recommendation(
-    landmarks: list[dict[str, float]],
-    height_cm: float,
-) -> EstimateBodyResponse:
-    min_y = min(landmark['y'] for landmark in landmarks)
-    max_y = max(landmark['y'] for landmark in landmarks)
-    body_height_units = max(max_y - min_y, 0.25)
+    def responses(self) -> list[EstimateBodyResponse]:
+        return [self.response(row) for row in range(len(self))]
 
-    cm_per_unit = height_cm / body_height_units
 
-    shoulder_width_cm = _distance(landmarks, LEFT_SHOULDER, RIGHT_SHOULDER) * cm_per_unit
-    hip_width_cm = _distance(landmarks, LEFT_HIP, RIGHT_HIP) * cm_per_unit
+def calculate_size_batch(landmarks: np.ndarray, heights_cm: np.ndarray) -> SizeBatch:
+    """Measurements for N landmark sets of shape (N, 33, 4) and N heights at once.
+
+    Arithmetic runs in float64 in the same order as the per-landmark formulas,
+    so every row matches what a scalar pass over the same landmarks produces.
+    """
+    points = np.asarray(landmarks, dtype=np.float64)
+    heights = np.asarray(heights_cm, dtype=np.float64)
+
+    ys = points[:, :, Y]
+    body_height_units = np.maximum(ys.max(axis=1) - ys.min(axis=1), 0.25)
+
+    cm_per_unit = heights / body_height_units
+
+    shoulder_width_cm = _distance(points, LEFT_SHOULDER, RIGHT_SHOULDER) * cm_per_unit
+    hip_width_cm = _distance(points, LEFT_HIP, RIGHT_HIP) * cm_per_unit
 
     shoulder_cm = _clamp(shoulder_width_cm, 30.0, 65.0)
     chest_cm = _clamp(shoulder_width_cm * 2.15, 70.0, 150.0)
     waist_cm = _clamp(hip_width_cm * 1.55, 58.0, 140.0)
     hip_cm = _clamp(hip_width_cm * 1.95, 70.0, 160.0)
 
-    visibility_avg = sum(landmark.get('visibility', 1.0) for landmark in landmarks) / len(landmarks)
+    visibility_avg = _sum_columns(points[:, :, VISIBILITY]) / points.shape[1]
     confidence = _clamp(0.55 + 0.35 * visibility_avg, 0.4, 0.98)
 
-    recommended_size = _choose_size(chest_cm, waist_cm, hip_cm)
-    body_type = _body_type(shoulder_cm, hip_cm)
-    size_range = _size_range(recommended_size, confidence)
-
-    return EstimateBodyResponse(
-        recommended_size=recommended_size,
-        measurements=Measurements(
-            chest_cm=round(chest_cm, 1),
-            waist_cm=round(waist_cm, 1),
-            hip_cm=round(hip_cm, 1),
-            shoulder_cm=round(shoulder_cm, 1),
-        ),
-        confidence=round(confidence, 3),
-        body_type=body_type,
-        size_range=size_range,
+    return SizeBatch(
+        chest_cm=chest_cm,
+        waist_cm=waist_cm,
+        hip_cm=hip_cm,
+        shoulder_cm=shoulder_cm,
+        confidence=confidence,
+        size_index=_choose_size(chest_cm, waist_cm, hip_cm),
+        body_type=_body_type(shoulder_cm, hip_cm),
     )
 
+
+def calculate_size_recommendation(landmarks: Landmarks, height_cm: float) -> EstimateBodyResponse:
+    return calculate_size_batch(np.asarray(landmarks)[np.newaxis], np.array([height_cm])).response(0)
@@ -0,0 +1,86 @@
+from services.circuit_breaker import Admission, OpenAICircuitBreaker
+from services.metrics import OPENAI_CIRCUIT_STATE, OPENAI_CIRCUIT_TRANSITIONS
+
+
+class StubRedis:
+    def __init__(self, replies: list, state: str | None = None) -> None:
+        self.replies = list(replies)
+        self.state = state
+        self.calls: list[tuple] = []
+
+    async def eval(self, _script: str, _numkeys: int, *args):
+        self.calls.append(args)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    async def hget(self, _key: str, _field: str):
+        if isinstance(self.state, Exception):
+            raise self.state
+        return self.state
+
+
+def make_breaker(redis: StubRedis) -> OpenAICircuitBreaker:
+    breaker = OpenAICircuitBreaker('redis://unused')
+    breaker._redis = lambda: redis  # type: ignore[method-assign]
+    return breaker
+
+
+async def test_admit_reports_wait_while_open():
+    redis = StubRedis([['closed', 0], ['open', 4500], ['half_open', 0], ['half_open', 800]])
+    breaker = make_breaker(redis)
+
+    assert await breaker.admit() == Admission()
+    closed = await breaker.admit()
+    assert not closed.allowed and closed.wait_seconds == 4.5
+    assert OPENAI_CIRCUIT_STATE._value.get() == 2
+    # Cooldown over: this caller is the half-open probe, holding the token it sent
+    probe = await breaker.admit()
+    assert probe.allowed and probe.probe == redis.calls[2][-1]
+    assert OPENAI_CIRCUIT_STATE._value.get() == 1
+    # Everyone else waits for the probe
+    assert (await breaker.admit()).wait_seconds == 0.8
+
+
+async def test_outcomes_pass_the_probe_token():
+    redis = StubRedis([['half_open', 'closed'], ['closed', 'closed']])
+    breaker = make_breaker(redis)
+
+    await breaker.record_success(1.0, probe='probe-1')
+    await breaker.record_failure()
+
+    # The script acts on a half-open breaker only for the matching token
+    assert [call[-1] for call in redis.calls] == ['probe-1', '']
+
+
+async def test_slow_success_counts_as_failure(monkeypatch):
+    monkeypatch.setattr('services.circuit_breaker.settings.openai_breaker_slow_call_seconds', 60.0)
+    redis = StubRedis([['closed', 'closed'], ['closed', 'closed'], ['closed', 'closed']])
+    breaker = make_breaker(redis)
+
+    await breaker.record_success(5.0)
+    await breaker.record_success(75.0)
+    await breaker.record_failure()
+
+    assert [call[1] for call in redis.calls] == [0, 1, 1]
+
+
+async def test_transition_is_counted():
+    opened_before = OPENAI_CIRCUIT_TRANSITIONS.labels(state='open')._value.get()
+    breaker = make_breaker(StubRedis([['closed', 'open'], ['open', 'open']]))
+
+    await breaker.record_failure()
+    await breaker.record_failure()
+
+    assert OPENAI_CIRCUIT_TRANSITIONS.labels(state='open')._value.get() == opened_before + 1
+    assert OPENAI_CIRCUIT_STATE._value.get() == 2
+
+
+async def test_fails_open_without_redis():
+    breaker = make_breaker(StubRedis([ConnectionError('down')] * 4, state=ConnectionError('down')))
+
+    assert (await breaker.admit()).allowed
+    assert await breaker.is_open() is False
+    await breaker.record_failure()
+    assert await breaker.blocked_for() == 0.0
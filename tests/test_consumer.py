@@ -1,16 +1,19 @@
 import json
 from unittest.mock import MagicMock, patch
 
-from worker.consumer import QUEUE_KEY
+import pytest
 
+from models.task_payload import GenerationTask
+from services.metrics import QUEUE_DEPTH
+from worker.consumer import QUEUE_KEY, dispatch_batch, validate_batch
 
-def test_valid_task_dispatched():
-    """Verify that a valid JSON task from Redis is dispatched to Celery."""
-    task_data = {
-        'task_id': 'test-1',
+
+def make_task_data(session_id: str = 'sess-1') -> dict:
+    return {
+        'task_id': f'test-{session_id}',
         'channel': 'b2c',
         'user_id': 'user-1',
-        'session_id': 'sess-1',
+        'session_id': session_id,
         'image_urls': ['https://example.com/img.jpg'],
         'prompt': 'Try on',
         'request_id': 'req_test',
@@ -18,12 +21,17 @@ def test_valid_task_dispatched():
         'created_at': '2026-02-09T14:30:00Z',
     }
 
+
+def make_redis(*pipeline_results) -> MagicMock:
+    """Redis mock whose pipelined pop + LLEN + in-flight read returns the given results, then stops the loop."""
     mock_redis = MagicMock()
-    # BRPOP returns (key, value) then raises to break loop
-    mock_redis.brpop.side_effect = [
-        (QUEUE_KEY, json.dumps(task_data)),
-        KeyboardInterrupt(),
-    ]
+    mock_redis.pipeline.return_value.execute.side_effect = [*pipeline_results, KeyboardInterrupt()]
+    return mock_redis
+
+
+def test_valid_task_dispatched():
+    """Verify that a valid JSON task from Redis is dispatched to Celery."""
+    mock_redis = make_redis([(QUEUE_KEY, json.dumps(make_task_data())), None, 0, 0, []])
 
     with (
         patch('worker.consumer.get_redis_consumer', return_value=mock_redis),
@@ -32,24 +40,85 @@ def test_valid_task_dispatched():
         from worker.consumer import run_consumer
 
         run_consumer()
-        mock_task.delay.assert_called_once()
-        call_args = mock_task.delay.call_args[0][0]
+        mock_task.apply_async.assert_called_once()
+        call_args = mock_task.apply_async.call_args[0][0][0]
         assert call_args['session_id'] == 'sess-1'
+        # In-flight leases are shared with other instances and never wiped on start
+        mock_redis.delete.assert_not_called()
 
 
 def test_invalid_json_skipped():
     """Verify that malformed JSON is logged and skipped."""
+    mock_redis = make_redis([(QUEUE_KEY, 'not valid json{{{'), None, 0, 0, []])
+
+    with (
+        patch('worker.consumer.get_redis_consumer', return_value=mock_redis),
+        patch('worker.consumer.process_generation') as mock_task,
+    ):
+        from worker.consumer import run_consumer
+
+        run_consumer()
+        mock_task.apply_async.assert_not_called()
+
+
+def test_batch_drained_and_dispatched_in_order_on_one_producer():
+    """A burst is drained in one round trip and published over a single producer."""
+    # One shopper each, so no per-tenant cap holds any of them back
+    drained = [json.dumps(make_task_data(f'sess-{i}') | {'user_id': f'user-{i}'}) for i in range(2, 5)]
+    mock_redis = make_redis([(QUEUE_KEY, json.dumps(make_task_data('sess-1'))), drained, 7, 0, []])
+
+    with (
+        patch('worker.consumer.get_redis_consumer', return_value=mock_redis),
+        patch('worker.consumer.process_generation') as mock_task,
+        patch('worker.consumer.celery_app') as mock_celery,
+    ):
+        from worker.consumer import run_consumer
+
+        run_consumer()
+
+        session_ids = [call[0][0][0]['session_id'] for call in mock_task.apply_async.call_args_list]
+        assert session_ids == ['sess-1', 'sess-2', 'sess-3', 'sess-4']
+        mock_celery.producer_or_acquire.assert_called_once()
+        mock_redis.pipeline.return_value.rpop.assert_called_with(QUEUE_KEY, 19)
+        assert QUEUE_DEPTH._value.get() == 7
+
+
+def test_failed_dispatch_requeues_remaining_tasks():
+    """Tasks not yet published when the broker fails go back to the consumer end of the queue."""
+    tasks = [GenerationTask(**make_task_data(f'sess-{i}')) for i in range(1, 4)]
     mock_redis = MagicMock()
-    mock_redis.brpop.side_effect = [
-        (QUEUE_KEY, 'not valid json{{{'),
-        KeyboardInterrupt(),
-    ]
+
+    with (
+        patch('worker.consumer.process_generation') as mock_task,
+        patch('worker.consumer.celery_app'),
+    ):
+        mock_task.apply_async.side_effect = [None, ConnectionError('broker down')]
+        with pytest.raises(ConnectionError):
+            dispatch_batch(mock_redis, tasks)
+
+    pushed = mock_redis.rpush.call_args[0]
+    assert pushed[0] == QUEUE_KEY
+    assert [json.loads(p)['session_id'] for p in pushed[1:]] == ['sess-3', 'sess-2']
+
+
+def test_tenant_at_its_cap_waits_while_others_dispatch():
+    """A tenant with its in-flight slots taken is held back; a different shopper still goes out."""
+    busy = [json.dumps(make_task_data(f'sess-{i}')) for i in range(1, 4)]
+    other = json.dumps(make_task_data('sess-other') | {'user_id': 'user-2'})
+    inflight = ['b2c:user-1|sess-old-1', 'b2c:user-1|sess-old-2']
+    mock_redis = make_redis([(QUEUE_KEY, busy[0]), [*busy[1:], other], 0, 0, inflight])
 
     with (
         patch('worker.consumer.get_redis_consumer', return_value=mock_redis),
         patch('worker.consumer.process_generation') as mock_task,
+        patch('worker.consumer.celery_app'),
+        patch('worker.consumer.time.sleep'),
     ):
         from worker.consumer import run_consumer
 
         run_consumer()
-        mock_task.delay.assert_not_called()
+
+    session_ids = [call[0][0][0]['session_id'] for call in mock_task.apply_async.call_args_list]
+    assert session_ids == ['sess-other']
+    leased = mock_redis.zadd.call_args[0][1]
+    assert list(leased) == ['b2c:user-2|sess-other']
@@ -0,0 +1,96 @@
+import asyncio
+import socket
+
+import httpcore
+import pytest
+
+from services import dns_resolver
+from services.dns_resolver import (
+    CachingResolver,
+    HostResolutionError,
+    InternalAddressError,
+    _PinnedNetworkBackend,
+    resolve_checked,
+)
+from size_rec.image_processing import ImageDownloadError, create_download_client, download_image_bytes
+
+
+def addrinfo(*ips: str) -> list[tuple]:
+    return [(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM, 6, '', (ip, 0)) for ip in ips]
+
+
+@pytest.fixture
+def fake_dns(monkeypatch):
+    """Route getaddrinfo through a table and count lookups per host."""
+    table: dict[str, list[str]] = {}
+    lookups: dict[str, int] = {}
+
+    async def getaddrinfo(self, host, port, **kwargs):
+        lookups[host] = lookups.get(host, 0) + 1
+        await asyncio.sleep(0.01)
+        if host not in table:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return addrinfo(*table[host])
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(dns_resolver, '_resolver', CachingResolver(ttl_seconds=60, timeout_seconds=1))
+    return table, lookups
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_query_and_are_cached(fake_dns):
+    table, lookups = fake_dns
+    table['images.example.com'] = ['93.184.216.34']
+    resolver = dns_resolver.get_resolver()
+
+    results = await asyncio.gather(*(resolver.resolve('images.example.com') for _ in range(10)))
+    await resolver.resolve('IMAGES.example.com')
+
+    assert all(str(r[0]) == '93.184.216.34' for r in results)
+    assert lookups == {'images.example.com': 1}
+
+
+@pytest.mark.asyncio
+async def test_connect_goes_to_the_validated_ip(fake_dns):
+    table, _ = fake_dns
+    table['cdn.example.com'] = ['93.184.216.34', '93.184.216.35']
+    backend = _PinnedNetworkBackend(allow_internal=False)
+    attempts: list[str] = []
+
+    async def connect_tcp(host, port, **kwargs):
+        attempts.append(host)
+        if host == '93.184.216.34':
+            raise httpcore.ConnectError('unreachable')
+        return 'stream'
+
+    backend._backend.connect_tcp = connect_tcp
+
+    assert await backend.connect_tcp('cdn.example.com', 443) == 'stream'
+    assert attempts == ['93.184.216.34', '93.184.216.35']
+
+
+@pytest.mark.asyncio
+async def test_any_internal_address_is_rejected(fake_dns):
+    table, _ = fake_dns
+    # A public first answer must not hide an internal second one
+    table['rebind.example.com'] = ['93.184.216.34', '10.0.0.5']
+
+    with pytest.raises(InternalAddressError):
+        await resolve_checked('rebind.example.com')
+    with pytest.raises(InternalAddressError):
+        await resolve_checked('[::ffff:127.0.0.1]')
+    with pytest.raises(HostResolutionError):
+        await resolve_checked('missing.example.com')
+
+    allowed = await resolve_checked('rebind.example.com', allow_internal=True)
+    assert [str(addr) for addr in allowed] == ['93.184.216.34', '10.0.0.5']
+
+
+@pytest.mark.asyncio
+async def test_download_client_refuses_internal_hosts(fake_dns):
+    table, _ = fake_dns
+    table['metadata.example.com'] = ['169.254.169.254']
+
+    async with create_download_client() as client:
+        with pytest.raises(ImageDownloadError):
+            await download_image_bytes('http://metadata.example.com/latest', client=client)
@@ -0,0 +1,130 @@
+import os
+
+from services import image_processor
+from services.image_cache import ImageCache, content_key, identity_key
+
+
+def make_cache(tmp_path, max_disk_bytes: int = 1024 * 1024, max_memory_bytes: int = 1024 * 1024) -> ImageCache:
+    return ImageCache(
+        directory=str(tmp_path),
+        max_disk_bytes=max_disk_bytes,
+        max_memory_bytes=max_memory_bytes,
+        ref_ttl_seconds=3600,
+    )
+
+
+def test_identity_key_ignores_signed_url_query():
+    base = 'https://x.supabase.co/storage/v1/object/sign/bucket/user/model.jpg'
+    assert identity_key(f'{base}?token=abc') == identity_key(f'{base}?token=def')
+    assert identity_key(f'{base}?X-Amz-Signature=1&X-Amz-Expires=60') == identity_key(base)
+    assert identity_key(f'{base}?id=1') != identity_key(f'{base}?id=2')
+    assert identity_key(base) != identity_key(base.replace('model', 'garment'))
+
+
+def test_cache_survives_new_instance_via_disk(tmp_path):
+    first = make_cache(tmp_path)
+    key = content_key(b'raw')
+    first.put(key, b'resized')
+    first.link(identity_key('https://a/b.jpg?token=1'), key, '"v1"')
+
+    second = make_cache(tmp_path)
+    assert second.resolve(identity_key('https://a/b.jpg?token=2')) == (key, '"v1"')
+    assert second.get(key) == b'resized'
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_disk_bytes=250, max_memory_bytes=0)
+    cache.put('sha-old', b'a' * 100)
+    os.utime(os.path.join(cache.objects_dir, 'sha-old'), (1, 1))
+    cache.put('sha-mid', b'b' * 100)
+    cache.put('sha-new', b'c' * 100)
+
+    assert cache.get('sha-old') is None
+    assert cache.get('sha-mid') == b'b' * 100
+    assert cache.get('sha-new') == b'c' * 100
+
+
+class FakeOrigin:
+    """Serves one body per URL path with an ETag, answering 304 when it still matches."""
+
+    def __init__(self, body: bytes, etag: str | None = '"v1"') -> None:
+        self.body = body
+        self.etag = etag
+        self.downloads: list[str] = []
+        self.revalidations = 0
+
+    async def download(self, url: str, if_none_match: str | None = None) -> tuple[bytes, str | None]:
+        if if_none_match is not None:
+            self.revalidations += 1
+            if if_none_match == self.etag:
+                raise image_processor.ImageNotModified(url)
+        self.downloads.append(url)
+        return self.body, self.etag
+
+
+async def test_download_and_resize_uses_cache(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    origin = FakeOrigin(b'same-garment')
+    resizes: list[bytes] = []
+
+    async def fake_resize(raw: bytes, _name: str) -> bytes:
+        resizes.append(raw)
+        return b'resized-' + raw
+
+    monkeypatch.setattr(image_processor, 'get_image_cache', lambda: cache)
+    monkeypatch.setattr(image_processor, 'download_image_with_etag', origin.download)
+    monkeypatch.setattr(image_processor, 'resize_image_async', fake_resize)
+
+    url = 'https://x.supabase.co/storage/v1/object/sign/b/garment.jpg'
+    assert await image_processor.download_and_resize(f'{url}?token=1', 'image_1') == b'resized-same-garment'
+    # Same object, new signature: revalidated with its ETag, not downloaded
+    assert await image_processor.download_and_resize(f'{url}?token=2', 'image_1') == b'resized-same-garment'
+    # Same bytes under a different path: downloaded again but not re-resized
+    assert await image_processor.download_and_resize('https://cdn/other.jpg', 'image_1') == b'resized-same-garment'
+
+    assert len(origin.downloads) == 2
+    assert origin.revalidations == 1
+    assert len(resizes) == 1
+
+
+async def test_overwritten_object_is_downloaded_again(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    origin = FakeOrigin(b'old-photo')
+
+    async def fake_resize(raw: bytes, _name: str) -> bytes:
+        return b'resized-' + raw
+
+    monkeypatch.setattr(image_processor, 'get_image_cache', lambda: cache)
+    monkeypatch.setattr(image_processor, 'download_image_with_etag', origin.download)
+    monkeypatch.setattr(image_processor, 'resize_image_async', fake_resize)
+
+    url = 'https://x.supabase.co/storage/v1/object/sign/b/model.jpg'
+    assert await image_processor.download_and_resize(url, 'model') == b'resized-old-photo'
+    origin.body, origin.etag = b'new-photo', '"v2"'
+
+    assert await image_processor.download_and_resize(url, 'model') == b'resized-new-photo'
+
+
+async def test_disk_tier_stays_off_the_event_loop(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    offloaded: list[str] = []
+
+    async def recording_to_thread(func, *args):
+        offloaded.append(func.__name__)
+        return func(*args)
+
+    async def fake_resize(raw: bytes, _name: str) -> bytes:
+        return b'resized-' + raw
+
+    monkeypatch.setattr(image_processor, 'get_image_cache', lambda: cache)
+    monkeypatch.setattr(image_processor, 'download_image_with_etag', FakeOrigin(b'garment').download)
+    monkeypatch.setattr(image_processor, 'resize_image_async', fake_resize)
+    monkeypatch.setattr(image_processor.asyncio, 'to_thread', recording_to_thread)
+
+    await image_processor.download_and_resize('https://cdn/garment.jpg', 'image_1')
+    assert offloaded == ['resolve', 'get', 'put', 'link']
+
+    # A repeat served from memory never leaves the loop
+    offloaded.clear()
+    assert await image_processor.download_and_resize('https://cdn/garment.jpg', 'image_1') == b'resized-garment'
+    assert offloaded == []
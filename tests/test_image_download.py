@@ -0,0 +1,88 @@
+import httpx
+import pytest
+
+from services.image_download import DownloadRejectedError, looks_like_image, read_image_body
+
+JPEG_HEAD = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01'
+
+
+async def _stream(handler, max_bytes: int = 1024) -> bytes:
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        async with client.stream('GET', 'https://example.com/image') as response:
+            return await read_image_body(response, max_bytes)
+
+
+def test_looks_like_image_recognises_common_formats():
+    assert looks_like_image(JPEG_HEAD)
+    assert looks_like_image(b'\x89PNG\r\n\x1a\n\x00\x00\x00\x0d')
+    assert looks_like_image(b'RIFF\x00\x00\x00\x00WEBP')
+    assert looks_like_image(b'\x00\x00\x00\x18ftypheic')
+    assert not looks_like_image(b'<!DOCTYPE html>')
+
+
+@pytest.mark.asyncio
+async def test_read_image_body_returns_small_image():
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={'content-type': 'image/jpeg'}, content=JPEG_HEAD + b'rest')
+
+    assert await _stream(handler) == JPEG_HEAD + b'rest'
+
+
+@pytest.mark.asyncio
+async def test_read_image_body_rejects_declared_oversize_without_reading():
+    chunks_read: list[int] = []
+
+    async def body():
+        for i in range(10):
+            chunks_read.append(i)
+            yield JPEG_HEAD if i == 0 else b'x' * 512
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={'content-type': 'image/jpeg', 'content-length': '999999'}, content=body())
+
+    with pytest.raises(DownloadRejectedError, match='exceeds'):
+        await _stream(handler)
+    assert chunks_read == []
+
+
+@pytest.mark.asyncio
+async def test_read_image_body_stops_when_budget_runs_out():
+    chunks_read: list[int] = []
+
+    async def body():
+        for i in range(100):
+            chunks_read.append(i)
+            yield JPEG_HEAD if i == 0 else b'x' * 512
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={'content-type': 'image/jpeg'}, content=body())
+
+    with pytest.raises(DownloadRejectedError, match='exceeds'):
+        await _stream(handler, max_bytes=1024)
+    assert len(chunks_read) < 5
+
+
+@pytest.mark.asyncio
+async def test_read_image_body_rejects_non_image_magic_bytes_early():
+    chunks_read: list[int] = []
+
+    async def body():
+        for i in range(100):
+            chunks_read.append(i)
+            yield b'<html><body>not an image</body></html>'
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={'content-type': 'image/png'}, content=body())
+
+    with pytest.raises(DownloadRejectedError, match='did not return image data'):
+        await _stream(handler, max_bytes=1024 * 1024)
+    assert len(chunks_read) == 1
+
+
+@pytest.mark.asyncio
+async def test_read_image_body_rejects_non_image_content_type():
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={'content-type': 'text/html'}, content=b'<html>')
+
+    with pytest.raises(DownloadRejectedError, match='non-image content-type'):
+        await _stream(handler)
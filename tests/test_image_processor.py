@@ -0,0 +1,108 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from services import image_processor
+from services.image_executor import BoundedExecutor
+from services.image_processor import (
+    ImagePreparationError,
+    download_and_resize_all,
+    resize_image_async,
+    resize_with_timings,
+)
+
+
+def make_image_bytes(size: tuple[int, int], fmt: str = 'JPEG', mode: str = 'RGB', **save_kwargs) -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, size, (120, 80, 40, 255)[: len(mode)]).save(buf, format=fmt, **save_kwargs)
+    return buf.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_download_and_resize_all_runs_concurrently(monkeypatch):
+    started: list[str] = []
+    both_started = asyncio.Event()
+
+    async def fake_download_and_resize(url: str, name: str) -> bytes:
+        started.append(name)
+        if len(started) == 2:
+            both_started.set()
+        # Each download only finishes once the other one has started
+        await asyncio.wait_for(both_started.wait(), timeout=1.0)
+        return url.encode()
+
+    monkeypatch.setattr(image_processor, 'download_and_resize', fake_download_and_resize)
+
+    buffers = await download_and_resize_all(['https://example.com/a.jpg', 'https://example.com/b.jpg'])
+
+    assert buffers == [
+        ('model.jpg', b'https://example.com/a.jpg'),
+        ('image_1.jpg', b'https://example.com/b.jpg'),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_download_and_resize_all_reports_each_failed_image(monkeypatch):
+    async def fake_download_and_resize(url: str, name: str) -> bytes:
+        if name != 'model':
+            raise ValueError(f'boom {name}')
+        return b'ok'
+
+    monkeypatch.setattr(image_processor, 'download_and_resize', fake_download_and_resize)
+
+    with pytest.raises(ImagePreparationError) as exc_info:
+        await download_and_resize_all(['https://a', 'https://b', 'https://c'])
+
+    assert exc_info.value.failures == [('image_1', 'boom image_1'), ('image_2', 'boom image_2')]
+    assert 'image_1, image_2' in str(exc_info.value)
+
+
+def test_compliant_jpeg_is_passed_through_untouched():
+    original = make_image_bytes((800, 1000))
+
+    output, timings = resize_with_timings(original, 'model')
+
+    assert output is original
+    assert 'encode' not in timings
+
+
+def test_oversized_jpeg_is_downscaled_to_exact_target():
+    output, timings = resize_with_timings(make_image_bytes((4000, 3000)), 'model')
+
+    img = Image.open(io.BytesIO(output))
+    assert img.size == (1024, 768)
+    assert img.format == 'JPEG'
+    assert set(timings) == {'decode', 'resize', 'encode'}
+
+
+def test_jpeg_with_exif_is_reencoded_without_it():
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    output, _ = resize_with_timings(make_image_bytes((500, 500), exif=exif.tobytes()), 'model')
+
+    assert 'exif' not in Image.open(io.BytesIO(output)).info
+
+
+def test_transparent_png_is_flattened_to_rgb_jpeg():
+    output, _ = resize_with_timings(make_image_bytes((300, 200), fmt='PNG', mode='RGBA'), 'image_1')
+
+    img = Image.open(io.BytesIO(output))
+    assert img.format == 'JPEG'
+    assert img.mode == 'RGB'
+
+
+@pytest.mark.asyncio
+async def test_resize_runs_on_bounded_executor(monkeypatch):
+    executor = BoundedExecutor(kind='thread', workers=1, max_pending=1)
+    monkeypatch.setattr(image_processor, 'get_image_executor', lambda: executor)
+
+    outputs = await asyncio.gather(
+        resize_image_async(make_image_bytes((2048, 2048)), 'model'),
+        resize_image_async(make_image_bytes((2048, 1024)), 'image_1'),
+    )
+
+    assert [Image.open(io.BytesIO(o)).size for o in outputs] == [(1024, 1024), (1024, 512)]
+    assert executor._pending == 0
+    executor.shutdown()
@@ -0,0 +1,52 @@
+import base64
+import json
+
+import pytest
+
+from services.image_response import ImageResponseError, ImageResponseParser
+
+
+def parse(raw: bytes, chunk_size: int) -> tuple[dict, bytes]:
+    parser = ImageResponseParser()
+    for start in range(0, len(raw), chunk_size):
+        parser.feed(raw[start:start + chunk_size])
+    body = parser.close()
+    return body, parser.image.read()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 4096])
+def test_image_is_decoded_across_any_chunk_boundary(chunk_size):
+    image = bytes(range(256)) * 3
+    encoded = base64.b64encode(image).decode()
+    raw = json.dumps({
+        # A quoted field name inside another string is not the field
+        'revised_prompt': 'keep "b64_json": as text',
+        'data': [{'b64_json': encoded}],
+        'usage': {'input_tokens': 12},
+    }).encode()
+    # Some encoders escape the slashes in base64
+    raw = raw.replace(b'/', b'\\/')
+
+    body, decoded = parse(raw, chunk_size)
+
+    assert decoded == image
+    assert body['data'] == [{'b64_json': ''}]
+    assert body['usage'] == {'input_tokens': 12}
+    assert body['revised_prompt'] == 'keep "b64_json": as text'
+
+
+def test_url_responses_pass_through():
+    body, decoded = parse(b'{"data": [{"url": "https://files.example.com/b64_json.png"}]}', 5)
+
+    assert decoded == b''
+    assert body == {'data': [{'url': 'https://files.example.com/b64_json.png'}]}
+
+
+def test_truncated_or_invalid_image_data_is_rejected():
+    parser = ImageResponseParser()
+    parser.feed(b'{"data": [{"b64_json": "aGVsbG8')
+    with pytest.raises(ImageResponseError):
+        parser.close()
+
+    with pytest.raises(ImageResponseError):
+        ImageResponseParser().feed(b'{"data": [{"b64_json": "aGVs*G8="}]}')
@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from size_rec.landmark_cache import LandmarkCache
+
+
+def make_array(value: float) -> np.ndarray:
+    return np.full((33, 4), value, dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_computation():
+    cache = LandmarkCache(max_entries=4, ttl_seconds=60)
+    calls = 0
+
+    async def compute() -> np.ndarray:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return make_array(1.0)
+
+    results = await asyncio.gather(*(cache.get_or_compute('photo', compute) for _ in range(5)))
+    again = await cache.get_or_compute('photo', compute)
+
+    assert calls == 1
+    assert all(np.array_equal(r, make_array(1.0)) for r in [*results, again])
+
+
+@pytest.mark.asyncio
+async def test_failures_propagate_to_waiters_and_are_not_cached():
+    cache = LandmarkCache(max_entries=4, ttl_seconds=60)
+    attempts = 0
+
+    async def flaky() -> np.ndarray:
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise ValueError('no person detected')
+        return make_array(2.0)
+
+    results = await asyncio.gather(*(cache.get_or_compute('photo', flaky) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    assert np.array_equal(await cache.get_or_compute('photo', flaky), make_array(2.0))
+    assert attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr('size_rec.landmark_cache.time.monotonic', lambda: now)
+    cache = LandmarkCache(max_entries=2, ttl_seconds=10)
+
+    async def value(v: float):
+        return make_array(v)
+
+    for key, v in (('a', 1.0), ('b', 2.0)):
+        await cache.get_or_compute(key, lambda v=v: value(v))
+    assert cache._get_local('a') is not None  # 'a' is now most recently used
+    await cache.get_or_compute('c', lambda: value(3.0))
+
+    assert cache._get_local('b') is None
+    assert cache._get_local('a') is not None
+
+    now += 11
+    assert cache._get_local('a') is None
+
+
+@pytest.mark.asyncio
+async def test_cached_arrays_are_read_only():
+    cache = LandmarkCache(max_entries=4, ttl_seconds=60)
+
+    async def compute():
+        return make_array(1.0)
+
+    array = await cache.get_or_compute('photo', compute)
+
+    assert array.dtype == np.float32
+    with pytest.raises(ValueError):
+        array[0, 0] = 5.0
@@ -0,0 +1,246 @@
+import base64
+import json
+
+import httpx
+import pytest
+
+from services import openai_client
+from services.metrics import OPENAI_COST_USD, OPENAI_TOKENS
+from services.circuit_breaker import Admission, CircuitOpenError
+from services.openai_client import OpenAIImageError, generate_tryon
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.MockTransport(handler),
+        event_hooks={'request': [openai_client._on_request]},
+    )
+
+
+class StubRateLimiter:
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.successes = 0
+        self.throttles = 0
+
+    async def acquire(self, max_wait: float | None = None) -> None:
+        self.acquired += 1
+
+    async def record_success(self, _headers) -> None:
+        self.successes += 1
+
+    async def record_throttle(self, _headers) -> None:
+        self.throttles += 1
+
+
+@pytest.fixture(autouse=True)
+def stub_rate_limiter(monkeypatch):
+    limiter = StubRateLimiter()
+    monkeypatch.setattr(openai_client, 'get_rate_limiter', lambda: limiter)
+    return limiter
+
+
+class StubCircuitBreaker:
+    def __init__(self, open_after_failures: int = 0) -> None:
+        self.open_after_failures = open_after_failures
+        self.admission = Admission()
+        self.latencies: list[float] = []
+        self.failures = 0
+        self.probes: list[str | None] = []
+        self.released: list[str] = []
+
+    async def admit(self) -> Admission:
+        return self.admission
+
+    async def release_probe(self, probe: str) -> None:
+        self.released.append(probe)
+
+    async def is_open(self) -> bool:
+        return 0 < self.open_after_failures <= self.failures
+
+    async def record_success(self, latency_seconds: float, probe: str | None = None) -> None:
+        self.latencies.append(latency_seconds)
+        self.probes.append(probe)
+
+    async def record_failure(self, probe: str | None = None) -> None:
+        self.failures += 1
+        self.probes.append(probe)
+
+
+@pytest.fixture(autouse=True)
+def stub_circuit_breaker(monkeypatch):
+    breaker = StubCircuitBreaker()
+    monkeypatch.setattr(openai_client, 'get_circuit_breaker', lambda: breaker)
+    return breaker
+
+
+@pytest.fixture(autouse=True)
+def reset_http_client():
+    openai_client._http_client = None
+    openai_client._http_client_loop = None
+    yield
+    openai_client._http_client = None
+    openai_client._http_client_loop = None
+
+
+@pytest.mark.asyncio
+async def test_generate_tryon_reuses_pooled_client(monkeypatch):
+    created: list[httpx.AsyncClient] = []
+    image = b'\xff\xd8\xffresult'
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == '/v1/images/edits'
+        return httpx.Response(200, json={'data': [{'b64_json': base64.b64encode(image).decode()}]})
+
+    def create_client() -> httpx.AsyncClient:
+        client = _mock_client(handler)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(openai_client, '_create_http_client', create_client)
+
+    first = await generate_tryon([('model.jpg', b'a')], request_id='req_1')
+    second = await generate_tryon([('model.jpg', b'a')], request_id='req_2')
+
+    assert first.image_bytes == image
+    assert second.image_bytes == image
+    assert len(created) == 1
+    assert not created[0].is_closed
+
+
+@pytest.mark.asyncio
+async def test_generate_tryon_flags_moderation_errors(monkeypatch):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={'error': {'code': 'moderation_blocked'}})
+
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    with pytest.raises(OpenAIImageError) as exc_info:
+        await generate_tryon([('model.jpg', b'a')])
+
+    assert exc_info.value.is_moderation_error is True
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_generate_tryon_feeds_rate_limiter(monkeypatch, stub_rate_limiter):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={'retry-after': '2'})
+
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    with pytest.raises(OpenAIImageError) as exc_info:
+        await generate_tryon([('model.jpg', b'a')])
+
+    assert exc_info.value.status_code == 429
+    assert stub_rate_limiter.acquired == 1
+    assert stub_rate_limiter.throttles == 1
+    assert stub_rate_limiter.successes == 0
+
+
+async def test_generate_tryon_stops_retrying_once_circuit_opens(monkeypatch, stub_circuit_breaker):
+    calls = 0
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    async def no_sleep(_delay: float) -> None:
+        pass
+
+    stub_circuit_breaker.open_after_failures = 1
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+    monkeypatch.setattr(openai_client.asyncio, 'sleep', no_sleep)
+
+    with pytest.raises(CircuitOpenError):
+        await generate_tryon([('model.jpg', b'a')])
+
+    # The 503 is recorded and the retry is skipped rather than waited out
+    assert calls == 1
+    assert stub_circuit_breaker.failures == 1
+
+
+async def test_generate_tryon_fails_fast_while_circuit_is_open(monkeypatch, stub_circuit_breaker):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        raise AssertionError('no request may go out while the breaker is open')
+
+    stub_circuit_breaker.admission = Admission(wait_seconds=12.5)
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        await generate_tryon([('model.jpg', b'a')])
+
+    assert exc_info.value.retry_in == 12.5
+
+
+async def test_probe_outcome_carries_its_token(monkeypatch, stub_circuit_breaker):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'data': [{'b64_json': base64.b64encode(b'img').decode()}]})
+
+    stub_circuit_breaker.admission = Admission(probe='probe-1')
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    await generate_tryon([('model.jpg', b'a')])
+
+    assert stub_circuit_breaker.probes == ['probe-1']
+    # Releasing after the verdict is a no-op in Redis; it covers probes that never got one
+    assert stub_circuit_breaker.released == ['probe-1']
+
+
+async def test_generate_tryon_does_not_count_moderation_against_circuit(monkeypatch, stub_circuit_breaker):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={'error': {'code': 'moderation_blocked'}})
+
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    with pytest.raises(OpenAIImageError):
+        await generate_tryon([('model.jpg', b'a')])
+
+    assert stub_circuit_breaker.failures == 0
+    assert stub_circuit_breaker.latencies == []
+
+
+@pytest.mark.asyncio
+async def test_generate_tryon_counts_tokens_and_cost(monkeypatch):
+    usage = {
+        'input_tokens': 1100,
+        'output_tokens': 4000,
+        'input_tokens_details': {'text_tokens': 100, 'image_tokens': 1000},
+        'output_tokens_details': {'image_tokens': 4000},
+    }
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'data': [{'b64_json': base64.b64encode(b'img').decode()}], 'usage': usage})
+
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+    image_in = OPENAI_TOKENS.labels(kind='image_input')
+    image_out = OPENAI_TOKENS.labels(kind='image_output')
+    before = (image_in._value.get(), image_out._value.get(), OPENAI_COST_USD._value.get())
+
+    result = await generate_tryon([('model.jpg', b'a')], request_id='req_usage')
+
+    assert image_in._value.get() - before[0] == 1000
+    assert image_out._value.get() - before[1] == 4000
+    assert OPENAI_COST_USD._value.get() - before[2] == pytest.approx(result.estimated_cost_usd)
+
+
+@pytest.mark.asyncio
+async def test_generate_tryon_decodes_streamed_image_without_holding_the_body(monkeypatch):
+    image = bytes(range(256)) * 4096
+    body = json.dumps({'created': 1, 'data': [{'b64_json': base64.b64encode(image).decode()}], 'usage': {}}).encode()
+
+    async def chunks():
+        for start in range(0, len(body), 16384):
+            yield body[start:start + 16384]
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=chunks())
+
+    monkeypatch.setattr(openai_client, '_create_http_client', lambda: _mock_client(handler))
+
+    result = await generate_tryon([('model.jpg', b'a')], request_id='req_stream')
+
+    assert result.image.read() == image
+    # Decoded bytes plus one chunk, never the encoded body on top
+    assert result.peak_buffer_bytes < len(image) + 20000 < len(body)
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from size_rec.mediapipe_service import ModelNotLoadedError
+from size_rec.pose_pool import PosePool, PosePoolBusyError
+
+
+class FrameEchoExtractor:
+    """Stands in for MediaPipe: reports the frame it saw and the worker PID."""
+
+    is_loaded = True
+
+    def extract_landmarks(self, image_rgb: np.ndarray) -> np.ndarray:
+        return np.array(
+            [[image_rgb[0, 0, 0], image_rgb.shape[0], os.getpid(), image_rgb.base is not None]],
+            dtype=np.float64,
+        )
+
+
+class CrashingExtractor(FrameEchoExtractor):
+    """Kills its worker process on an all-white frame, like an OOM kill mid-inference."""
+
+    def extract_landmarks(self, image_rgb: np.ndarray) -> np.ndarray:
+        if image_rgb[0, 0, 0] == 255:
+            os._exit(1)
+        return super().extract_landmarks(image_rgb)
+
+
+@pytest.mark.asyncio
+async def test_frames_reach_workers_through_shared_memory():
+    pool = PosePool(workers=2, queue_size=2, queue_timeout=30.0, factory=FrameEchoExtractor)
+    await pool.start()
+    try:
+        assert pool.is_loaded is True
+        frames = [np.full((64 + i, 48, 3), i, dtype=np.uint8) for i in range(6)]
+
+        results = await asyncio.gather(*(pool.extract_landmarks(frame) for frame in frames))
+
+        assert [(r[0, 0], r[0, 1]) for r in results] == [(float(i), 64.0 + i) for i in range(6)]
+        # Each worker viewed the frame in place over the shared buffer, in another process
+        assert all(r[0, 3] == 1.0 for r in results)
+        assert os.getpid() not in {r[0, 2] for r in results}
+        assert pool._free.qsize() == 4
+    finally:
+        pool.shutdown()
+
+
+class UnloadedExtractor(FrameEchoExtractor):
+    is_loaded = False
+
+
+async def test_every_worker_reports_ready_before_the_pool_is_loaded(monkeypatch):
+    reports: list[dict[int, bool]] = []
+    collect_ready = PosePool._collect_ready
+
+    def recording_collect(self):
+        loaded = collect_ready(self)
+        reports.append(loaded)
+        return loaded
+
+    monkeypatch.setattr(PosePool, '_collect_ready', recording_collect)
+    pool = PosePool(workers=2, queue_size=0, queue_timeout=30.0, factory=FrameEchoExtractor)
+    await pool.start()
+    try:
+        assert pool.is_loaded is True
+        # One report per spawned worker process, not per probe task
+        assert len(reports[0]) == 2 and os.getpid() not in reports[0]
+    finally:
+        pool.shutdown()
+
+    unloaded = PosePool(workers=1, queue_size=0, queue_timeout=30.0, factory=UnloadedExtractor)
+    await unloaded.start()
+    try:
+        assert unloaded.is_loaded is False
+    finally:
+        unloaded.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_saturated_pool_rejects_instead_of_queueing_forever():
+    pool = PosePool(workers=1, queue_size=0, queue_timeout=0.01, factory=FrameEchoExtractor)
+    await pool.start()
+    try:
+        slot = await pool._free.get()
+        with pytest.raises(PosePoolBusyError):
+            await pool.extract_landmarks(np.zeros((8, 8, 3), dtype=np.uint8))
+        pool._free.put_nowait(slot)
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_crashed_pool_is_replaced_once_and_reprobed():
+    pool = PosePool(workers=1, queue_size=2, queue_timeout=30.0, factory=CrashingExtractor)
+    await pool.start()
+    created: list[object] = []
+    create_executor = pool._create_executor
+
+    def counting_create():
+        executor = create_executor()
+        created.append(executor)
+        return executor
+
+    pool._create_executor = counting_create  # type: ignore[method-assign]
+    try:
+        crash = np.full((8, 8, 3), 255, dtype=np.uint8)
+        results = await asyncio.gather(
+            *(pool.extract_landmarks(crash) for _ in range(3)), return_exceptions=True
+        )
+
+        assert all(isinstance(result, ModelNotLoadedError) for result in results)
+        # Every request saw the same broken pool; only the first one replaced it
+        assert len(created) == 1 and pool._executor is created[0]
+        assert pool.is_loaded is True
+        healthy = await pool.extract_landmarks(np.full((8, 8, 3), 7, dtype=np.uint8))
+        assert healthy[0, 0] == 7.0
+    finally:
+        pool.shutdown()
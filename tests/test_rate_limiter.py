@@ -0,0 +1,86 @@
+import pytest
+
+from services.rate_limiter import (
+    OpenAIRateLimiter,
+    RateLimitTimeout,
+    parse_reset_duration,
+    pause_from_headers,
+)
+
+
+class StubRedis:
+    def __init__(self, replies: list) -> None:
+        self.replies = list(replies)
+        self.calls: list[tuple] = []
+
+    async def eval(self, _script: str, _numkeys: int, *args):
+        self.calls.append(args)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def make_limiter(redis: StubRedis) -> OpenAIRateLimiter:
+    limiter = OpenAIRateLimiter('redis://unused')
+    limiter._redis = lambda: redis  # type: ignore[method-assign]
+    return limiter
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration('20ms') == pytest.approx(0.02)
+    assert parse_reset_duration('1s') == 1.0
+    assert parse_reset_duration('6m0s') == 360.0
+    assert parse_reset_duration('garbage') is None
+
+
+def test_pause_from_headers_prefers_retry_after():
+    assert pause_from_headers({'retry-after-ms': '1500', 'retry-after': '9'}) == 1.5
+    assert pause_from_headers({'retry-after': '4'}) == 4.0
+    assert pause_from_headers({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '2s'}) == 2.0
+    assert pause_from_headers({'x-ratelimit-remaining-requests': '5', 'x-ratelimit-reset-requests': '2s'}) == 0.0
+    assert pause_from_headers({}) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_token_then_proceeds(monkeypatch):
+    sleeps: list[float] = []
+
+    async def fake_sleep(delay: float) -> None:
+        sleeps.append(delay)
+
+    monkeypatch.setattr('services.rate_limiter.asyncio.sleep', fake_sleep)
+    redis = StubRedis([[250, '300'], [0, '300']])
+
+    await make_limiter(redis).acquire(max_wait=10)
+
+    assert sleeps == [0.25]
+    assert len(redis.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_acquire_gives_up_after_max_wait():
+    redis = StubRedis([[30_000, '30']])
+
+    with pytest.raises(RateLimitTimeout):
+        await make_limiter(redis).acquire(max_wait=5)
+
+
+@pytest.mark.asyncio
+async def test_limiter_fails_open_when_redis_unavailable():
+    redis = StubRedis([ConnectionError('down'), ConnectionError('down')])
+    limiter = make_limiter(redis)
+
+    await limiter.acquire(max_wait=1)
+    await limiter.record_throttle({'retry-after': '1'})
+
+
+@pytest.mark.asyncio
+async def test_throttle_feedback_sends_pause_from_headers():
+    redis = StubRedis(['150'])
+
+    await make_limiter(redis).record_throttle({'retry-after': '3'})
+
+    op, pause_ms = redis.calls[0][1], redis.calls[0][2]
+    assert op == 'throttle'
+    assert pause_ms == 3000
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+import redis.asyncio as aioredis
+
+from services import redis_client
+from services.metrics import REDIS_POOL_IN_USE
+
+
+def test_sync_client_is_shared_and_pool_limited(monkeypatch):
+    monkeypatch.setattr(redis_client, '_sync_clients', {})
+    monkeypatch.setattr(redis_client.settings, 'redis_max_connections', 3)
+
+    first = redis_client.get_sync_redis('redis://example:6379/0')
+    second = redis_client.get_sync_redis('redis://example:6379/0')
+    raw = redis_client.get_sync_redis('redis://example:6379/0', decode_responses=False)
+
+    assert first is second
+    assert raw is not first
+    pool = first.connection_pool
+    assert pool.max_connections == 3
+    assert pool.connection_kwargs['socket_keepalive'] is True
+
+
+@pytest.mark.asyncio
+async def test_async_clients_are_per_event_loop():
+    client = redis_client.get_async_redis('redis://example:6379/0')
+    assert redis_client.get_async_redis('redis://example:6379/0') is client
+
+    other_loop_client = await asyncio.to_thread(
+        asyncio.run, _get_client_on_new_loop()
+    )
+    assert other_loop_client is not client
+
+    await redis_client.close_async_redis()
+    assert redis_client.get_async_redis('redis://example:6379/0') is not client
+    await redis_client.close_async_redis()
+
+
+async def _get_client_on_new_loop():
+    return redis_client.get_async_redis('redis://example:6379/0')
+
+
+@pytest.mark.asyncio
+async def test_pool_checkouts_are_tracked(monkeypatch):
+    async def checkout(self, *_args, **_kwargs):
+        return 'connection'
+
+    async def release(self, _connection):
+        pass
+
+    # Stand in for the network side of the base pool; only the accounting is under test
+    monkeypatch.setattr(aioredis.BlockingConnectionPool, 'get_connection', checkout)
+    monkeypatch.setattr(aioredis.BlockingConnectionPool, 'release', release)
+    pool = redis_client._TrackedAsyncPool(max_connections=2, timeout=1)
+    gauge = REDIS_POOL_IN_USE.labels(pool='async')
+    before = gauge._value.get()
+
+    connection = await pool.get_connection()
+    assert gauge._value.get() == before + 1
+    await pool.release(connection)
+    assert gauge._value.get() == before
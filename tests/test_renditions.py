@@ -0,0 +1,76 @@
+import io
+import threading
+
+import pytest
+import structlog
+from PIL import Image
+
+from config.settings import settings
+from services import renditions
+from services.renditions import RenditionSpec, encode_rendition, parse_renditions, store_renditions
+
+
+def jpeg(width: int = 1024, height: int = 1536) -> bytes:
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (180, 120, 90)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    def configure(value: str) -> None:
+        monkeypatch.setattr(settings, 'result_renditions', value)
+        renditions.configured_renditions.cache_clear()
+
+    yield configure
+    renditions.configured_renditions.cache_clear()
+
+
+def test_specs_are_parsed_and_bad_entries_skipped():
+    specs = parse_renditions('webp:full, jpeg:full,webp:512,gif:100,webp:tiny,webp:512')
+
+    assert specs == [RenditionSpec('webp'), RenditionSpec('jpeg'), RenditionSpec('webp', 512)]
+    assert [spec.name for spec in specs] == ['webp_full', 'jpeg_full', 'webp_512']
+    assert specs[2].path_for('generated/user-1/sess-1.jpg') == 'generated/user-1/sess-1.512.webp'
+
+
+def test_thumbnail_keeps_aspect_and_format():
+    rendition, _cpu = encode_rendition(jpeg(), RenditionSpec('webp', 256))
+    progressive, _cpu = encode_rendition(jpeg(), RenditionSpec('jpeg'))
+
+    with Image.open(io.BytesIO(rendition.data)) as img:
+        assert (img.format, img.size) == ('WEBP', (171, 256))
+    with Image.open(io.BytesIO(progressive.data)) as img:
+        assert img.format == 'JPEG' and img.info.get('progressive') and img.size == (1024, 1536)
+
+
+@pytest.mark.asyncio
+async def test_renditions_upload_concurrently_and_failures_are_left_out(configured):
+    configured('webp:full,jpeg:full,webp:256')
+    uploads: dict[str, str] = {}
+    threads: set[str] = set()
+
+    class Bucket:
+        def upload(self, path: str, data: bytes, options: dict) -> None:
+            threads.add(threading.current_thread().name)
+            if path.endswith('.full.jpg'):
+                raise RuntimeError('storage unavailable')
+            uploads[path] = options['content-type']
+
+    stored = await store_renditions(Bucket(), jpeg(), 'stores/store-1/generated/sess-1.jpg', structlog.get_logger())
+
+    assert uploads == {
+        'stores/store-1/generated/sess-1.full.webp': 'image/webp',
+        'stores/store-1/generated/sess-1.256.webp': 'image/webp',
+    }
+    assert stored == {
+        'webp_full': {
+            'path': 'stores/store-1/generated/sess-1.full.webp', 'content_type': 'image/webp',
+            'width': 1024, 'height': 1536,
+        },
+        'webp_256': {
+            'path': 'stores/store-1/generated/sess-1.256.webp', 'content_type': 'image/webp',
+            'width': 171, 'height': 256,
+        },
+    }
+    assert threading.current_thread().name not in threads
@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+
+from services import result_cache as result_cache_module
+from services.result_cache import LOCK_KEY_PREFIX, ResultCache, result_cache_key
+
+
+class FakeAsyncRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+        self.refreshes = 0
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    async def set(self, key: str, value: str, nx: bool = False, ex: int | None = None) -> bool:
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def delete(self, key: str) -> int:
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    async def eval(self, script: str, _numkeys: int, key: str, token: str, *args) -> int:
+        if self.data.get(key) != token:
+            return 0
+        if script == result_cache_module._REFRESH_SCRIPT:
+            self.refreshes += 1
+        else:
+            del self.data[key]
+        return 1
+
+
+class FakeSyncRedis:
+    """The refresher thread's view of the same fake data."""
+
+    def __init__(self, async_fake: FakeAsyncRedis) -> None:
+        self.async_fake = async_fake
+
+    def eval(self, script: str, numkeys: int, key: str, token: str, *args) -> int:
+        return asyncio.run(self.async_fake.eval(script, numkeys, key, token, *args))
+
+
+@pytest.fixture
+def cache(monkeypatch) -> ResultCache:
+    monkeypatch.setattr(result_cache_module.settings, 'result_dedup_poll_seconds', 0.01)
+    cache = ResultCache('redis://unused')
+    fake = FakeAsyncRedis()
+    sync_fake = FakeSyncRedis(fake)
+    cache._redis = lambda: fake  # type: ignore[method-assign]
+    cache._sync_redis = lambda: sync_fake  # type: ignore[method-assign]
+    return cache
+
+
+def test_result_cache_key_depends_on_inputs_order_and_params():
+    buffers = [('model.jpg', b'person'), ('image_1.jpg', b'shirt')]
+    key = result_cache_key(buffers, 'prompt', 'medium', '1024x1536')
+
+    assert key == result_cache_key(list(buffers), 'prompt', 'medium', '1024x1536')
+    assert key != result_cache_key(buffers[::-1], 'prompt', 'medium', '1024x1536')
+    assert key != result_cache_key(buffers, 'prompt', 'high', '1024x1536')
+    assert key != result_cache_key(buffers, 'other prompt', 'medium', '1024x1536')
+
+
+@pytest.mark.asyncio
+async def test_identical_tasks_coalesce_onto_leader(cache):
+    leader = await cache.acquire('k')
+    assert leader.outcome == 'miss' and leader.owns_lock
+
+    waiter = asyncio.create_task(cache.acquire('k'))
+    await asyncio.sleep(0.03)
+    assert not waiter.done()
+
+    await cache.store('k', 'generated/user-1/sess-1.jpg')
+    await cache.release(leader)
+
+    follower = await waiter
+    assert follower.outcome == 'coalesced'
+    assert follower.cached_path == 'generated/user-1/sess-1.jpg'
+    assert not follower.owns_lock
+
+    later = await cache.acquire('k')
+    assert later.outcome == 'hit'
+
+
+@pytest.mark.asyncio
+async def test_waiter_takes_over_when_leader_fails(cache):
+    leader = await cache.acquire('k')
+    waiter = asyncio.create_task(cache.acquire('k'))
+    await asyncio.sleep(0.03)
+
+    await cache.release(leader)
+
+    takeover = await waiter
+    assert takeover.outcome == 'miss'
+    assert takeover.owns_lock
+
+
+@pytest.mark.asyncio
+async def test_release_does_not_drop_someone_elses_lock(cache):
+    first = await cache.acquire('k')
+    fake = cache._redis()
+    fake.data[LOCK_KEY_PREFIX + 'k'] = 'another-token'
+
+    await cache.release(first)
+
+    assert fake.data[LOCK_KEY_PREFIX + 'k'] == 'another-token'
+
+
+async def test_leader_keeps_lock_alive_until_release(cache, monkeypatch):
+    monkeypatch.setattr(result_cache_module.settings, 'result_dedup_lock_seconds', 0.03)
+    fake = cache._redis()
+
+    leader = await cache.acquire('k')
+    # Blocking the loop, as an upload or finalize does under prefork, does not stop the refresh
+    time.sleep(0.05)
+    assert fake.refreshes >= 2
+
+    await cache.release(leader)
+    assert leader.stop_refresh is not None and leader.stop_refresh.is_set()
+    assert LOCK_KEY_PREFIX + 'k' not in fake.data
+
+
+async def test_follower_rechecks_before_generating_without_the_lock(cache, monkeypatch):
+    monkeypatch.setattr(result_cache_module.settings, 'result_dedup_wait_seconds', 0.02)
+    monkeypatch.setattr(result_cache_module.settings, 'result_dedup_poll_seconds', 0.05)
+    leader = await cache.acquire('k')
+    waiter = asyncio.create_task(cache.acquire('k'))
+
+    # The result lands after the follower's deadline but before its final poll
+    await asyncio.sleep(0.03)
+    await cache.store('k', 'generated/user-1/sess-1.jpg')
+    assert (await waiter).outcome == 'coalesced'
+
+    await cache.forget('k')
+    follower = await cache.acquire('k')
+    assert follower.outcome == 'miss' and not follower.owns_lock
+    await cache.release(leader)
@@ -0,0 +1,94 @@
+from collections import Counter
+
+from config.settings import settings
+from models.task_payload import GenerationTask
+from worker.scheduler import FairScheduler, create_scheduler, lease_member, parse_inflight, task_tenant
+
+
+def make_task(session_id: str, channel: str = 'b2c', owner: str = 'user-1') -> GenerationTask:
+    owner_field = 'store_id' if channel == 'b2b' else 'user_id'
+    return GenerationTask(
+        task_id=session_id,
+        channel=channel,
+        session_id=session_id,
+        image_urls=['https://example.com/img.jpg'],
+        prompt='',
+        request_id=f'req_{session_id}',
+        created_at='2026-02-09T14:30:00Z',
+        **{owner_field: owner},
+    )
+
+
+def make_scheduler(max_inflight: int = 100, b2b_cap: int = 100) -> FairScheduler:
+    return FairScheduler(weights={'b2c': 3, 'b2b': 1}, tenant_caps={'b2c': 2, 'b2b': b2b_cap}, max_inflight=max_inflight)
+
+
+def test_bulk_store_job_does_not_starve_shoppers():
+    scheduler = make_scheduler()
+    for i in range(50):
+        scheduler.add(make_task(f'bulk-{i}', 'b2b', 'store-big'))
+    for i in range(6):
+        scheduler.add(make_task(f'shopper-{i}', owner=f'user-{i}'))
+
+    order = [task.session_id for task in scheduler.select(Counter())]
+
+    # Three shoppers per store task while both channels have work
+    assert order[:8] == [
+        'shopper-0', 'shopper-1', 'shopper-2', 'bulk-0',
+        'shopper-3', 'shopper-4', 'shopper-5', 'bulk-1',
+    ]
+    assert order[8:] == [f'bulk-{i}' for i in range(2, 50)]
+    assert scheduler.buffered == 0
+
+
+def test_weights_hold_when_slots_free_one_at_a_time():
+    scheduler = make_scheduler(max_inflight=1)
+    for i in range(8):
+        scheduler.add(make_task(f'bulk-{i}', 'b2b', 'store-big'))
+        scheduler.add(make_task(f'shopper-{i}', owner=f'user-{i}'))
+
+    channels = [scheduler.select(Counter())[0].channel for _ in range(8)]
+
+    assert channels == ['b2c', 'b2c', 'b2c', 'b2b', 'b2c', 'b2c', 'b2c', 'b2b']
+
+
+def test_tenant_and_global_caps():
+    scheduler = make_scheduler(max_inflight=4, b2b_cap=2)
+    for i in range(5):
+        scheduler.add(make_task(f'bulk-{i}', 'b2b', 'store-big'))
+    scheduler.add(make_task('other', 'b2b', 'store-small'))
+
+    first = scheduler.select(Counter({'b2b:store-big': 1}))
+    assert [task.session_id for task in first] == ['bulk-0', 'other']
+
+    # Global cap of 4 with 3 already in flight leaves one slot
+    second = scheduler.select(Counter({'b2c:user-9': 3}))
+    assert [task.session_id for task in second] == ['bulk-1']
+
+
+def test_global_cap_defaults_to_worker_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, 'scheduler_max_inflight', 0)
+    monkeypatch.setattr(settings, 'worker_pool', 'prefork')
+    monkeypatch.setattr(settings, 'worker_concurrency', 5)
+    monkeypatch.setattr(settings, 'scheduler_b2b_tenant_max_inflight', 10)
+
+    scheduler = create_scheduler()
+
+    # A single store can never hold every slot
+    assert scheduler.max_inflight == 5
+    assert scheduler.tenant_caps['b2b'] == 4
+    for i in range(6):
+        scheduler.add(make_task(f'bulk-{i}', 'b2b', 'store-big'))
+    scheduler.add(make_task('shopper-0'))
+    assert sorted(task.session_id for task in scheduler.select(Counter())) == [
+        'bulk-0', 'bulk-1', 'bulk-2', 'bulk-3', 'shopper-0',
+    ]
+
+
+def test_lease_members_map_back_to_tenants():
+    b2b = make_task('s-1', 'b2b', 'store-1')
+    b2c = make_task('s-2')
+
+    members = [lease_member(b2b.model_dump()), lease_member(b2c.model_dump()), lease_member(b2c.model_dump())]
+
+    assert parse_inflight(members) == Counter({task_tenant(b2b): 1, task_tenant(b2c): 2})
@@ -0,0 +1,106 @@
+from unittest.mock import MagicMock
+
+import pytest
+import structlog
+from postgrest.exceptions import APIError
+
+from models.task_payload import GenerationTask
+from services import session_store
+from services.metrics import GENERATION_REFUNDS
+
+TASK = GenerationTask(
+    task_id='t-1',
+    channel='b2b',
+    store_id='store-1',
+    session_id='sess-1',
+    image_urls=['https://example.com/a.jpg'],
+    prompt='try on',
+    request_id='req-1',
+    version=1,
+    created_at='2026-01-01T00:00:00Z',
+)
+LOG = structlog.get_logger()
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    client = MagicMock()
+    monkeypatch.setattr(session_store, 'get_supabase', lambda: client)
+    monkeypatch.setattr(session_store, '_finalize_rpc_available', True)
+    return client
+
+
+def test_claim_is_a_single_conditional_update(supabase):
+    update = supabase.table.return_value.update
+    update.return_value.eq.return_value.in_.return_value.execute.return_value.data = [{'id': 'sess-1'}]
+
+    assert session_store.claim_session(TASK) is True
+    supabase.table.assert_called_once_with('store_generation_sessions')
+    update.assert_called_once_with({'status': 'processing'})
+    update.return_value.eq.return_value.in_.assert_called_once_with('status', ['queued', 'processing'])
+    supabase.table.return_value.select.assert_not_called()
+
+
+def test_claim_leaves_sessions_from_before_startup_to_cleanup(supabase, monkeypatch):
+    monkeypatch.setenv(session_store.STARTUP_CUTOFF_ENV, '2026-03-01T10:00:00+00:00')
+    claim = supabase.table.return_value.update.return_value.eq.return_value.in_.return_value
+    claim.gte.return_value.execute.return_value.data = []
+
+    assert session_store.claim_session(TASK) is False
+    claim.gte.assert_called_once_with('created_at', '2026-03-01T10:00:00+00:00')
+
+
+def test_claim_rejects_failed_or_completed_session(supabase):
+    update = supabase.table.return_value.update
+    update.return_value.eq.return_value.in_.return_value.execute.return_value.data = []
+
+    assert session_store.claim_session(TASK) is False
+
+
+def test_failed_finalize_refunds_in_the_same_rpc(supabase):
+    supabase.rpc.return_value.execute.return_value.data = True
+
+    assert session_store.finalize_session(TASK, 'failed', {'error_message': 'boom'}, refund=True, log=LOG) is True
+
+    supabase.rpc.assert_called_once_with('finalize_generation_session', {
+        'p_channel': 'b2b',
+        'p_session_id': 'sess-1',
+        'p_status': 'failed',
+        'p_fields': {'error_message': 'boom'},
+        'p_refund_owner_id': 'store-1',
+        'p_request_id': 'req-1',
+    })
+    supabase.table.assert_not_called()
+
+
+def test_finalize_skips_session_no_longer_processing(supabase):
+    supabase.rpc.return_value.execute.return_value.data = False
+    refunds_before = GENERATION_REFUNDS._value.get()
+
+    assert session_store.finalize_session(TASK, 'failed', {'error_message': 'boom'}, refund=True, log=LOG) is False
+    assert GENERATION_REFUNDS._value.get() == refunds_before
+
+
+def test_finalize_falls_back_when_rpc_is_missing(supabase):
+    missing = APIError({'code': 'PGRST202', 'message': 'Could not find the function'})
+    supabase.rpc.return_value.execute.side_effect = [missing, MagicMock()]
+    update = supabase.table.return_value.update
+    update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [{'id': 'sess-1'}]
+
+    assert session_store.finalize_session(TASK, 'failed', {'error_message': 'boom'}, refund=True, log=LOG) is True
+
+    assert session_store._finalize_rpc_available is False
+    assert supabase.rpc.call_args_list[-1][0] == (
+        'refund_store_credits', {'p_store_id': 'store-1', 'p_amount': 1, 'p_request_id': 'req-1'},
+    )
+    update.assert_called_once_with({'status': 'failed', 'error_message': 'boom'})
+    update.return_value.eq.return_value.eq.assert_called_once_with('status', 'processing')
+
+
+def test_fallback_does_not_refund_session_no_longer_processing(supabase):
+    session_store._finalize_rpc_available = False
+    update = supabase.table.return_value.update
+    update.return_value.eq.return_value.eq.return_value.execute.return_value.data = []
+
+    assert session_store.finalize_session(TASK, 'failed', {'error_message': 'boom'}, refund=True, log=LOG) is False
+    supabase.rpc.assert_not_called()
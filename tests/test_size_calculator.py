@@ -1,25 +1,66 @@
-from size_rec.size_calculator import calculate_size_recommendation
-
-
-def make_landmarks(visibility: float) -> list[dict[str, float]]:
-    points: list[dict[str, float]] = []
-    for index in range(33):
-        points.append(
-            {
-                'x': 0.5,
-                'y': index / 32,
-                'z': 0.0,
-                'visibility': visibility,
-            }
-        )
-
-    points[11]['x'] = 0.4
-    points[12]['x'] = 0.6
-    points[23]['x'] = 0.41
-    points[24]['x'] = 0.59
+import math
+
+import numpy as np
+
+from size_rec.size_calculator import (
+    SIZE_ORDER,
+    SIZE_THRESHOLDS,
+    calculate_size_batch,
+    calculate_size_recommendation,
+)
+
+
+def make_landmarks(visibility: float) -> np.ndarray:
+    points = np.zeros((33, 4), dtype=np.float32)
+    points[:, 0] = 0.5
+    points[:, 1] = np.arange(33) / 32
+    points[:, 3] = visibility
+
+    points[11, 0] = 0.4
+    points[12, 0] = 0.6
+    points[23, 0] = 0.41
+    points[24, 0] = 0.59
     return points
 
 
+def scalar_reference(landmarks: list[dict[str, float]], height_cm: float) -> tuple:
+    """The original per-dict implementation, kept to pin the vectorized maths to it."""
+
+    def distance(first: int, second: int) -> float:
+        a, b = landmarks[first], landmarks[second]
+        dx, dy, dz = a['x'] - b['x'], a['y'] - b['y'], a['z'] - b['z']
+        return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+    def clamp(value: float, min_value: float, max_value: float) -> float:
+        return max(min_value, min(max_value, value))
+
+    min_y = min(landmark['y'] for landmark in landmarks)
+    max_y = max(landmark['y'] for landmark in landmarks)
+    cm_per_unit = height_cm / max(max_y - min_y, 0.25)
+    shoulder_width_cm = distance(11, 12) * cm_per_unit
+    hip_width_cm = distance(23, 24) * cm_per_unit
+
+    shoulder_cm = clamp(shoulder_width_cm, 30.0, 65.0)
+    chest_cm = clamp(shoulder_width_cm * 2.15, 70.0, 150.0)
+    waist_cm = clamp(hip_width_cm * 1.55, 58.0, 140.0)
+    hip_cm = clamp(hip_width_cm * 1.95, 70.0, 160.0)
+    visibility_avg = sum(landmark['visibility'] for landmark in landmarks) / len(landmarks)
+    confidence = clamp(0.55 + 0.35 * visibility_avg, 0.4, 0.98)
+
+    reference = max(chest_cm, waist_cm, hip_cm)
+    size = next((s for s, threshold in SIZE_THRESHOLDS.items() if reference <= threshold), 'XXL')
+    ratio = shoulder_cm / max(hip_cm, 1.0)
+    if ratio > 1.12:
+        body_type = 'broad'
+    elif ratio > 1.03:
+        body_type = 'athletic'
+    elif ratio < 0.93:
+        body_type = 'slim'
+    else:
+        body_type = 'average'
+    return chest_cm, waist_cm, hip_cm, shoulder_cm, confidence, size, body_type
+
+
 def test_calculate_size_recommendation_returns_definitive_range_for_high_confidence():
     response = calculate_size_recommendation(make_landmarks(visibility=1.0), height_cm=175)
 
@@ -33,3 +74,23 @@ def test_calculate_size_recommendation_returns_size_range_for_low_confidence():
 
     assert response.confidence < 0.8
     assert response.size_range.lower != response.size_range.upper
+
+
+def test_batch_matches_scalar_reference_bit_for_bit():
+    rng = np.random.default_rng(7)
+    landmarks = rng.normal(0.0, 0.3, size=(500, 33, 4)).astype(np.float32)
+    landmarks[:, :, 3] = rng.random((500, 33), dtype=np.float32)
+    heights = rng.uniform(100, 250, size=500)
+
+    batch = calculate_size_batch(landmarks, heights)
+
+    for row in range(len(landmarks)):
+        points = [dict(zip('x y z visibility'.split(), map(float, lm))) for lm in landmarks[row]]
+        chest, waist, hip, shoulder, confidence, size, body_type = scalar_reference(points, float(heights[row]))
+        assert (batch.chest_cm[row], batch.waist_cm[row], batch.hip_cm[row]) == (chest, waist, hip)
+        assert (batch.shoulder_cm[row], batch.confidence[row]) == (shoulder, confidence)
+        assert (SIZE_ORDER[batch.size_index[row]], batch.body_type[row]) == (size, body_type)
+
+    single = calculate_size_recommendation(landmarks[3], float(heights[3]))
+    assert single == batch.response(3)
+    assert len({r.recommended_size for r in batch.responses()}) > 1
@@ -1,21 +1,37 @@
+import asyncio
 import importlib
+import json
+import time
 
 import numpy as np
+import httpx
 import pytest
 from fastapi import HTTPException
 
 from models.size_rec import EstimateBodyRequest
+from size_rec.health import HealthProber
 from size_rec.image_processing import ImageDownloadError
+from size_rec.landmark_cache import LandmarkCache
+from size_rec.pose_pool import PosePoolBusyError
 
 app_module = importlib.import_module('size_rec.app')
 
 
-class StubMediaPipeService:
-    def __init__(self, landmarks: list[dict[str, float]], loaded: bool = True) -> None:
+@pytest.fixture(autouse=True)
+def fresh_landmark_cache(monkeypatch):
+    cache = LandmarkCache(max_entries=16, ttl_seconds=60)
+    monkeypatch.setattr(app_module, 'get_landmark_cache', lambda: cache)
+    monkeypatch.setattr(app_module, 'prepare_image', lambda _content: np.zeros((64, 64, 3), dtype=np.uint8))
+    return cache
+
+
+class StubPosePool:
+    def __init__(self, landmarks: np.ndarray, loaded: bool = True) -> None:
         self._landmarks = landmarks
         self.is_loaded = loaded
+        self.workers = 2
 
-    def extract_landmarks(self, _image_rgb: np.ndarray) -> list[dict[str, float]]:
+    async def extract_landmarks(self, _image_rgb: np.ndarray) -> np.ndarray:
         return self._landmarks
 
 
@@ -27,22 +43,16 @@ class StubRedisClient:
         return self._connected
 
 
-def make_landmarks(visibility: float = 1.0) -> list[dict[str, float]]:
-    points: list[dict[str, float]] = []
-    for index in range(33):
-        points.append(
-            {
-                'x': 0.5,
-                'y': index / 32,
-                'z': 0.0,
-                'visibility': visibility,
-            }
-        )
-
-    points[11]['x'] = 0.4
-    points[12]['x'] = 0.6
-    points[23]['x'] = 0.41
-    points[24]['x'] = 0.59
+def make_landmarks(visibility: float = 1.0) -> np.ndarray:
+    points = np.zeros((33, 4), dtype=np.float32)
+    points[:, 0] = 0.5
+    points[:, 1] = np.arange(33) / 32
+    points[:, 3] = visibility
+
+    points[11, 0] = 0.4
+    points[12, 0] = 0.6
+    points[23, 0] = 0.41
+    points[24, 0] = 0.59
     return points
 
 
@@ -50,11 +60,12 @@ def make_landmarks(visibility: float = 1.0) -> list[dict[str, float]]:
 async def test_estimate_body_returns_valid_measurements(monkeypatch):
     async def fake_download(_image_url: str, timeout_seconds: float = 5.0):
         assert timeout_seconds == 5.0
-        return np.zeros((64, 64, 3), dtype=np.uint8)
+        return b'model-photo'
+
 
-    monkeypatch.setattr(app_module, '_mediapipe_service', StubMediaPipeService(make_landmarks()))
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks()))
     monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(True))
-    monkeypatch.setattr(app_module, 'download_and_prepare_image', fake_download)
+    monkeypatch.setattr(app_module, 'download_image_bytes', fake_download)
 
     payload = EstimateBodyRequest(
         image_url='https://example.com/model.jpg',
@@ -92,12 +103,19 @@ def _fake_check_http(result: bool):
     return _check
 
 
+async def refresh_health(monkeypatch):
+    prober = app_module.create_health_prober()
+    await prober.refresh()
+    monkeypatch.setattr(app_module, '_health_prober', prober)
+
+
 @pytest.mark.asyncio
 async def test_health_endpoint_reports_model_and_redis_status(monkeypatch):
-    monkeypatch.setattr(app_module, '_mediapipe_service', StubMediaPipeService(make_landmarks(), loaded=True))
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks(), loaded=True))
     monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(True))
     monkeypatch.setattr(app_module, 'celery_app', StubCeleryApp(alive=True))
     monkeypatch.setattr(app_module, '_check_http', _fake_check_http(True))
+    await refresh_health(monkeypatch)
 
     response = await app_module.health()
     assert response.size_rec_model_loaded is True
@@ -111,10 +129,11 @@ async def test_health_endpoint_reports_model_and_redis_status(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_health_endpoint_reports_degraded_when_dependencies_not_ready(monkeypatch):
-    monkeypatch.setattr(app_module, '_mediapipe_service', StubMediaPipeService(make_landmarks(), loaded=False))
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks(), loaded=False))
     monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(False))
     monkeypatch.setattr(app_module, 'celery_app', StubCeleryApp(alive=False))
     monkeypatch.setattr(app_module, '_check_http', _fake_check_http(False))
+    await refresh_health(monkeypatch)
 
     response = await app_module.health()
     assert response.size_rec_model_loaded is False
@@ -131,9 +150,9 @@ async def test_estimate_body_returns_400_on_image_timeout(monkeypatch):
     async def fake_download(_image_url: str, timeout_seconds: float = 5.0):
         raise ImageDownloadError('Image download timed out or failed')
 
-    monkeypatch.setattr(app_module, '_mediapipe_service', StubMediaPipeService(make_landmarks()))
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks()))
     monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(True))
-    monkeypatch.setattr(app_module, 'download_and_prepare_image', fake_download)
+    monkeypatch.setattr(app_module, 'download_image_bytes', fake_download)
 
     payload = EstimateBodyRequest(
         image_url='https://example.com/slow-image.jpg',
@@ -146,3 +165,184 @@ async def test_estimate_body_returns_400_on_image_timeout(monkeypatch):
     assert exc_info.value.status_code == 400
     assert exc_info.value.detail == 'Invalid or inaccessible image URL'
 
+
+
+@pytest.mark.asyncio
+async def test_estimate_body_returns_503_when_pose_pool_is_saturated(monkeypatch):
+    async def fake_download(_image_url: str, timeout_seconds: float = 5.0):
+        return b'model-photo'
+
+
+    class BusyPosePool(StubPosePool):
+        async def extract_landmarks(self, _image_rgb: np.ndarray) -> np.ndarray:
+            raise PosePoolBusyError('All pose inference slots are busy')
+
+    monkeypatch.setattr(app_module, '_pose_pool', BusyPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, 'download_image_bytes', fake_download)
+
+    payload = EstimateBodyRequest(image_url='https://example.com/model.jpg', height_cm=175.0)
+    with pytest.raises(HTTPException) as exc_info:
+        await app_module.estimate_body(payload)
+
+    assert exc_info.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_same_photo_is_inferred_once_for_any_height(monkeypatch):
+    calls = 0
+
+    class CountingPosePool(StubPosePool):
+        async def extract_landmarks(self, image_rgb: np.ndarray) -> np.ndarray:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return await super().extract_landmarks(image_rgb)
+
+    async def fake_download(_image_url: str, timeout_seconds: float = 5.0):
+        return b'same-photo'
+
+    monkeypatch.setattr(app_module, '_pose_pool', CountingPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, 'download_image_bytes', fake_download)
+
+    requests = [
+        EstimateBodyRequest(image_url='https://example.com/model.jpg', height_cm=height)
+        for height in (160.0, 175.0, 190.0)
+    ]
+    concurrent = await asyncio.gather(*(app_module.estimate_body(r) for r in requests[:2]))
+    later = await app_module.estimate_body(requests[2])
+
+    assert calls == 1
+    assert concurrent[0].measurements.shoulder_cm < concurrent[1].measurements.shoulder_cm
+    assert later.measurements.shoulder_cm > concurrent[1].measurements.shoulder_cm
+
+
+@pytest.mark.asyncio
+async def test_batch_streams_a_line_per_item_with_errors_inline(monkeypatch):
+    clients = set()
+
+    async def fake_download(image_url: str, timeout_seconds: float = 5.0, client=None):
+        clients.add(id(client))
+        if 'broken' in image_url:
+            raise ImageDownloadError('Image URL returned a non-success status')
+        await asyncio.sleep(0.05 if 'slow' in image_url else 0)
+        return image_url.encode()
+
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, 'download_image_bytes', fake_download)
+
+    items = [
+        {'image_url': 'https://example.com/slow.jpg', 'height_cm': 170.0},
+        {'image_url': 'https://example.com/broken.jpg', 'height_cm': 170.0},
+        {'image_url': 'https://example.com/fast.jpg', 'height_cm': 190.0},
+    ]
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        response = await client.post('/estimate-body/batch', json={'items': items})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # Completion order, not request order: the slow download finishes last
+    assert [line['index'] for line in lines] == [1, 2, 0]
+    assert lines[0] == {'index': 1, 'status': 400, 'error': 'Invalid or inaccessible image URL'}
+    assert lines[1]['status'] == 200 and lines[1]['result']['recommended_size']
+    assert len(clients) == 1 and None not in clients
+
+
+async def test_batch_bounds_bodies_held_between_download_and_inference(monkeypatch):
+    buffered = 0
+    peak = 0
+
+    async def fast_download(image_url: str, timeout_seconds: float = 5.0, client=None):
+        nonlocal buffered, peak
+        buffered += 1
+        peak = max(peak, buffered)
+        return image_url.encode()
+
+    class SlowPosePool(StubPosePool):
+        async def extract_landmarks(self, image_rgb: np.ndarray) -> np.ndarray:
+            nonlocal buffered
+            await asyncio.sleep(0.005)
+            buffered -= 1
+            return await super().extract_landmarks(image_rgb)
+
+    monkeypatch.setattr(app_module.settings, 'size_rec_batch_download_concurrency', 3)
+    monkeypatch.setattr(app_module, '_pose_pool', SlowPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, 'download_image_bytes', fast_download)
+    items = [{'image_url': f'https://example.com/{i}.jpg', 'height_cm': 170.0} for i in range(40)]
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        response = await client.post('/estimate-body/batch', json={'items': items})
+
+    assert len(response.text.splitlines()) == 40
+    # Downloads outpace inference, yet at most 3 downloads + 2 inference slots hold a body
+    assert 2 < peak <= 5
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_oversized_batches(monkeypatch):
+    monkeypatch.setattr(app_module.settings, 'size_rec_batch_max_items', 2)
+    items = [{'image_url': 'https://example.com/a.jpg', 'height_cm': 170.0}] * 3
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        response = await client.post('/estimate-body/batch', json={'items': items})
+
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_health_serves_cached_probes_without_blocking(monkeypatch):
+    class SlowCeleryControl:
+        def ping(self, timeout: float = 2.0) -> list:
+            time.sleep(0.3)
+            return [{'celery@worker': {'ok': 'pong'}}]
+
+    slow_celery = StubCeleryApp(alive=True)
+    slow_celery.control = SlowCeleryControl()
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(True))
+    monkeypatch.setattr(app_module, 'celery_app', slow_celery)
+    monkeypatch.setattr(app_module, '_check_http', _fake_check_http(True))
+    await refresh_health(monkeypatch)
+
+    started = time.monotonic()
+    ticker = asyncio.create_task(asyncio.sleep(0))
+    response = await app_module.health()
+    await ticker
+
+    assert response.status == 'ok'
+    assert time.monotonic() - started < 0.05
+
+
+@pytest.mark.asyncio
+async def test_readyz_and_livez(monkeypatch):
+    monkeypatch.setattr(app_module, '_pose_pool', StubPosePool(make_landmarks()))
+    monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(False))
+    monkeypatch.setattr(app_module, 'celery_app', StubCeleryApp(alive=True))
+    monkeypatch.setattr(app_module, '_check_http', _fake_check_http(False))
+    await refresh_health(monkeypatch)
+
+    not_ready = await app_module.readyz()
+    assert not_ready.status_code == 503
+    assert json.loads(not_ready.body) == {'status': 'not_ready', 'failing': ['redis']}
+    assert await app_module.livez() == {'status': 'ok'}
+
+    monkeypatch.setattr(app_module, '_redis_client', StubRedisClient(True))
+    await refresh_health(monkeypatch)
+    assert (await app_module.readyz()).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_stale_probe_results_count_as_failing(monkeypatch):
+    async def ok() -> bool:
+        return True
+
+    prober = HealthProber({'redis': (ok, 10.0)}, timeout_seconds=1.0)
+    await prober.refresh()
+    assert prober.is_ok('redis') is True
+
+    now = time.monotonic()
+    monkeypatch.setattr('size_rec.health.time.monotonic', lambda: now + 60)
+    assert prober.is_ok('redis') is False
@@ -0,0 +1,50 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+
+from size_rec.image_processing import ImageDownloadError, prepare_image
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale(monkeypatch):
+    photo = Image.linear_gradient('L').resize((1536, 2048)).convert('RGB')
+    content = encode(photo, 'JPEG')
+    decode_sizes = []
+    original_draft = JpegImageFile.draft
+
+    def recording_draft(self, mode, size):
+        result = original_draft(self, mode, size)
+        decode_sizes.append(self.size)
+        return result
+
+    monkeypatch.setattr(JpegImageFile, 'draft', recording_draft)
+    frame = prepare_image(content)
+
+    assert frame.shape == (512, 384, 3)
+    assert frame.dtype == np.uint8
+    # libjpeg decodes at 1/2 scale, the smallest that stays above the target
+    assert decode_sizes == [(768, 1024)]
+
+    reference = Image.open(BytesIO(content)).convert('RGB')
+    reference.thumbnail((512, 512), Image.Resampling.LANCZOS)
+    assert np.abs(frame.astype(np.int16) - np.asarray(reference)).mean() < 1.0
+
+
+def test_non_rgb_inputs_are_converted_after_resizing():
+    frame = prepare_image(encode(Image.new('RGBA', (1000, 800), (10, 20, 30, 255)), 'PNG'))
+
+    assert frame.shape == (410, 512, 3)
+    assert tuple(frame[0, 0]) == (10, 20, 30)
+
+
+def test_invalid_bytes_raise_download_error():
+    with pytest.raises(ImageDownloadError):
+        prepare_image(b'not an image')
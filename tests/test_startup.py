@@ -0,0 +1,54 @@
+from datetime import UTC, datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from worker import startup
+
+CUTOFF = datetime(2026, 3, 1, 10, tzinfo=UTC)
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    client = MagicMock()
+    monkeypatch.setattr(startup, 'get_supabase', lambda: client)
+    monkeypatch.setattr(startup.settings, 'startup_cleanup_page_size', 2)
+    return client
+
+
+def test_cleanup_pages_bulk_updates_and_refunds_per_owner(supabase):
+    select = supabase.table.return_value.select.return_value.in_.return_value.lt.return_value
+    # First page comes straight from the filter chain, the second after .gt(last_id)
+    select.order.return_value.limit.return_value.execute.return_value.data = [{'id': 'a'}, {'id': 'b'}]
+    select.gt.return_value.order.return_value.limit.return_value.execute.return_value.data = [{'id': 'c'}]
+    update = supabase.table.return_value.update.return_value.in_.return_value.in_.return_value
+    update.execute.return_value.data = [
+        {'id': 'a', 'user_id': 'u1', 'store_id': 's1'},
+        {'id': 'b', 'user_id': 'u1', 'store_id': 's1'},
+    ]
+
+    startup._cleanup_table('generation_sessions', 'user_id', CUTOFF, page_size=2)
+
+    supabase.table.return_value.select.return_value.in_.return_value.lt.assert_called_with(
+        'created_at', CUTOFF.isoformat()
+    )
+    select.gt.assert_called_once_with('id', 'b')
+    id_filters = [c[0] for c in supabase.table.return_value.update.return_value.in_.call_args_list]
+    assert id_filters == [('id', ['a', 'b']), ('id', ['c'])]
+    # Two sessions of the same owner per page → one refund of 2 credits per page
+    assert supabase.rpc.call_args_list[0][0] == ('refund_credits', {'p_user_id': 'u1', 'p_amount': 2})
+    assert supabase.rpc.call_count == 2
+
+
+def test_store_refunds_use_store_rpc(supabase):
+    select = supabase.table.return_value.select.return_value.in_.return_value.lt.return_value
+    select.order.return_value.limit.return_value.execute.return_value.data = [{'id': 'a'}]
+    update = supabase.table.return_value.update.return_value.in_.return_value.in_.return_value
+    update.execute.return_value.data = [{'id': 'a', 'store_id': 's1'}]
+
+    startup._cleanup_table('store_generation_sessions', 'store_id', CUTOFF, page_size=2)
+
+    rpc_name, params = supabase.rpc.call_args[0]
+    assert rpc_name == 'refund_store_credits'
+    assert params['p_store_id'] == 's1'
+    assert params['p_amount'] == 1
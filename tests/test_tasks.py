@@ -1,4 +1,18 @@
+import asyncio
+import threading
+from datetime import UTC, datetime
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+
 from models.task_payload import GenerationTask
+from services import session_store
+from services.circuit_breaker import CircuitOpenError
+from services.metrics import GENERATION_IN_FLIGHT, GENERATION_OUTCOMES
+from services.result_cache import DedupClaim
+from worker import runtime, tasks
+from worker.runtime import get_event_loop, run_async
 
 SAMPLE_TASK = {
     'task_id': 'test-1',
@@ -20,3 +34,190 @@ def test_task_payload_roundtrip():
     restored = GenerationTask(**dumped)
     assert restored.session_id == 'sess-1'
     assert restored.channel == 'b2c'
+
+
+def test_event_loop_is_reused_across_tasks():
+    """The worker keeps one event loop per process instead of one per task."""
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    first = run_async(current_loop())
+    second = run_async(current_loop())
+    assert first is second is get_event_loop()
+    assert not first.is_closed()
+
+
+def test_asyncio_mode_keeps_many_tasks_in_flight_on_one_loop(monkeypatch):
+    """Pool threads share one loop thread, so their coroutines overlap instead of queueing."""
+    monkeypatch.setattr(runtime.settings, 'worker_pool', 'asyncio')
+    monkeypatch.setattr(runtime, '_loop', None)
+    monkeypatch.setattr(runtime, '_loop_pid', None)
+    monkeypatch.setattr(runtime, '_loop_thread', None)
+    in_flight = 0
+    peak = 0
+
+    async def generation():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return threading.current_thread().name
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        threads = list(pool.map(lambda _: run_async(generation()), range(10)))
+
+    assert peak == 10
+    assert set(threads) == {'event-loop'}
+    loop = runtime._loop
+    loop.call_soon_threadsafe(loop.stop)
+    runtime._loop_thread.join(timeout=1)
+    loop.close()
+
+
+def test_asyncio_mode_time_limit_spans_the_whole_task(monkeypatch):
+    """Consecutive run_async calls share one task deadline instead of a fresh limit each."""
+    monkeypatch.setattr(runtime.settings, 'worker_pool', 'asyncio')
+    monkeypatch.setattr(runtime, '_loop', None)
+    monkeypatch.setattr(runtime, '_loop_pid', None)
+    monkeypatch.setattr(runtime, '_loop_thread', None)
+    monkeypatch.setattr(runtime, 'TASK_TIME_LIMIT', 0.3)
+
+    def task_body():
+        runtime._on_task_prerun()
+        try:
+            run_async(asyncio.sleep(0.2))
+            run_async(asyncio.sleep(0.2))
+        finally:
+            runtime._on_task_postrun()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with pytest.raises(TimeoutError):
+            pool.submit(task_body).result()
+
+    loop = runtime._loop
+    loop.call_soon_threadsafe(loop.stop)
+    runtime._loop_thread.join(timeout=1)
+    loop.close()
+
+
+def test_identical_generation_reuses_stored_result(monkeypatch):
+    """A dedup hit copies the stored object instead of calling OpenAI."""
+    supabase = MagicMock()
+    supabase.table.return_value.update.return_value.eq.return_value.in_.return_value.execute.return_value.data = [
+        {'id': 'sess-1'}
+    ]
+    bucket = supabase.storage.from_.return_value
+    bucket.create_signed_url.return_value = {'signedURL': 'https://signed'}
+
+    class StubResultCache:
+        async def acquire(self, key: str) -> DedupClaim:
+            return DedupClaim(key, 'hit', cached_path='generated/user-9/sess-9.jpg')
+
+        async def release(self, _claim: DedupClaim) -> None:
+            pass
+
+    async def fake_download_all(_urls: list[str]) -> list[tuple[str, bytes]]:
+        return [('model.jpg', b'person')]
+
+    async def fail_generate(**_kwargs):
+        raise AssertionError('OpenAI must not be called for a dedup hit')
+
+    monkeypatch.setattr(tasks, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(session_store, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(tasks, 'get_result_cache', lambda: StubResultCache())
+    monkeypatch.setattr(tasks, 'download_and_resize_all', fake_download_all)
+    monkeypatch.setattr(tasks, 'generate_tryon', fail_generate)
+    monkeypatch.setattr(tasks, 'get_circuit_breaker', lambda: None)
+
+    completed_before = GENERATION_OUTCOMES.labels(outcome='completed')._value.get()
+
+    tasks.process_generation.run(SAMPLE_TASK)
+
+    bucket.copy.assert_called_once_with('generated/user-9/sess-9.jpg', 'generated/user-1/sess-1.jpg')
+    bucket.upload.assert_not_called()
+    rpc_name, params = supabase.rpc.call_args[0]
+    assert rpc_name == 'finalize_generation_session'
+    assert params['p_status'] == 'completed'
+    assert params['p_fields']['estimated_cost_usd'] == 0.0
+    assert params['p_refund_owner_id'] is None
+    assert GENERATION_OUTCOMES.labels(outcome='completed')._value.get() == completed_before + 1
+    assert GENERATION_IN_FLIGHT._value.get() == 0
+
+
+def test_open_circuit_defers_task_without_claiming(monkeypatch):
+    """While the breaker is open the task goes back to the broker; the session is untouched."""
+    supabase = MagicMock()
+    deferred: list[dict] = []
+
+    class OpenBreaker:
+        async def blocked_for(self) -> float:
+            return 12.0
+
+    monkeypatch.setattr(tasks, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(session_store, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(tasks, 'get_circuit_breaker', lambda: OpenBreaker())
+    monkeypatch.setattr(
+        tasks.process_generation, 'apply_async', lambda args, countdown: deferred.append({'countdown': countdown})
+    )
+
+    deferred_before = GENERATION_OUTCOMES.labels(outcome='deferred')._value.get()
+
+    fresh_task = {**SAMPLE_TASK, 'created_at': datetime.now(UTC).isoformat()}
+    assert tasks.process_generation.run(fresh_task) == tasks.DEFERRED
+
+    assert len(deferred) == 1
+    assert 12.0 <= deferred[0]['countdown'] <= 15.0
+    supabase.table.assert_not_called()
+    supabase.rpc.assert_not_called()
+    assert GENERATION_OUTCOMES.labels(outcome='deferred')._value.get() == deferred_before + 1
+
+
+def test_task_past_defer_limit_is_failed_and_refunded(monkeypatch):
+    """An old task is not bounced between queued and deferred forever."""
+    supabase = MagicMock()
+    supabase.table.return_value.update.return_value.eq.return_value.in_.return_value.execute.return_value.data = [
+        {'id': 'sess-1'}
+    ]
+
+    class OpenBreaker:
+        async def blocked_for(self) -> float:
+            return 12.0
+
+    async def fake_download_all(_urls: list[str]) -> list[tuple[str, bytes]]:
+        return [('model.jpg', b'person')]
+
+    async def open_generate(**_kwargs):
+        raise CircuitOpenError('OpenAI circuit breaker is open', 12.0)
+
+    def no_defer(*_args, **_kwargs):
+        raise AssertionError('a task past the defer limit must not be re-enqueued')
+
+    monkeypatch.setattr(tasks, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(session_store, 'get_supabase', lambda: supabase)
+    monkeypatch.setattr(tasks, 'get_result_cache', lambda: None)
+    monkeypatch.setattr(tasks, 'get_circuit_breaker', lambda: OpenBreaker())
+    monkeypatch.setattr(tasks, 'download_and_resize_all', fake_download_all)
+    monkeypatch.setattr(tasks, 'generate_tryon', open_generate)
+    monkeypatch.setattr(tasks.process_generation, 'apply_async', no_defer)
+
+    # SAMPLE_TASK was created long before OPENAI_BREAKER_MAX_DEFER_SECONDS ago
+    assert tasks.process_generation.run(SAMPLE_TASK) is None
+
+    rpc_name, params = supabase.rpc.call_args[0]
+    assert rpc_name == 'finalize_generation_session'
+    assert params['p_status'] == 'failed'
+    assert params['p_refund_owner_id'] == 'user-1'
+
+
+def test_retried_or_deferred_task_restarts_its_lease(monkeypatch):
+    """A task going back to the broker keeps its in-flight slot for the next attempt."""
+    calls: list[str] = []
+    monkeypatch.setattr(tasks, 'extend_lease', lambda _data: calls.append('extend'))
+    monkeypatch.setattr(tasks, 'release_lease', lambda _data: calls.append('release'))
+
+    tasks._release_scheduler_lease(args=(SAMPLE_TASK,), state='RETRY')
+    tasks._release_scheduler_lease(args=(SAMPLE_TASK,), state='SUCCESS', retval=tasks.DEFERRED)
+    tasks._release_scheduler_lease(args=(SAMPLE_TASK,), state='SUCCESS', retval=None)
+
+    assert calls == ['extend', 'extend', 'release']
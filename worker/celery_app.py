@@ -13,16 +13,27 @@ celery_app = Celery(
 # Configure SSL if using rediss:// (Upstash TLS)
 _broker_ssl = {'ssl_cert_reqs': ssl.CERT_REQUIRED} if settings.redis_url.startswith('rediss://') else None
 
+TASK_TIME_LIMIT = 300
+
+# asyncio mode: pool threads only carry acks and retries; the work runs on one shared event loop
+_asyncio_pool = settings.worker_pool == 'asyncio'
+
 celery_app.conf.update(
     task_acks_late=True,
     task_reject_on_worker_lost=True,
-    task_time_limit=300,
-    worker_concurrency=settings.worker_concurrency,
+    task_time_limit=TASK_TIME_LIMIT,
+    worker_pool='threads' if _asyncio_pool else 'prefork',
+    worker_concurrency=settings.worker_max_inflight if _asyncio_pool else settings.worker_concurrency,
     worker_prefetch_multiplier=1,
-    # Global OpenAI rate limit: 300 req/min
-    task_default_rate_limit='300/m',
+    # OpenAI rate limiting is cluster-wide in services/rate_limiter.py, not per worker
     # No result backend — results go to Supabase
     result_backend=None,
     # TLS for Upstash Redis
     broker_use_ssl=_broker_ssl,
+    # Same limits as the shared pools in services/redis_client.py
+    broker_pool_limit=settings.redis_max_connections,
+    broker_transport_options={
+        'socket_keepalive': True,
+        'health_check_interval': settings.redis_health_check_interval_seconds,
+    },
 )
@@ -1,11 +1,22 @@
 import json
-import os
 import time
+from collections import Counter
 
 import redis
 import structlog
 
+from config.settings import settings
 from models.task_payload import GenerationTask
+from services.metrics import CONSUMER_BATCH_SIZE, CONSUMER_DISPATCH_SECONDS, CONSUMER_TASKS, QUEUE_DEPTH
+from services.redis_client import get_sync_redis
+from worker.celery_app import celery_app
+from worker.scheduler import (
+    acquire_leases,
+    create_scheduler,
+    parse_inflight,
+    read_inflight,
+    release_leases,
+)
 from worker.tasks import process_generation
 
 logger = structlog.get_logger()
@@ -15,49 +26,134 @@ BRPOP_TIMEOUT = 5  # seconds
 
 
 def get_redis_consumer() -> redis.Redis:
-    url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    return redis.from_url(url, decode_responses=True)
+    return get_sync_redis()
+
+
+def pop_batch(r: redis.Redis, batch_size: int, block: bool = True) -> tuple[list[str], Counter[str]]:
+    """Pop up to batch_size payloads and read the per-tenant in-flight counts in one round trip.
+
+    When blocking, BRPOP and RPOP are sent as one non-transactional pipeline, so
+    Redis runs the RPOP as soon as BRPOP returns without another network hop.
+    Otherwise a plain RPOP takes whatever is there (batch_size 0 pops nothing).
+    LLEN reports the remaining queue depth, and the in-flight leases are read
+    last so they reflect every task that finished while BRPOP was blocked.
+    """
+    pipe = r.pipeline(transaction=False)
+    if block:
+        pipe.brpop(QUEUE_KEY, timeout=BRPOP_TIMEOUT)
+        if batch_size > 1:
+            pipe.rpop(QUEUE_KEY, batch_size - 1)
+    elif batch_size > 0:
+        pipe.rpop(QUEUE_KEY, batch_size)
+    pipe.llen(QUEUE_KEY)
+    read_inflight(pipe)
+    results = pipe.execute()
+    QUEUE_DEPTH.set(results[-3])
+    inflight = parse_inflight(results[-1])
+
+    payloads: list[str] = []
+    if block:
+        if results[0] is not None:
+            payloads.append(results[0][1])
+            if batch_size > 1 and results[1]:
+                payloads.extend(results[1])
+    elif batch_size > 0 and results[0]:
+        payloads.extend(results[0])
+    return payloads, inflight
+
+
+def validate_batch(raw_payloads: list[str]) -> list[GenerationTask]:
+    """Parse and validate a batch of raw queue payloads, logging and dropping bad ones."""
+    tasks: list[GenerationTask] = []
+    for raw_payload in raw_payloads:
+        try:
+            data = json.loads(raw_payload)
+        except json.JSONDecodeError:
+            logger.error('invalid_json', payload=raw_payload[:200])
+            CONSUMER_TASKS.labels(outcome='invalid_json').inc()
+            continue
+
+        try:
+            task = GenerationTask(**data)
+        except Exception as exc:
+            request_id = data.get('request_id', 'unknown') if isinstance(data, dict) else 'unknown'
+            logger.error('invalid_task_payload', request_id=request_id, error=str(exc))
+            CONSUMER_TASKS.labels(outcome='invalid_payload').inc()
+            continue
+
+        logger.info(
+            'task_received',
+            request_id=task.request_id,
+            session_id=task.session_id,
+            channel=task.channel,
+        )
+        tasks.append(task)
+    return tasks
+
+
+def dispatch_batch(r: redis.Redis, tasks: list[GenerationTask]) -> None:
+    """Publish a batch to Celery over a single broker connection.
+
+    Each task takes an in-flight lease first, so a task that finishes quickly
+    cannot release its slot before it was counted. If publishing fails
+    part-way, the undispatched tasks drop their leases and are pushed back to
+    the consumer end of the queue so they are picked up next.
+    """
+    start = time.perf_counter()
+    dispatched = 0
+    acquire_leases(r, tasks, settings.scheduler_lease_seconds)
+    try:
+        with celery_app.producer_or_acquire() as producer:
+            for task in tasks:
+                process_generation.apply_async((task.model_dump(),), producer=producer)
+                dispatched += 1
+    except Exception:
+        release_leases(r, tasks[dispatched:])
+        remaining = [task.model_dump_json() for task in tasks[dispatched:]]
+        if remaining:
+            # RPUSH oldest last so it is the next one popped
+            r.rpush(QUEUE_KEY, *reversed(remaining))
+            logger.warn('consumer_batch_requeued', count=len(remaining))
+        raise
+    finally:
+        CONSUMER_TASKS.labels(outcome='dispatched').inc(dispatched)
+        CONSUMER_DISPATCH_SECONDS.observe(time.perf_counter() - start)
 
 
 def run_consumer() -> None:
-    """Blocking Redis BRPOP consumer loop.
+    """Blocking Redis consumer loop.
 
-    Reads tasks from the same queue that the Next.js API pushes to via LPUSH.
-    Validates with Pydantic, then dispatches to the Celery task.
+    Reads tasks from the same queue that the Next.js API pushes to via LPUSH,
+    draining up to CONSUMER_BATCH_SIZE payloads per round trip. Valid tasks go
+    into per-tenant sub-queues, and the fair scheduler hands Celery only as many
+    as the in-flight caps allow, so one tenant's backlog waits here instead of
+    in front of everyone else in the broker.
     """
     r = get_redis_consumer()
-    logger.info('consumer_started', queue=QUEUE_KEY)
+    batch_size = max(1, settings.consumer_batch_size)
+    max_buffered = max(1, settings.scheduler_max_buffered)
+    scheduler = create_scheduler()
+    # Leases are shared with other instances and tasks still in the broker, so they are
+    # never cleared here; ones left by a previous run lapse after SCHEDULER_LEASE_SECONDS
+    logger.info('consumer_started', queue=QUEUE_KEY, batch_size=batch_size, max_inflight=scheduler.max_inflight)
 
     while True:
         try:
-            result = r.brpop(QUEUE_KEY, timeout=BRPOP_TIMEOUT)
-            if result is None:
-                continue
-
-            _, raw_payload = result
-
-            try:
-                data = json.loads(raw_payload)
-            except json.JSONDecodeError:
-                logger.error('invalid_json', payload=raw_payload[:200])
-                continue
-
-            try:
-                task = GenerationTask(**data)
-            except Exception as exc:
-                request_id = data.get('request_id', 'unknown')
-                logger.error('invalid_task_payload', request_id=request_id, error=str(exc))
-                continue
-
-            logger.info(
-                'task_received',
-                request_id=task.request_id,
-                session_id=task.session_id,
-                channel=task.channel,
-            )
-
-            # Dispatch to Celery for processing with retries and rate limiting
-            process_generation.delay(task.model_dump())
+            # Block only when nothing is buffered; otherwise keep polling for freed slots
+            room = min(batch_size, max_buffered - scheduler.buffered)
+            raw_payloads, inflight = pop_batch(r, room, block=scheduler.buffered == 0)
+            if raw_payloads:
+                CONSUMER_BATCH_SIZE.observe(len(raw_payloads))
+                for task in validate_batch(raw_payloads):
+                    scheduler.add(task)
+
+            tasks = scheduler.select(inflight)
+            if tasks:
+                # Dispatch to Celery for processing with retries
+                dispatch_batch(r, tasks)
+            elif scheduler.buffered:
+                # Every buffered tenant is at its cap (or the global cap is reached)
+                time.sleep(settings.scheduler_poll_interval_seconds)
 
         except KeyboardInterrupt:
             logger.info('consumer_shutdown')
@@ -0,0 +1,172 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable, Coroutine
+from typing import Any, TypeVar
+
+import structlog
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from prometheus_client import multiprocess
+
+from config.settings import settings
+from worker.celery_app import TASK_TIME_LIMIT
+
+logger = structlog.get_logger()
+
+T = TypeVar('T')
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_pid: int | None = None
+_loop_thread: threading.Thread | None = None
+_loop_lock = threading.Lock()
+# Monotonic deadline of the task running on this thread, shared by all its run_async calls
+_task = threading.local()
+
+Hook = Callable[[], Awaitable[None]]
+_startup_hooks: list[Hook] = []
+_shutdown_hooks: list[Hook] = []
+
+
+def uses_loop_thread() -> bool:
+    """True in asyncio mode, where Celery pool threads share one loop running in its own thread."""
+    return settings.worker_pool == 'asyncio'
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the long-lived event loop for this worker process.
+
+    Prefork children inherit module globals from the parent, so the loop is
+    keyed by PID and rebuilt on first use after a fork. In asyncio mode the
+    loop runs forever in a dedicated thread so every in-flight task shares it.
+    """
+    global _loop, _loop_pid, _loop_thread
+    pid = os.getpid()
+    with _loop_lock:
+        if _loop is None or _loop.is_closed() or _loop_pid != pid:
+            _loop = asyncio.new_event_loop()
+            _loop_pid = pid
+            _loop_thread = None
+            logger.info('event_loop_created', pid=pid)
+        if uses_loop_thread() and _loop_thread is None:
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='event-loop', daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion on the process-wide loop.
+
+    In asyncio mode the calling pool thread only waits on the result while the
+    coroutine is scheduled on the shared loop alongside the other in-flight tasks.
+    The thread pool cannot enforce Celery's hard time limit, so the wait is
+    bounded here by what is left of the current task's limit, and the
+    coroutine cancelled on expiry.
+    """
+    loop = get_event_loop()
+    if _loop_thread is not None and threading.current_thread() is not _loop_thread:
+        deadline = getattr(_task, 'deadline', None)
+        timeout = TASK_TIME_LIMIT if deadline is None else deadline - time.monotonic()
+        if timeout <= 0:
+            coro.close()
+            raise concurrent.futures.TimeoutError()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+    return loop.run_until_complete(coro)
+
+
+def on_startup(hook: Hook) -> Hook:
+    """Register a coroutine function to run on the loop when a worker process starts."""
+    _startup_hooks.append(hook)
+    return hook
+
+
+def on_shutdown(hook: Hook) -> Hook:
+    """Register a coroutine function to run on the loop before it is closed."""
+    _shutdown_hooks.append(hook)
+    return hook
+
+
+async def _run_hooks(hooks: list[Hook], event: str) -> None:
+    for hook in hooks:
+        try:
+            await hook()
+        except Exception:
+            logger.exception(event, hook=getattr(hook, '__name__', repr(hook)))
+
+
+def close_event_loop() -> None:
+    global _loop, _loop_pid, _loop_thread
+    if _loop is None or _loop_pid != os.getpid():
+        return
+    if not _loop.is_closed():
+        run_async(_run_hooks(_shutdown_hooks, 'shutdown_hook_error'))
+        run_async(_loop.shutdown_asyncgens())
+        if _loop_thread is not None:
+            _loop.call_soon_threadsafe(_loop.stop)
+            _loop_thread.join(timeout=10)
+        _loop.close()
+    _loop = None
+    _loop_pid = None
+    _loop_thread = None
+
+
+def _start_worker_runtime() -> None:
+    run_async(_run_hooks(_startup_hooks, 'startup_hook_error'))
+
+
+def _stop_worker_runtime() -> None:
+    try:
+        close_event_loop()
+    except Exception:
+        logger.exception('event_loop_close_error')
+
+
+# Prefork runs tasks in child processes; asyncio mode runs them in the main worker process
+@worker_process_init.connect
+def _on_worker_process_init(**_kwargs: Any) -> None:
+    if not uses_loop_thread():
+        _start_worker_runtime()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**_kwargs: Any) -> None:
+    if not uses_loop_thread():
+        _stop_worker_runtime()
+    # Drop this child's live gauges from the aggregated /metrics
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@task_prerun.connect
+def _on_task_prerun(**_kwargs: Any) -> None:
+    _task.deadline = time.monotonic() + TASK_TIME_LIMIT
+
+
+@task_postrun.connect
+def _on_task_postrun(**_kwargs: Any) -> None:
+    _task.deadline = None
+
+
+@worker_init.connect
+def _on_worker_init(**_kwargs: Any) -> None:
+    if uses_loop_thread():
+        _start_worker_runtime()
+
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**_kwargs: Any) -> None:
+    if uses_loop_thread():
+        _stop_worker_runtime()
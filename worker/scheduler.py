@@ -0,0 +1,173 @@
+import time
+from collections import Counter, OrderedDict, deque
+
+import redis
+import structlog
+
+from config.settings import settings
+from models.task_payload import GenerationTask
+from services.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT_SECONDS
+from services.redis_client import get_sync_redis
+
+logger = structlog.get_logger()
+
+# Dispatched-but-unfinished tasks: member '<tenant>|<session_id>', score = lease expiry
+INFLIGHT_KEY = 'wearon:tasks:inflight'
+
+CHANNELS = ('b2c', 'b2b')
+
+
+def tenant_key(channel: str, owner_id: str | None) -> str:
+    return f'{channel}:{owner_id}'
+
+
+def task_tenant(task: GenerationTask) -> str:
+    return tenant_key(task.channel, task.store_id if task.channel == 'b2b' else task.user_id)
+
+
+def tenant_label(task: GenerationTask) -> str:
+    # Stores are a bounded set; shopper ids are not, so b2c shares one series
+    return str(task.store_id) if task.channel == 'b2b' else 'all'
+
+
+def lease_member(task_data: dict) -> str:
+    owner_id = task_data.get('store_id') if task_data.get('channel') == 'b2b' else task_data.get('user_id')
+    return f'{tenant_key(str(task_data.get("channel")), owner_id)}|{task_data.get("session_id")}'
+
+
+def acquire_leases(r: redis.Redis, tasks: list[GenerationTask], lease_seconds: float) -> None:
+    expires_at = time.time() + lease_seconds
+    r.zadd(INFLIGHT_KEY, {lease_member(task.model_dump()): expires_at for task in tasks})
+
+
+def release_leases(r: redis.Redis, tasks: list[GenerationTask]) -> None:
+    if tasks:
+        r.zrem(INFLIGHT_KEY, *(lease_member(task.model_dump()) for task in tasks))
+
+
+def release_lease(task_data: dict) -> None:
+    """Free a finished task's in-flight slot; an expired lease frees it anyway."""
+    try:
+        get_sync_redis().zrem(INFLIGHT_KEY, lease_member(task_data))
+    except Exception as exc:
+        logger.warn('scheduler_lease_release_failed', error=str(exc))
+
+
+def extend_lease(task_data: dict) -> None:
+    """Restart a retried or deferred task's lease from now, if it still holds one."""
+    try:
+        get_sync_redis().zadd(
+            INFLIGHT_KEY, {lease_member(task_data): time.time() + settings.scheduler_lease_seconds}, xx=True,
+        )
+    except Exception as exc:
+        logger.warn('scheduler_lease_extend_failed', error=str(exc))
+
+
+def read_inflight(pipe: redis.client.Pipeline) -> None:
+    """Queue the commands that drop expired leases and list the rest; see parse_inflight."""
+    pipe.zremrangebyscore(INFLIGHT_KEY, '-inf', time.time())
+    pipe.zrange(INFLIGHT_KEY, 0, -1)
+
+
+def parse_inflight(members: list[str]) -> Counter[str]:
+    """In-flight task count per tenant across every worker."""
+    return Counter(member.rpartition('|')[0] for member in members)
+
+
+class FairScheduler:
+    """Per-channel, per-tenant sub-queues served by deficit round-robin.
+
+    Channels take turns in proportion to their weight; inside a channel tenants
+    are served round-robin, skipping any tenant at its in-flight cap. A store's
+    bulk job therefore only delays a shopper by one turn, however long its
+    backlog. Deficits carry over between calls, so the weights hold even when
+    only a slot or two frees up at a time. Tenant caps are held below
+    max_inflight, so no single tenant can take every slot.
+    """
+
+    def __init__(self, weights: dict[str, int], tenant_caps: dict[str, int], max_inflight: int) -> None:
+        self.weights = {channel: max(1, weights.get(channel, 1)) for channel in CHANNELS}
+        self.max_inflight = max(1, max_inflight)
+        tenant_limit = max(1, self.max_inflight - 1)
+        self.tenant_caps = {channel: min(tenant_limit, max(1, tenant_caps.get(channel, 1))) for channel in CHANNELS}
+        self._queues: dict[str, OrderedDict[str, deque[tuple[float, GenerationTask]]]] = {
+            channel: OrderedDict() for channel in CHANNELS
+        }
+        self._deficits = dict.fromkeys(CHANNELS, 0)
+        self._turn = 0
+        self._depths: Counter[tuple[str, str]] = Counter()
+        self.buffered = 0
+
+    def add(self, task: GenerationTask) -> None:
+        tenants = self._queues[task.channel]
+        tenants.setdefault(task_tenant(task), deque()).append((time.monotonic(), task))
+        self.buffered += 1
+        self._set_depth(task, 1)
+
+    def _set_depth(self, task: GenerationTask, delta: int) -> None:
+        labels = (task.channel, tenant_label(task))
+        self._depths[labels] += delta
+        SCHEDULER_QUEUE_DEPTH.labels(channel=labels[0], tenant=labels[1]).set(self._depths[labels])
+
+    def _pop_tenant(self, channel: str, inflight: Counter[str]) -> GenerationTask | None:
+        """Next task from the first tenant under its cap, which then moves to the back."""
+        tenants = self._queues[channel]
+        cap = self.tenant_caps[channel]
+        for tenant, queue in tenants.items():
+            if inflight[tenant] >= cap:
+                continue
+            enqueued_at, task = queue.popleft()
+            if queue:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            inflight[tenant] += 1
+            self.buffered -= 1
+            self._set_depth(task, -1)
+            SCHEDULER_WAIT_SECONDS.labels(channel=channel, tenant=tenant_label(task)).observe(
+                time.monotonic() - enqueued_at
+            )
+            return task
+        return None
+
+    def select(self, inflight: Counter[str]) -> list[GenerationTask]:
+        """Tasks to dispatch now, given the current in-flight count per tenant."""
+        inflight = Counter(inflight)
+        budget = self.max_inflight - sum(inflight.values())
+        selected: list[GenerationTask] = []
+        idle_turns = 0
+        while budget > 0 and idle_turns < len(CHANNELS):
+            channel = CHANNELS[self._turn]
+            if self._deficits[channel] < 1:
+                self._deficits[channel] += self.weights[channel]
+            served = 0
+            while budget > 0 and self._deficits[channel] >= 1:
+                task = self._pop_tenant(channel, inflight)
+                if task is None:
+                    # Nothing eligible: an idle channel does not bank credit
+                    self._deficits[channel] = 0
+                    break
+                selected.append(task)
+                self._deficits[channel] -= 1
+                budget -= 1
+                served += 1
+            idle_turns = 0 if served else idle_turns + 1
+            if self._deficits[channel] < 1:
+                self._turn = (self._turn + 1) % len(CHANNELS)
+        return selected
+
+
+def worker_capacity() -> int:
+    return settings.worker_max_inflight if settings.worker_pool == 'asyncio' else settings.worker_concurrency
+
+
+def create_scheduler() -> FairScheduler:
+    return FairScheduler(
+        weights={'b2c': settings.scheduler_b2c_weight, 'b2b': settings.scheduler_b2b_weight},
+        tenant_caps={
+            'b2c': settings.scheduler_b2c_tenant_max_inflight,
+            'b2b': settings.scheduler_b2b_tenant_max_inflight,
+        },
+        # Leases are counted across the cluster; with several instances set the cap to their total capacity
+        max_inflight=settings.scheduler_max_inflight or worker_capacity(),
+    )
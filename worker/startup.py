@@ -1,49 +1,120 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
 import structlog
 
+from config.settings import settings
+from services.metrics import CLEANUP_CREDITS_REFUNDED, CLEANUP_IN_PROGRESS, CLEANUP_SESSIONS
+from services.session_store import CLAIMABLE_STATUSES, track_supabase_call
 from services.supabase_client import get_supabase
 
 logger = structlog.get_logger()
 
+CLEANUP_ERROR_MESSAGE = 'Worker restarted — job did not complete'
 
-def cleanup_stuck_sessions() -> None:
-    """Clean up sessions stuck in 'processing' or 'queued' status from previous runs.
+_CLEANUP_TABLES = [
+    ('generation_sessions', 'user_id'),
+    ('store_generation_sessions', 'store_id'),
+]
 
-    Refunds credits and marks sessions as failed. Runs once on worker startup.
-    """
-    supabase = get_supabase()
 
-    for table, id_field in [
-        ('generation_sessions', 'user_id'),
-        ('store_generation_sessions', 'store_id'),
-    ]:
+def _refund_owners(table: str, id_field: str, owner_counts: Counter[str], request_id: str) -> None:
+    """One refund RPC per owner covering all of that owner's sessions in the page."""
+    supabase = get_supabase()
+    for owner_id, count in owner_counts.items():
+        if id_field == 'store_id':
+            rpc, params = 'refund_store_credits', {
+                'p_store_id': owner_id, 'p_amount': count, 'p_request_id': f'{request_id}:{owner_id}',
+            }
+        else:
+            rpc, params = 'refund_credits', {'p_user_id': owner_id, 'p_amount': count}
         try:
-            result = (
+            with track_supabase_call('cleanup_refund'):
+                supabase.rpc(rpc, params).execute()
+            CLEANUP_CREDITS_REFUNDED.labels(table=table).inc(count)
+        except Exception:
+            logger.exception('cleanup_refund_error', table=table, owner_id=owner_id, amount=count)
+
+
+def _cleanup_table(table: str, id_field: str, cutoff: datetime, page_size: int) -> int:
+    """Fail and refund one table's stuck sessions a page at a time; returns sessions cleaned."""
+    supabase = get_supabase()
+    cutoff_iso = cutoff.isoformat()
+    last_id: str | None = None
+    cleaned = 0
+    page = 0
+
+    while True:
+        query = (
+            supabase.table(table)
+            .select('id')
+            .in_('status', CLAIMABLE_STATUSES)
+            .lt('created_at', cutoff_iso)
+        )
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        with track_supabase_call('cleanup_select'):
+            rows = query.order('id').limit(page_size).execute().data or []
+        if not rows:
+            return cleaned
+
+        ids = [row['id'] for row in rows]
+        last_id = ids[-1]
+        page += 1
+
+        # Bulk update; the status filter makes it a no-op for rows that changed since the select
+        with track_supabase_call('cleanup_update'):
+            updated = (
                 supabase.table(table)
-                .select('id, ' + id_field)
-                .in_('status', ['queued', 'processing'])
+                .update({'status': 'failed', 'error_message': CLEANUP_ERROR_MESSAGE})
+                .in_('id', ids)
+                .in_('status', CLAIMABLE_STATUSES)
                 .execute()
+                .data
+                or []
             )
-            stuck = result.data or []
 
-            if not stuck:
-                continue
+        # Refund only the rows this update actually failed
+        owner_counts = Counter(row[id_field] for row in updated if row.get(id_field))
+        _refund_owners(table, id_field, owner_counts, f'startup-cleanup:{cutoff_iso}:{table}:{page}')
 
-            logger.info('cleanup_stuck_sessions', table=table, count=len(stuck))
+        cleaned += len(updated)
+        CLEANUP_SESSIONS.labels(table=table).inc(len(updated))
+        logger.info('cleanup_page_done', table=table, page=page, cleaned=len(updated), total=cleaned)
 
-            for session in stuck:
-                session_id = session['id']
+        if len(rows) < page_size:
+            return cleaned
 
-                # Mark session as failed
-                supabase.table(table).update(
-                    {'status': 'failed', 'error_message': 'Worker restarted — job did not complete'}
-                ).eq('id', session_id).execute()
 
-                # Refund credit
-                owner_id = session.get(id_field)
-                if owner_id:
-                    supabase.rpc('refund_credits', {'p_' + id_field: owner_id, 'p_amount': 1}).execute()
+def cleanup_stuck_sessions(cutoff: datetime) -> None:
+    """Clean up sessions stuck in 'processing' or 'queued' status from previous runs.
+
+    Only sessions created before the cutoff (worker start) are touched. Tasks
+    never claim those (see claim_session), so this can run while Celery is
+    already processing. Sessions are
+    marked failed with paginated bulk updates and refunded with one RPC per
+    owner per page.
+    """
+    page_size = max(1, settings.startup_cleanup_page_size)
+    CLEANUP_IN_PROGRESS.set(1)
+    start = time.perf_counter()
+    try:
+        for table, id_field in _CLEANUP_TABLES:
+            try:
+                cleaned = _cleanup_table(table, id_field, cutoff, page_size)
+                if cleaned:
+                    logger.info('cleanup_stuck_sessions', table=table, count=cleaned)
+            except Exception:
+                logger.exception('cleanup_error', table=table)
+    finally:
+        CLEANUP_IN_PROGRESS.set(0)
+        logger.info('cleanup_finished', duration_s=round(time.perf_counter() - start, 2))
 
-                logger.info('session_cleaned', session_id=session_id, table=table)
 
-        except Exception:
-            logger.exception('cleanup_error', table=table)
+def start_cleanup_thread(cutoff: datetime) -> threading.Thread:
+    """Run the stuck-session cleanup in a daemon thread alongside the consumer."""
+    t = threading.Thread(target=cleanup_stuck_sessions, args=(cutoff,), daemon=True, name='startup-cleanup')
+    t.start()
+    return t
@@ -1,39 +1,141 @@
-import asyncio
+import io
+import random
+import resource
 import time
+from datetime import UTC, datetime
+from typing import Any
 
 import structlog
+from celery.signals import task_postrun
 
+from config.settings import settings
 from models.task_payload import GenerationTask
-from services.image_processor import download_and_resize
-from services.openai_client import GenerationResult, OpenAIImageError, generate_tryon
+from services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from services.image_executor import shutdown_image_executor
+from services.image_processor import ImagePreparationError, download_and_resize_all
+from services.metrics import (
+    GENERATION_IN_FLIGHT,
+    GENERATION_OUTCOMES,
+    GENERATION_PEAK_BUFFER_BYTES,
+    GENERATION_STAGE_SECONDS,
+    track_stage,
+)
+from services.openai_client import (
+    DEFAULT_QUALITY,
+    DEFAULT_SIZE,
+    GenerationResult,
+    OpenAIImageError,
+    close_http_client,
+    generate_tryon,
+    resolve_prompt,
+    warm_up_http_client,
+)
+from services.redis_client import close_async_redis
+from services.renditions import copy_renditions, store_renditions
+from services.result_cache import DedupClaim, get_result_cache, result_cache_key
+from services.session_store import (
+    claim_session,
+    finalize_session,
+    get_owner_id,
+    get_session_table,
+    track_supabase_call,
+)
 from services.supabase_client import get_supabase
 from worker.celery_app import celery_app
+from worker.runtime import on_shutdown, on_startup, run_async
+from worker.scheduler import extend_lease, release_lease
 
 logger = structlog.get_logger()
 
+RESULT_BUCKET = 'virtual-tryon-images'
+# Returned by a run that handed its generation to a later one
+DEFERRED = 'deferred'
 
-def _get_session_table(channel: str) -> str:
-    return 'store_generation_sessions' if channel == 'b2b' else 'generation_sessions'
+# Per-process resources: warm the pooled OpenAI connection on start, release pools on exit
+on_startup(warm_up_http_client)
+on_shutdown(close_http_client)
+on_shutdown(shutdown_image_executor)
+on_shutdown(close_async_redis)
 
 
-def _get_credit_id_field(channel: str) -> str:
-    return 'store_id' if channel == 'b2b' else 'user_id'
+def _get_storage_path(task: GenerationTask) -> str:
+    owner_id = get_owner_id(task)
+    if task.channel == 'b2b':
+        return f'stores/{owner_id}/generated/{task.session_id}.jpg'
+    return f'generated/{owner_id}/{task.session_id}.jpg'
 
 
-def _get_owner_id(task: GenerationTask) -> str | None:
-    return task.store_id if task.channel == 'b2b' else task.user_id
+def _copy_cached_result(bucket: Any, source_path: str, storage_path: str, log: structlog.stdlib.BoundLogger) -> bool:
+    """Copy a previously generated result to this session's path; False if the source is gone."""
+    if source_path == storage_path:
+        return True
+    try:
+        with track_supabase_call('copy'):
+            bucket.copy(source_path, storage_path)
+        return True
+    except Exception as exc:
+        log.warn('generation_reuse_copy_failed', source_path=source_path, error=str(exc))
+        return False
+
+
+def _upload_result(
+    bucket: Any, result: GenerationResult, storage_path: str, log: structlog.stdlib.BoundLogger,
+) -> dict[str, dict]:
+    """Upload the generated image, then its renditions; returns the renditions stored."""
+    # Shares the buffer rather than copying it
+    image = result.image.getvalue()
+    with track_stage('upload'), track_supabase_call('upload'):
+        bucket.upload(storage_path, io.BufferedReader(result.image), {'content-type': 'image/jpeg'})
+    renditions = run_async(store_renditions(bucket, image, storage_path, log))
+    result.image.close()
+    return renditions
+
+
+def _defer(task: GenerationTask, delay: float, log: structlog.stdlib.BoundLogger) -> bool:
+    """Re-enqueue the task to run once the circuit breaker may admit it.
+
+    False if the task is past OPENAI_BREAKER_MAX_DEFER_SECONDS since it was
+    created (or its age is unknown) or publishing failed; the caller then
+    carries on and an open breaker fails and refunds it as usual.
+    """
+    created = task.created_datetime()
+    age = (datetime.now(UTC) - created).total_seconds() if created is not None else None
+    if age is None or age >= settings.openai_breaker_max_defer_seconds:
+        log.warn('generation_defer_limit_reached', age_s=round(age, 1) if age is not None else None)
+        return False
+    # Capped at the cooldown, and spread out so deferred tasks do not all return at once
+    countdown = min(max(1.0, delay), settings.openai_breaker_open_seconds) * random.uniform(1.0, 1.25)
+    try:
+        process_generation.apply_async((task.model_dump(),), countdown=countdown)
+    except Exception as exc:
+        log.warn('generation_defer_failed', error=str(exc))
+        return False
+    GENERATION_OUTCOMES.labels(outcome='deferred').inc()
+    log.info('generation_deferred', countdown_s=round(countdown, 1))
+    return True
+
+
+def _observe_queue_wait(task: GenerationTask) -> None:
+    created = task.created_datetime()
+    if created is not None:
+        wait = (datetime.now(UTC) - created).total_seconds()
+        GENERATION_STAGE_SECONDS.labels(stage='queue_wait').observe(max(0.0, wait))
 
 
 @celery_app.task(name='process_generation', bind=True, max_retries=1)
-def process_generation(self, task_data: dict) -> None:  # type: ignore[no-untyped-def]
+@GENERATION_IN_FLIGHT.track_inprogress()
+def process_generation(self, task_data: dict) -> str | None:  # type: ignore[no-untyped-def]
     """Process a virtual try-on generation task.
 
-    1. Update session status to 'processing'
+    1. Claim the session (conditional update to 'processing')
     2. Download and resize images
-    3. Call OpenAI GPT Image 1.5
-    4. Upload result to Supabase Storage
-    5. Update session to 'completed'
-    On failure: refund credits, mark 'failed'
+    3. Reuse an identical completed or in-flight generation if there is one
+    4. Otherwise call OpenAI GPT Image 1.5
+    5. Upload result to Supabase Storage
+    6. Finalize the session as 'completed'
+    On failure: finalize as 'failed' and refund credits in the same call
+    While the OpenAI circuit breaker is open the task is deferred instead: the
+    session stays 'queued', nothing is refunded and DEFERRED is returned
     """
     try:
         task = GenerationTask(**task_data)
@@ -45,7 +147,7 @@ def process_generation(self, task_data: dict) -> None:  # type: ignore[no-untype
         if session_id and channel in ('b2b', 'b2c'):
             try:
                 supabase = get_supabase()
-                table = _get_session_table(channel)
+                table = get_session_table(channel)
                 supabase.table(table).update(
                     {'status': 'failed', 'error_message': 'Invalid task payload'}
                 ).eq('id', session_id).execute()
@@ -59,72 +161,120 @@ def process_generation(self, task_data: dict) -> None:  # type: ignore[no-untype
         channel=task.channel,
     )
     supabase = get_supabase()
-    session_table = _get_session_table(task.channel)
-
-    # Guard: skip if session was already cleaned up (e.g., by startup cleanup)
-    current = supabase.table(session_table).select('status').eq('id', task.session_id).execute()
-    if current.data and current.data[0].get('status') == 'failed':
-        log.info('session_already_failed_skipping')
+    session_table = get_session_table(task.channel)
+
+    # Fail fast while OpenAI is unhealthy rather than tying up a worker on timeouts. This
+    # only peeks at the breaker; generate_tryon takes the actual admission (and any probe)
+    breaker = get_circuit_breaker()
+    if breaker is not None:
+        wait = run_async(breaker.blocked_for())
+        if wait > 0 and _defer(task, wait, log):
+            return DEFERRED
+
+    # 1. Claim: mark as processing unless already failed (e.g. by startup cleanup) or completed
+    if not claim_session(task):
+        log.info('session_not_claimable_skipping')
         return
+    log.info('generation_processing')
+    _observe_queue_wait(task)
 
     try:
-        # 1. Mark as processing
-        supabase.table(session_table).update({'status': 'processing'}).eq(
-            'id', task.session_id
-        ).execute()
-        log.info('generation_processing')
-
-        # 2. Download and resize images
+        # 2. Download and resize all images concurrently
         start_time = time.time()
-        loop = asyncio.new_event_loop()
-        try:
-            image_buffers: list[tuple[str, bytes]] = []
-            for i, url in enumerate(task.image_urls):
-                name = 'model' if i == 0 else f'image_{i}'
-                buf = loop.run_until_complete(download_and_resize(url, name))
-                image_buffers.append((f'{name}.jpg', buf))
-
-            # 3. Call OpenAI
-            result = loop.run_until_complete(
-                generate_tryon(
-                    image_buffers=image_buffers,
-                    prompt=task.prompt,
-                    request_id=task.request_id,
-                )
+        image_buffers = run_async(download_and_resize_all(task.image_urls))
+
+        # 3. Reuse an identical completed generation, or wait for one in flight
+        storage_path = _get_storage_path(task)
+        bucket = supabase.storage.from_(RESULT_BUCKET)
+        result_cache = get_result_cache()
+        claim: DedupClaim | None = None
+        reused = False
+        renditions: dict[str, dict] = {}
+        if result_cache is not None:
+            dedup_key = result_cache_key(
+                image_buffers, resolve_prompt(task.prompt), DEFAULT_QUALITY, DEFAULT_SIZE,
             )
+            claim = run_async(result_cache.acquire(dedup_key))
+            if claim.cached_path:
+                reused = _copy_cached_result(bucket, claim.cached_path, storage_path, log)
+                if not reused:
+                    run_async(result_cache.forget(dedup_key))
+
+        try:
+            if reused and claim is not None:
+                # No OpenAI spend for a reused result
+                result = GenerationResult(estimated_cost_usd=0.0)
+                log.info('generation_reused', dedup=claim.outcome)
+                renditions = run_async(copy_renditions(bucket, claim.cached_path or '', storage_path, log))
+            else:
+                # 4. Call OpenAI
+                with track_stage('openai'):
+                    result = run_async(
+                        generate_tryon(
+                            image_buffers=image_buffers,
+                            prompt=task.prompt,
+                            request_id=task.request_id,
+                            quality=DEFAULT_QUALITY,
+                            size=DEFAULT_SIZE,
+                        )
+                    )
+
+                # 5. Upload result (straight from the decoded buffer) and its renditions
+                renditions = _upload_result(bucket, result, storage_path, log)
+                if result_cache is not None and claim is not None:
+                    run_async(result_cache.store(claim.key, storage_path))
         finally:
-            loop.close()
+            if result_cache is not None and claim is not None:
+                run_async(result_cache.release(claim))
 
         processing_time_ms = int((time.time() - start_time) * 1000)
-
-        # 4. Upload result to Supabase Storage
-        owner_id = _get_owner_id(task)
-        if task.channel == 'b2b':
-            storage_path = f'stores/{owner_id}/generated/{task.session_id}.jpg'
-        else:
-            storage_path = f'generated/{owner_id}/{task.session_id}.jpg'
-
-        supabase.storage.from_('virtual-tryon-images').upload(
-            storage_path,
-            result.image_bytes,
-            {'content-type': 'image/jpeg'},
-        )
+        peak_buffer_bytes = sum(len(buf) for _, buf in image_buffers) + result.peak_buffer_bytes
+        GENERATION_PEAK_BUFFER_BYTES.observe(peak_buffer_bytes)
 
         # Create signed URL (6 hour expiry)
-        signed = supabase.storage.from_('virtual-tryon-images').create_signed_url(storage_path, 21600)
+        with track_stage('signed_url'), track_supabase_call('signed_url'):
+            signed = bucket.create_signed_url(storage_path, 21600)
         signed_url = signed.get('signedURL', '')
 
-        # 5. Mark completed with usage data
-        supabase.table(session_table).update({
-            'status': 'completed',
+        # 6. Mark completed with usage data
+        fields: dict[str, Any] = {
             'generated_image_url': signed_url,
             'input_tokens': result.input_tokens,
             'output_tokens': result.output_tokens,
             'estimated_cost_usd': result.estimated_cost_usd,
             'processing_time_ms': processing_time_ms,
-        }).eq('id', task.session_id).execute()
+        }
+        if renditions:
+            fields['image_renditions'] = renditions
+        finalize_session(task, 'completed', fields, refund=False, log=log)
+
+        GENERATION_OUTCOMES.labels(outcome='completed').inc()
+        log.info(
+            'generation_completed',
+            processing_time_ms=processing_time_ms,
+            peak_buffer_bytes=peak_buffer_bytes,
+            # Lifetime high-water mark of this process, for context next to the per-task figure
+            max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        )
 
-        log.info('generation_completed', processing_time_ms=processing_time_ms)
+    except ImagePreparationError as exc:
+        log.warn('generation_inputs_failed', error=str(exc), failed_images=[name for name, _ in exc.failures])
+
+        finalize_session(task, 'failed', {'error_message': str(exc)}, refund=True, log=log)
+        GENERATION_OUTCOMES.labels(outcome='failed').inc()
+
+    except CircuitOpenError as exc:
+        # The breaker refused or stopped the OpenAI call: hand the session back to the queue, no refund
+        log.warn('generation_circuit_open', error=str(exc))
+        if _defer(task, exc.retry_in, log):
+            supabase.table(session_table).update(
+                {'status': 'queued', 'error_message': 'OpenAI unavailable, retrying...'}
+            ).eq('id', task.session_id).execute()
+            return DEFERRED
+        finalize_session(
+            task, 'failed', {'error_message': 'Image generation is temporarily unavailable'}, refund=True, log=log,
+        )
+        GENERATION_OUTCOMES.labels(outcome='failed').inc()
 
     except OpenAIImageError as exc:
         log.warn('generation_failed', error=str(exc), moderation=exc.is_moderation_error)
@@ -134,33 +284,32 @@ def process_generation(self, task_data: dict) -> None:  # type: ignore[no-untype
             supabase.table(session_table).update(
                 {'status': 'queued', 'error_message': 'Rate limited, retrying...'}
             ).eq('id', task.session_id).execute()
+            GENERATION_OUTCOMES.labels(outcome='rate_limit_retry').inc()
             raise self.retry(countdown=10)
 
         # Final failure — refund and mark failed
-        _refund_credit(task, log)
-
-        supabase.table(session_table).update(
-            {'status': 'failed', 'error_message': str(exc)}
-        ).eq('id', task.session_id).execute()
+        finalize_session(task, 'failed', {'error_message': str(exc)}, refund=True, log=log)
+        GENERATION_OUTCOMES.labels(outcome='moderation' if exc.is_moderation_error else 'failed').inc()
 
     except Exception as exc:
         log.exception('generation_error', error=str(exc))
 
-        _refund_credit(task, log)
-
-        supabase.table(session_table).update(
-            {'status': 'failed', 'error_message': 'Internal error during generation'}
-        ).eq('id', task.session_id).execute()
+        finalize_session(
+            task, 'failed', {'error_message': 'Internal error during generation'}, refund=True, log=log,
+        )
+        GENERATION_OUTCOMES.labels(outcome='failed').inc()
 
 
-def _refund_credit(task: GenerationTask, log: structlog.stdlib.BoundLogger) -> None:
-    """Refund 1 credit to the task owner."""
-    try:
-        supabase = get_supabase()
-        id_field = _get_credit_id_field(task.channel)
-        owner_id = _get_owner_id(task)
-        if owner_id:
-            supabase.rpc('refund_credits', {f'p_{id_field}': owner_id, 'p_amount': 1}).execute()
-            log.info('credit_refunded', owner_id=owner_id)
-    except Exception:
-        log.exception('refund_error')
+@task_postrun.connect(sender=process_generation)
+def _release_scheduler_lease(
+    args: tuple | None = None, state: str | None = None, retval: Any = None, **_kwargs: Any,
+) -> None:
+    if not args or not isinstance(args[0], dict):
+        return
+    # A retry or deferral is still the same generation in flight; it keeps its slot
+    # until it finishes, which also caps how many deferred tasks wait in the broker.
+    # The lease restarts so that it covers the next attempt, however many came before.
+    if state == 'RETRY' or retval == DEFERRED:
+        extend_lease(args[0])
+        return
+    release_lease(args[0])